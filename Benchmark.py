@@ -0,0 +1,260 @@
+"""
+Data description:
+                AMap_adcode.csv, city_alias.csv, minority.csv, shortname_adcode.csv, provincialcounties.csv in input_dir
+Function:
+                分阶段基准测试：在合成POI数据(SyntheticPoi)上依次计时
+                dictionary: 由输入文件构建 placesymbol_code.csv 并编译为 SymbolMatcher
+                extraction: 提取地名符号 (workers=1 时为 ExtractPlaceSymbol.process_csv，否则为 parallel_process_csv)
+                flows:      SymbolicFlow.build_od_matrix 与 write_symbolflows
+                metrics:    calculate_od_metrics_vectorized 与 calculate_network_metrics
+                metrics_loop: 原始的逐行 calculate_od_metrics (较慢，默认不运行)
+                每个阶段在新的子进程中运行，记录输入行数、耗时、每秒行数和该进程的峰值内存(RSS)
+                结果写为 JSON 文件(包含 git commit)，可用 --compare 与另一个提交的结果比较
+
+                python Benchmark.py --sizes 10000 100000 1000000 --workers 1 --compare data/benchmark/old.json
+"""
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import platform
+import argparse
+import subprocess
+import multiprocessing
+import concurrent.futures
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+
+from Instrumentation import peak_rss_bytes
+
+RESULTS_FORMAT = 'symbolflow-benchmark'
+RESULTS_VERSION = 1
+STAGES = ['dictionary', 'extraction', 'flows', 'metrics', 'metrics_loop']
+DEFAULT_STAGES = ['dictionary', 'extraction', 'flows', 'metrics']
+
+
+def count_lines(file_paths: List[str]) -> int:
+    """
+        Number of data lines of csv files with a header line.
+    """
+    lines = 0
+    for file_path in file_paths:
+        with open(file_path, 'rb') as f:
+            lines += sum(chunk.count(b'\n') for chunk in iter(lambda: f.read(1 << 20), b'')) - 1
+    return lines
+
+
+def _stage_dictionary(input_dir: str, workdir: str):
+    from SymbolDict import build_symbol_dict
+    from SymbolMatcher import SymbolMatcher
+
+    df = pd.read_csv(os.path.join(input_dir, 'AMap_adcode.csv'))
+    df_alias = pd.read_csv(os.path.join(input_dir, 'city_alias.csv'))
+    df_shortname_code = pd.read_csv(os.path.join(input_dir, 'shortname_adcode.csv'))
+    minority_names = pd.read_csv(os.path.join(input_dir, 'minority.csv'), header=None).iloc[:, 0].values
+    df_placesymbol_code = build_symbol_dict(df, df_alias, df_shortname_code, minority_names)
+    csv_path = os.path.join(workdir, 'placesymbol_code.csv')
+    df_placesymbol_code.to_csv(csv_path, index=0)
+    SymbolMatcher.from_csv(csv_path).save(os.path.join(workdir, 'placesymbol_code.pkl'), csv_path)
+
+
+def _stage_extraction(workdir: str, poi_dir: str, extract_dir: str, workers: int):
+    from SymbolMatcher import SymbolMatcher
+    from ExtractPlaceSymbol import process_csv, parallel_process_csv
+
+    matcher = SymbolMatcher.load(os.path.join(workdir, 'placesymbol_code.pkl'))
+    file_paths = sorted(glob.glob(os.path.join(poi_dir, '*.csv')))
+    if workers == 1:
+        for file_path in file_paths:
+            process_csv(file_path, matcher, extract_dir, 1000000)
+    else:
+        parallel_process_csv(file_paths, matcher, extract_dir, 1000000, max_workers=workers)
+
+
+def _stage_flows(input_dir: str, workdir: str, extract_dir: str, flow_dir: str):
+    from SymbolicFlow import build_od_matrix
+    from FlowBuilder import write_symbolflows
+    from TableIO import list_tables
+
+    df_provincialcounties = pd.read_csv(os.path.join(input_dir, 'provincialcounties.csv'), header=0)
+    od_matrix = build_od_matrix(list_tables(extract_dir), df_provincialcounties['adcode'])
+    df_cities = pd.read_csv(os.path.join(workdir, 'city_geocode.csv'), header=0)
+    write_symbolflows(od_matrix, df_cities, flow_dir)
+
+
+def _stage_metrics(flow_dir: str):
+    from CitiesAttributes import calculate_od_metrics_vectorized, calculate_network_metrics
+
+    df = pd.read_csv(os.path.join(flow_dir, 'Symbolicflows.csv'))
+    df_metrics = calculate_od_metrics_vectorized(df)
+    df_metrics.merge(calculate_network_metrics(df), on='cityname', how='outer')
+
+
+def _stage_metrics_loop(flow_dir: str):
+    from CitiesAttributes import calculate_od_metrics
+
+    df = pd.read_csv(os.path.join(flow_dir, 'Symbolicflows.csv'))
+    calculate_od_metrics(df.dropna(subset=['Ocity_name', 'Dcity_name', 'O_X', 'O_Y', 'D_X', 'D_Y', 'count']))
+
+
+def _measure(stage: Callable, *args) -> Dict:
+    # Runs in a fresh process, so that the peak RSS belongs to this stage alone
+    baseline_rss = peak_rss_bytes()
+    start = time.perf_counter()
+    stage(*args)
+    seconds = time.perf_counter() - start
+    return {'seconds': seconds, 'baseline_rss_bytes': baseline_rss, 'peak_rss_bytes': peak_rss_bytes(),
+            'children_peak_rss_bytes': peak_rss_bytes(children=True)}
+
+
+def run_stage(stage: Callable, *args) -> Dict:
+    """
+        Time stage(*args) in a new process started with spawn, whatever the platform's default.
+    """
+    context = multiprocessing.get_context('spawn')
+    with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(_measure, stage, *args).result()
+
+
+def _git_commit() -> Dict:
+    # The commit of the code being timed, wherever the benchmark is run from
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=repo_dir, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=repo_dir,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': None, 'dirty': None}
+    return {'commit': commit, 'dirty': dirty}
+
+
+def _mb(n_bytes: Optional[int]) -> Optional[float]:
+    return round(n_bytes / 2**20, 1) if n_bytes is not None else None
+
+
+def run_benchmark(input_dir: str, workdir: str, sizes: List[int], n_files: int = 4, workers: int = 1,
+                  stages: List[str] = None, match_rate: float = 0.3, seed: int = 0) -> Dict:
+    """
+        Generate synthetic POI data of each size (total data lines, split over n_files files) in workdir
+        and time the stages on it. The dictionary stage runs once, the others once per size.
+        Returns the results document: environment, commit, options and one record per stage and size
+        with rows, seconds, rows_per_sec and peak RSS in MB.
+    """
+    from SyntheticPoi import generate_poi_files, synthetic_geocode
+
+    stages = stages or DEFAULT_STAGES
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        raise ValueError(f"Unknown stages {sorted(unknown)}, expected some of {STAGES}")
+    os.makedirs(workdir, exist_ok=True)
+    records = []
+
+    def record(stage, size, rows, measurement):
+        seconds = measurement['seconds']
+        records.append({
+            'stage': stage,
+            'size': size,
+            'rows': rows,
+            'seconds': round(seconds, 4),
+            'rows_per_sec': round(rows / seconds, 1) if seconds > 0 else None,
+            'baseline_rss_mb': _mb(measurement['baseline_rss_bytes']),
+            'peak_rss_mb': _mb(measurement['peak_rss_bytes']),
+            'workers_peak_rss_mb': _mb(measurement['children_peak_rss_bytes']) if stage == 'extraction' and workers > 1 else None,
+        })
+        print(f"{stage:>12} {size or '':>10}: {rows} rows in {seconds:.2f}s "
+              f"({records[-1]['rows_per_sec']} rows/s, peak {records[-1]['peak_rss_mb']} MB)")
+
+    dictionary_path = os.path.join(workdir, 'placesymbol_code.csv')
+    if 'dictionary' in stages or not os.path.exists(dictionary_path):
+        measurement = run_stage(_stage_dictionary, input_dir, workdir)
+        if 'dictionary' in stages:
+            record('dictionary', None, len(pd.read_csv(os.path.join(input_dir, 'AMap_adcode.csv'))), measurement)
+    df_symbols = pd.read_csv(dictionary_path)
+    df_adcode = pd.read_csv(os.path.join(input_dir, 'AMap_adcode.csv'))
+    synthetic_geocode(df_adcode, seed).to_csv(os.path.join(workdir, 'city_geocode.csv'), index=False)
+
+    for size in sizes:
+        size_dir = os.path.join(workdir, f'size_{size}')
+        poi_dir, extract_dir, flow_dir = (os.path.join(size_dir, name) for name in ['poi', 'extract', 'flows'])
+        # The synthetic data of a size is generated once and reused by later runs
+        rows_per_file = -(-size // n_files)
+        if count_lines(glob.glob(os.path.join(poi_dir, '*.csv'))) != rows_per_file * n_files:
+            shutil.rmtree(poi_dir, ignore_errors=True)
+            generate_poi_files(poi_dir, n_files, rows_per_file, df_symbols, df_adcode, match_rate, seed=seed)
+        poi_files = sorted(glob.glob(os.path.join(poi_dir, '*.csv')))
+        if {'extraction', 'flows', 'metrics', 'metrics_loop'} & set(stages):
+            shutil.rmtree(extract_dir, ignore_errors=True)
+            os.makedirs(extract_dir)
+            measurement = run_stage(_stage_extraction, workdir, poi_dir, extract_dir, workers)
+            if 'extraction' in stages:
+                record('extraction', size, count_lines(poi_files), measurement)
+        if {'flows', 'metrics', 'metrics_loop'} & set(stages):
+            os.makedirs(flow_dir, exist_ok=True)
+            measurement = run_stage(_stage_flows, input_dir, workdir, extract_dir, flow_dir)
+            if 'flows' in stages:
+                record('flows', size, count_lines(glob.glob(os.path.join(extract_dir, '*.csv'))), measurement)
+        flow_rows = count_lines([os.path.join(flow_dir, 'Symbolicflows.csv')]) if os.path.isdir(flow_dir) else 0
+        for stage, function in [('metrics', _stage_metrics), ('metrics_loop', _stage_metrics_loop)]:
+            if stage in stages:
+                record(stage, size, flow_rows, run_stage(function, flow_dir))
+
+    return {
+        'format': RESULTS_FORMAT,
+        'version': RESULTS_VERSION,
+        **_git_commit(),
+        'started': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': sys.version.split()[0],
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'options': {'sizes': sizes, 'files': n_files, 'workers': workers, 'match_rate': match_rate, 'seed': seed},
+        'results': records,
+    }
+
+
+def load_results(path: str) -> Dict:
+    with open(path, encoding='utf-8') as f:
+        results = json.load(f)
+    if results.get('format') != RESULTS_FORMAT or results.get('version') != RESULTS_VERSION:
+        raise ValueError(f"{path} is not a version {RESULTS_VERSION} benchmark results file")
+    return results
+
+
+def compare_results(baseline: Dict, current: Dict) -> pd.DataFrame:
+    """
+        Seconds and peak RSS of the stages and sizes run in both results, with the speedup of current over baseline.
+    """
+    columns = ['stage', 'size', 'seconds', 'peak_rss_mb']
+    df = pd.DataFrame(baseline['results'], columns=columns).merge(
+        pd.DataFrame(current['results'], columns=columns), on=['stage', 'size'], suffixes=('_baseline', '_current'))
+    df['size'] = df['size'].astype('Int64')
+    df['speedup'] = df['seconds_baseline'] / df['seconds_current']
+    return df
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time the pipeline stages on synthetic POI data')
+    parser.add_argument('--input-dir', default='data/input')
+    parser.add_argument('--workdir', default='data/benchmark')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000], help='total POI lines')
+    parser.add_argument('--files', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=DEFAULT_STAGES)
+    parser.add_argument('--match-rate', type=float, default=0.3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='results file, default <workdir>/results_<commit>.json')
+    parser.add_argument('--compare', help='results file of another commit to compare with')
+    args = parser.parse_args()
+
+    results = run_benchmark(args.input_dir, args.workdir, args.sizes, args.files, args.workers, args.stages,
+                            args.match_rate, args.seed)
+    output = args.output or os.path.join(args.workdir, f"results_{(results['commit'] or 'unknown')[:10]}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {output}")
+    if args.compare:
+        print(compare_results(load_results(args.compare), results).to_string(index=False))
@@ -1,6 +1,9 @@
-from math import radians, cos, sin, asin, sqrt, atan2, degrees, log2
+from math import radians, cos, sin, asin, sqrt, atan2, degrees, log2, gcd
+from functools import reduce
+import numpy as np
 import pandas as pd
 import os
+import warnings
 def haversine_distance(lon1, lat1, lon2, lat2):
     """
     Calculate the great circle distance between two points 
@@ -157,15 +160,259 @@ def convert_to_dataframe_with_metrics(metrics_out, metrics_in):
     
     return df
 
-# Assuming 'df' is your DataFrame containing the OD flow data
-# Note: This function assumes 'df' is a pandas DataFrame containing the OD flow data.
-data_folder = 'data/output'
-filename = 'Symbolicflows.csv'
-df = pd.read_csv(os.path.join(data_folder, filename))
-# Call the function to calculate metrics and convert to DataFrame
-df_metrics = calculate_od_metrics(df)
+def haversine_distances(lon1, lat1, lon2, lat2):
+    """
+    Vectorized haversine_distance: great circle distances in kilometers between arrays of points.
+    """
+    lon1, lat1, lon2, lat2 = map(np.radians, [lon1, lat1, lon2, lat2])
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+    a = np.sin(dlat/2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon/2)**2
+    c = 2 * np.arcsin(np.sqrt(a))
+    r = 6371 # Radius of earth in kilometers
+    return c * r
+
+def calculate_bearings(lon1, lat1, lon2, lat2):
+    """
+    Vectorized calculate_bearing: compass bearings in degrees (0-360) between arrays of points.
+    """
+    lon1, lat1, lon2, lat2 = map(np.radians, [lon1, lat1, lon2, lat2])
+    dlon = lon2 - lon1
+    x = np.sin(dlon) * np.cos(lat2)
+    y = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(dlon)
+    return (np.degrees(np.arctan2(x, y)) + 360) % 360
+
+def rose_histograms(groups, n_groups, bearings, weights, interval=20):
+    """
+    Weighted bearing histograms of all groups at once, one row per group and one column per interval.
+    The interval of a bearing is int(bearing // interval), as in rose_entropy.
+    """
+    n_bins = -(-360 // interval)
+    bins = np.minimum((bearings // interval).astype(np.int64), n_bins - 1)
+    histograms = np.bincount(groups * n_bins + bins, weights=weights, minlength=n_groups * n_bins)
+    return histograms.reshape(n_groups, n_bins)
+
+def histogram_entropy(histograms):
+    """
+    Rose entropy of each row of a weighted histogram matrix, 0 for rows without weight.
+    """
+    total_weight = histograms.sum(axis=1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        probabilities = np.where(total_weight > 0, histograms / total_weight, 0)
+        terms = np.where(probabilities > 0, probabilities * np.log2(probabilities), 0)
+    return -terms.sum(axis=1)
+
+def rose_gravities(groups, n_groups, bearings, weights):
+    """
+    Rose gravity of every group at once, as rose_gravity computes it for one city.
+    """
+    angles = np.radians(bearings)
+    x = np.bincount(groups, weights=np.cos(angles) * weights, minlength=n_groups)
+    y = np.bincount(groups, weights=np.sin(angles) * weights, minlength=n_groups)
+    return np.sqrt(x**2 + y**2)
+
+def prepare_od_flows(df, geometry=None):
+    """
+    Compute distances, both bearings and weights of all flows in one vectorized step.
+    With a CityGeometry, distances and bearings are looked up by the Ocity and Dcity adcodes instead.
+    Rows without city names, coordinates or count (left by the outer merges in SymbolicFlow) are skipped.
+    Returns the city names, the origin and destination city index of each flow, the outgoing and
+    incoming bearings and the weights.
+    """
+    if geometry is None:
+        df = df.dropna(subset=['Ocity_name', 'Dcity_name', 'O_X', 'O_Y', 'D_X', 'D_Y', 'count'])
+        o_x, o_y, d_x, d_y = (df[column].to_numpy(dtype=np.float64) for column in ['O_X', 'O_Y', 'D_X', 'D_Y'])
+        distances = haversine_distances(o_x, o_y, d_x, d_y)
+        bearings_out = calculate_bearings(o_x, o_y, d_x, d_y)
+        bearings_in = calculate_bearings(d_x, d_y, o_x, o_y)
+    else:
+        df = df.dropna(subset=['Ocity_name', 'Dcity_name', 'Ocity', 'Dcity', 'count'])
+        distances, bearings_out, bearings_in = geometry.lookup(df['Ocity'], df['Dcity'])
+        known = ~np.isnan(distances)
+        df, distances, bearings_out, bearings_in = df[known], distances[known], bearings_out[known], bearings_in[known]
+    weights = df['count'].to_numpy(dtype=np.float64) * distances
+    codes, cities = pd.factorize(pd.concat([df['Ocity_name'], df['Dcity_name']], ignore_index=True))
+    o_idx, d_idx = codes[:len(df)], codes[len(df):]
+    return cities, o_idx, d_idx, bearings_out, bearings_in, weights
+
+def calculate_od_metrics_vectorized(df, interval=20, geometry=None):
+    """
+    Vectorized calculate_od_metrics: the rose entropy and rose gravity of outgoing and incoming flows of each city,
+    computed with grouped reductions instead of a Python loop over the rows.
+    geometry is an optional CityGeometry with precomputed distances and bearings.
+    Returns the same DataFrame as convert_to_dataframe_with_metrics, cities in order of first appearance.
+    """
+    cities, o_idx, d_idx, bearings_out, bearings_in, weights = prepare_od_flows(df, geometry)
+    n = len(cities)
+    data = {'cityname': np.asarray(cities, dtype=object)}
+    metrics = {}
+    for direction, groups, bearings in [('out', o_idx, bearings_out), ('in', d_idx, bearings_in)]:
+        # Cities without flows in this direction get no value, as in convert_to_dataframe_with_metrics
+        has_flows = np.bincount(groups, minlength=n) > 0
+        entropy = histogram_entropy(rose_histograms(groups, n, bearings, weights, interval))
+        gravity = rose_gravities(groups, n, bearings, weights)
+        metrics[f'entropy_{direction}'] = np.where(has_flows, entropy, np.nan)
+        metrics[f'gravity_{direction}'] = np.where(has_flows, gravity, np.nan)
+    for column in ['entropy_out', 'entropy_in', 'gravity_out', 'gravity_in']:
+        data[column] = metrics[column]
+    return pd.DataFrame(data)
+
+def rose_entropy_sweep(df, intervals=(5, 10, 15, 20, 30, 45, 60, 90), base_interval=None, geometry=None):
+    """
+    Rose entropy of outgoing and incoming flows of each city for several interval sizes at once.
+    The weighted bearings are binned once at base_interval (default: the greatest common divisor of intervals),
+    and the histogram of every interval is obtained by merging adjacent base bins.
+    Parameters:
+        intervals: Interval sizes in degrees, each dividing 360 and a multiple of base_interval.
+        geometry: Optional CityGeometry with precomputed distances and bearings.
+    Returns:
+        A tidy DataFrame with columns cityname, direction ('out' or 'in'), interval and entropy,
+        with no rows for cities without flows in a direction.
+    """
+    intervals = [int(interval) for interval in intervals]
+    for interval in intervals:
+        if interval <= 0 or 360 % interval:
+            raise ValueError(f"interval {interval} does not divide 360")
+    base_interval = base_interval or reduce(gcd, intervals)
+    if 360 % base_interval:
+        raise ValueError(f"base_interval {base_interval} does not divide 360")
+    for interval in intervals:
+        if interval % base_interval:
+            raise ValueError(f"interval {interval} is not a multiple of base_interval {base_interval}")
+
+    cities, o_idx, d_idx, bearings_out, bearings_in, weights = prepare_od_flows(df, geometry)
+    n = len(cities)
+    tables = []
+    for direction, groups, bearings in [('out', o_idx, bearings_out), ('in', d_idx, bearings_in)]:
+        has_flows = np.bincount(groups, minlength=n) > 0
+        base_histograms = rose_histograms(groups, n, bearings, weights, base_interval)
+        for interval in intervals:
+            # Merge interval // base_interval adjacent base bins into one
+            histograms = base_histograms.reshape(n, 360 // interval, interval // base_interval).sum(axis=2)
+            tables.append(pd.DataFrame({
+                'cityname': np.asarray(cities, dtype=object)[has_flows],
+                'direction': direction,
+                'interval': interval,
+                'entropy': histogram_entropy(histograms)[has_flows],
+            }))
+    return pd.concat(tables, ignore_index=True)
+
+def prepare_flow_graph(df):
+    """
+    The symbol flow network as an edge list: city names and, for every flow, the origin and destination
+    city index and the count. Rows without city names or count are skipped, coordinates are not needed.
+    Flows between the same pair of cities are summed.
+    """
+    df = df.dropna(subset=['Ocity_name', 'Dcity_name', 'count'])
+    codes, cities = pd.factorize(pd.concat([df['Ocity_name'], df['Dcity_name']], ignore_index=True))
+    n = len(cities)
+    # Sum parallel edges, so that every matvec below touches each edge once
+    edges, inverse = np.unique(codes[:len(df)].astype(np.int64) * n + codes[len(df):], return_inverse=True)
+    counts = np.bincount(inverse.ravel(), weights=df['count'].to_numpy(dtype=np.float64), minlength=len(edges))
+    return cities, edges // n, edges % n, counts
+
+def weighted_pagerank(o_idx, d_idx, counts, n, damping=0.85, tol=1e-10, max_iter=1000):
+    """
+    Weighted PageRank of the n cities by power iteration over the sparse edge list.
+    A city passes its score on to its destinations in proportion to the flow counts;
+    cities without outgoing flows spread their score evenly over all cities.
+    Parameters:
+        damping: Probability of following a flow instead of jumping to a random city.
+        tol: The iteration stops when the L1 change of the scores falls below tol.
+        max_iter: Maximum number of iterations, a RuntimeWarning is issued if the scores have not converged by then.
+    Returns:
+        The scores, summing to 1, and the number of iterations.
+    """
+    strength_out = np.bincount(o_idx, weights=counts, minlength=n)
+    dangling = strength_out == 0
+    # Transition probability of each edge
+    with np.errstate(divide='ignore', invalid='ignore'):
+        probabilities = counts / strength_out[o_idx]
+    scores = np.full(n, 1.0 / n)
+    for iteration in range(1, max_iter + 1):
+        previous = scores
+        scores = damping * np.bincount(d_idx, weights=probabilities * previous[o_idx], minlength=n)
+        scores += (damping * previous[dangling].sum() + 1 - damping) / n
+        if np.abs(scores - previous).sum() < tol:
+            return scores, iteration
+    warnings.warn(f"PageRank did not converge to tol={tol} in {max_iter} iterations", RuntimeWarning)
+    return scores, max_iter
+
+def weighted_hits(o_idx, d_idx, counts, n, tol=1e-10, max_iter=1000):
+    """
+    Weighted HITS hub and authority scores of the n cities by power iteration over the sparse edge list.
+    The authority of a city is the count weighted sum of the hub scores of its origins,
+    the hub score of a city the count weighted sum of the authorities of its destinations.
+    Parameters:
+        tol: The iteration stops when the L1 change of the hub scores falls below tol.
+        max_iter: Maximum number of iterations, a RuntimeWarning is issued if the scores have not converged by then.
+    Returns:
+        The hub and authority scores, each summing to 1 (0 for cities without flows), and the number of iterations.
+    """
+    # Scores are scaled to a maximum of 1 during the iteration and to a sum of 1 at the end
+    hubs = np.ones(n)
+    for iteration in range(1, max_iter + 1):
+        previous = hubs
+        authorities = np.bincount(d_idx, weights=counts * previous[o_idx], minlength=n)
+        authorities /= authorities.max() or 1
+        hubs = np.bincount(o_idx, weights=counts * authorities[d_idx], minlength=n)
+        hubs /= hubs.max() or 1
+        if np.abs(hubs - previous).sum() < tol:
+            break
+    else:
+        warnings.warn(f"HITS did not converge to tol={tol} in {max_iter} iterations", RuntimeWarning)
+    return hubs / (hubs.sum() or 1), authorities / (authorities.sum() or 1), iteration
+
+def calculate_network_metrics(df, damping=0.85, tol=1e-10, max_iter=1000):
+    """
+    Network centrality of each city in the symbol flow network, weighted by the flow counts:
+    outflow and inflow strength, PageRank and HITS hub and authority scores.
+    All are computed with np.bincount over the edge list, so the cost grows with the number of flows
+    rather than with the square of the number of cities.
+    Returns a DataFrame with columns cityname, strength_out, strength_in, pagerank, hub and authority,
+    cities in order of first appearance, to be merged with the calculate_od_metrics table on cityname.
+    """
+    cities, o_idx, d_idx, counts = prepare_flow_graph(df)
+    n = len(cities)
+    if n == 0:
+        return pd.DataFrame(columns=['cityname', 'strength_out', 'strength_in', 'pagerank', 'hub', 'authority'])
+    pagerank, _ = weighted_pagerank(o_idx, d_idx, counts, n, damping, tol, max_iter)
+    hubs, authorities, _ = weighted_hits(o_idx, d_idx, counts, n, tol, max_iter)
+    return pd.DataFrame({
+        'cityname': np.asarray(cities, dtype=object),
+        'strength_out': np.bincount(o_idx, weights=counts, minlength=n),
+        'strength_in': np.bincount(d_idx, weights=counts, minlength=n),
+        'pagerank': pagerank,
+        'hub': hubs,
+        'authority': authorities,
+    })
 
-# Save the DataFrame to a CSV file
-df_metrics.to_csv(os.path.join(data_folder, 'city_od_metrics.csv'), index=False)
+if __name__ == '__main__':
+    from CityGeometry import CityGeometry
+    from TableIO import read_table, write_table
+    from Instrumentation import EventLog
+    # Assuming 'df' is your DataFrame containing the OD flow data
+    # Note: This function assumes 'df' is a pandas DataFrame containing the OD flow data.
+    data_folder = 'data/output'
+    filename = 'Symbolicflows.csv'  # or 'Symbolicflows.parquet'
+    output_format = 'csv'  # 'parquet' for columnar output (requires pyarrow)
+    df = read_table(os.path.join(data_folder, filename))
+    # 运行事件，每行一个 JSON 对象
+    events = EventLog(os.path.join(data_folder, 'events.jsonl'), stage='metrics')
+    # Precomputed city x city distances and bearings, rebuilt only when city_geocode.csv changes
+    geometry = CityGeometry.load(os.path.join(data_folder, 'city_geocode.csv'), os.path.join(data_folder, 'geometry'))
+    # Call the function to calculate metrics and convert to DataFrame
+    with events.timed('od_metrics', rows=len(df)):
+        df_metrics = calculate_od_metrics_vectorized(df, geometry=geometry)
+    # Strength, PageRank and hub/authority scores of the symbol flow network
+    with events.timed('network_metrics', rows=len(df)):
+        df_metrics = df_metrics.merge(calculate_network_metrics(df), on='cityname', how='outer')
 
+    # Save the DataFrame to a CSV file
+    write_table(df_metrics, os.path.join(data_folder, 'city_od_metrics.csv'), output_format)
 
+    # Rose entropy for several interval sizes from a single binning of the bearings
+    with events.timed('entropy_sweep', rows=len(df)):
+        df_sweep = rose_entropy_sweep(df, geometry=geometry)
+    write_table(df_sweep, os.path.join(data_folder, 'city_entropy_sweep.csv'), output_format)
+    events.close()
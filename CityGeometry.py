@@ -0,0 +1,102 @@
+"""
+Data description:
+                city_geocode.csv is 城市的地理编码, fields are fullname,adcode,gcj_x,gcj_y,wgs_x,wgs_y
+Function:
+                预先计算所有城市对之间的大圆距离与方位角，保存为 .npy 矩阵
+                city_geocode.csv 变化(内容哈希不同)时自动重建
+                以内存映射方式加载，按 adcode 查表代替逐行三角函数计算
+"""
+import os
+import json
+
+import numpy as np
+import pandas as pd
+
+from CitiesAttributes import haversine_distances, calculate_bearings
+from Manifest import file_sha256
+
+GEOMETRY_VERSION = 1
+
+
+class CityGeometry:
+    """
+        City x city great-circle distance (km) and bearing (degrees) matrices, keyed by adcode.
+        bearing[i, j] is the forward bearing from city i to city j, so the back bearing is bearing[j, i],
+        available without a second matrix as back_bearing.
+    """
+
+    def __init__(self, adcodes: np.ndarray, distance: np.ndarray, bearing: np.ndarray):
+        self.adcodes = adcodes
+        self.distance = distance
+        self.bearing = bearing
+
+    @property
+    def back_bearing(self) -> np.ndarray:
+        return self.bearing.T
+
+    @classmethod
+    def build(cls, geocode_path: str, cache_dir: str) -> 'CityGeometry':
+        """
+            Compute the matrices from city_geocode.csv and save them in cache_dir.
+        """
+        df_cities = pd.read_csv(geocode_path, header=0).drop_duplicates('adcode').sort_values('adcode')
+        adcodes = df_cities['adcode'].to_numpy(dtype=np.int64)
+        x = df_cities['wgs_x'].to_numpy(dtype=np.float64)
+        y = df_cities['wgs_y'].to_numpy(dtype=np.float64)
+        # Broadcast every city against every other city
+        distance = haversine_distances(x[:, None], y[:, None], x[None, :], y[None, :])
+        bearing = calculate_bearings(x[:, None], y[:, None], x[None, :], y[None, :])
+
+        os.makedirs(cache_dir, exist_ok=True)
+        for name, array in [('adcodes', adcodes), ('distance', distance), ('bearing', bearing)]:
+            # Write then rename, so that an interrupted build never leaves a half written matrix
+            tmp_path = os.path.join(cache_dir, f'city_{name}.tmp.npy')
+            np.save(tmp_path, array)
+            os.replace(tmp_path, os.path.join(cache_dir, f'city_{name}.npy'))
+        metadata = {'version': GEOMETRY_VERSION, 'source': os.path.abspath(geocode_path),
+                    'sha256': file_sha256(geocode_path), 'cities': len(adcodes)}
+        with open(os.path.join(cache_dir, 'city_geometry.json'), 'w', encoding='utf-8') as f:
+            json.dump(metadata, f, indent=2)
+        return cls(adcodes, distance, bearing)
+
+    @classmethod
+    def load(cls, geocode_path: str, cache_dir: str) -> 'CityGeometry':
+        """
+            Memory-map the matrices from cache_dir, rebuilding them first if city_geocode.csv has changed.
+        """
+        metadata_path = os.path.join(cache_dir, 'city_geometry.json')
+        try:
+            with open(metadata_path, encoding='utf-8') as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            metadata = {}
+        if metadata.get('version') != GEOMETRY_VERSION or metadata.get('sha256') != file_sha256(geocode_path):
+            cls.build(geocode_path, cache_dir)
+        return cls(*(np.load(os.path.join(cache_dir, f'city_{name}.npy'), mmap_mode='r')
+                     for name in ['adcodes', 'distance', 'bearing']))
+
+    def index(self, adcodes) -> np.ndarray:
+        """
+            Matrix index of each adcode, -1 for adcodes that are not in city_geocode.csv.
+        """
+        adcodes = pd.to_numeric(pd.Series(adcodes), errors='coerce').fillna(-1).to_numpy(dtype=np.int64)
+        if not len(self.adcodes):
+            return np.full(len(adcodes), -1)
+        positions = np.searchsorted(self.adcodes, adcodes)
+        positions = np.minimum(positions, len(self.adcodes) - 1)
+        found = self.adcodes[positions] == adcodes
+        return np.where(found, positions, -1)
+
+    def lookup(self, o_adcodes, d_adcodes):
+        """
+            Distance, forward bearing and back bearing of each (origin, destination) pair, NaN for unknown cities.
+        """
+        o_idx, d_idx = self.index(o_adcodes), self.index(d_adcodes)
+        known = (o_idx >= 0) & (d_idx >= 0)
+        distance = np.full(len(o_idx), np.nan)
+        bearing_out = np.full(len(o_idx), np.nan)
+        bearing_in = np.full(len(o_idx), np.nan)
+        distance[known] = self.distance[o_idx[known], d_idx[known]]
+        bearing_out[known] = self.bearing[o_idx[known], d_idx[known]]
+        bearing_in[known] = self.bearing[d_idx[known], o_idx[known]]
+        return distance, bearing_out, bearing_in
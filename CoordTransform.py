@@ -0,0 +1,69 @@
+"""
+Function:
+                GCJ-02 与 WGS-84 坐标的批量转换，输入为经度、纬度数组
+                公式与 chinacoordtran 的 gcj02towgs84 / wgs84togcj02 逐点转换相同，中国范围外的坐标保持不变
+"""
+import numpy as np
+
+PI = 3.1415926535897932384626
+A = 6378245.0
+EE = 0.00669342162296594323
+
+
+def out_of_china(lng, lat):
+    """
+        True for coordinates outside the bounding box in which GCJ-02 differs from WGS-84.
+    """
+    lng, lat = np.asarray(lng, dtype=np.float64), np.asarray(lat, dtype=np.float64)
+    return ~((lng > 73.66) & (lng < 135.05) & (lat > 3.86) & (lat < 53.55))
+
+
+def _transform_lat(x, y):
+    ret = -100.0 + 2.0 * x + 3.0 * y + 0.2 * y * y + 0.1 * x * y + 0.2 * np.sqrt(np.abs(x))
+    ret += (20.0 * np.sin(6.0 * x * PI) + 20.0 * np.sin(2.0 * x * PI)) * 2.0 / 3.0
+    ret += (20.0 * np.sin(y * PI) + 40.0 * np.sin(y / 3.0 * PI)) * 2.0 / 3.0
+    ret += (160.0 * np.sin(y / 12.0 * PI) + 320 * np.sin(y * PI / 30.0)) * 2.0 / 3.0
+    return ret
+
+
+def _transform_lng(x, y):
+    ret = 300.0 + x + 2.0 * y + 0.1 * x * x + 0.1 * x * y + 0.1 * np.sqrt(np.abs(x))
+    ret += (20.0 * np.sin(6.0 * x * PI) + 20.0 * np.sin(2.0 * x * PI)) * 2.0 / 3.0
+    ret += (20.0 * np.sin(x * PI) + 40.0 * np.sin(x / 3.0 * PI)) * 2.0 / 3.0
+    ret += (150.0 * np.sin(x / 12.0 * PI) + 300.0 * np.sin(x / 30.0 * PI)) * 2.0 / 3.0
+    return ret
+
+
+def _offsets(lng, lat):
+    """
+        GCJ-02 offsets (dlng, dlat) in degrees at the given coordinates.
+    """
+    dlat = _transform_lat(lng - 105.0, lat - 35.0)
+    dlng = _transform_lng(lng - 105.0, lat - 35.0)
+    radlat = lat / 180.0 * PI
+    magic = np.sin(radlat)
+    magic = 1 - EE * magic * magic
+    sqrtmagic = np.sqrt(magic)
+    dlat = (dlat * 180.0) / ((A * (1 - EE)) / (magic * sqrtmagic) * PI)
+    dlng = (dlng * 180.0) / (A / sqrtmagic * np.cos(radlat) * PI)
+    return dlng, dlat
+
+
+def gcj02_to_wgs84_batch(lng, lat):
+    """
+        Convert arrays of GCJ-02 coordinates to WGS-84. Returns (lng, lat) arrays.
+    """
+    lng, lat = np.asarray(lng, dtype=np.float64), np.asarray(lat, dtype=np.float64)
+    dlng, dlat = _offsets(lng, lat)
+    outside = out_of_china(lng, lat)
+    return np.where(outside, lng, lng * 2 - (lng + dlng)), np.where(outside, lat, lat * 2 - (lat + dlat))
+
+
+def wgs84_to_gcj02_batch(lng, lat):
+    """
+        Convert arrays of WGS-84 coordinates to GCJ-02. Returns (lng, lat) arrays.
+    """
+    lng, lat = np.asarray(lng, dtype=np.float64), np.asarray(lat, dtype=np.float64)
+    dlng, dlat = _offsets(lng, lat)
+    outside = out_of_china(lng, lat)
+    return np.where(outside, lng, lng + dlng), np.where(outside, lat, lat + dlat)
@@ -1,13 +1,22 @@
 import re
 import os
 import glob
+import numpy as np
 import pandas as pd
 import concurrent.futures
 from typing import List, Tuple, Dict
-import gc
 import time
+from SymbolMatcher import SymbolMatcher
+from PoiReader import iter_line_blocks, read_poi_block, QuarantineWriter
+from FlowBuilder import count_pairs, PairCounts
+from TableIO import ParquetShard, check_format
+from Manifest import RunManifest
+from MatchIndex import MatchIndex
+from Instrumentation import EventLog, Progress, profile_call, merge_profiles, peak_rss_mb
+from PoiDedup import IdDedup, hash_ids
 
-starttime = time.time()
+# Parentheses and their contents are removed from names before matching
+_PARENTHESES = re.compile(r'\([^)]*\)')
 
 def check_and_extract(row: pd.Series, placesymbol_dict: Dict[str, int]) -> Tuple[str, str, str, str, int]:
     """
@@ -27,61 +36,512 @@ def check_and_extract(row: pd.Series, placesymbol_dict: Dict[str, int]) -> Tuple
         return name_modified, row['_id'], row['adcode'], first_symbol, placesymbol_dict[first_symbol]
     return None
 
-def process_csv(file_path: str, placesymbol_dict: Dict[str, int], output_dir: str, max_rows_per_file: int):
-    skip_count = 0 # Initializes the counter for skipping rows
-    def warn_bad_line(msg):
-        nonlocal skip_count
-        skip_count += 1  # 对跳过的行进行计数
-    try:
-        data = pd.read_csv(file_path, encoding='GBK',on_bad_lines=warn_bad_line,engine='python')
+def match_and_extract(row: pd.Series, matcher: SymbolMatcher) -> Tuple[str, str, str, str, int]:
+    """
+        Drop-in replacement for check_and_extract using a compiled SymbolMatcher.
+        The name is scanned once instead of once per placesymbol; ties at the same position
+        are resolved in placesymbol_dict order, exactly as check_and_extract does.
+    """
+    name_modified = re.sub(r'\([^)]*\)', '', row['name'])
+    found = matcher.find_first(name_modified)
+    if found is not None:
+        first_symbol = found[1]
+        return name_modified, row['_id'], row['adcode'], first_symbol, matcher.placesymbol_dict[first_symbol]
+    return None
 
-        # Function to apply
-        def apply_check_and_extract(row):
-            if isinstance(row['name'], str):
-                result = check_and_extract(row, placesymbol_dict)
-                return pd.Series(result) if result is not None else pd.Series([None]*5)
+def extract_matches(data: pd.DataFrame, matcher: SymbolMatcher, keep_name: bool = True) -> pd.DataFrame:
+    """
+        Find the first placesymbol of every POI name, as match_and_extract does, and keep the rows with one.
+        The results are column oriented and typed: adcode and placecode are int64, placesymbol is a categorical
+        of matcher.symbol_dtype (its codes are the symbol ranks) and name, the name without parentheses,
+        is only kept with keep_name. The rows without _id, with an adcode that is not a number or whose
+        placesymbol has no placecode are dropped.
+        Only the names are scanned one by one, no object is built per row.
+    """
+    ranks = np.full(len(data), -1, dtype=np.int64)
+    names = []
+    first_rank = matcher.first_rank
+    for row, name in enumerate(data['name'].to_numpy(dtype=object)):
+        if isinstance(name, str):
+            name_modified = _PARENTHESES.sub('', name)
+            rank = first_rank(name_modified)
+            if rank >= 0:
+                ranks[row] = rank
+                names.append(name_modified)
+    matched = ranks >= 0
+    placecodes = np.full(len(data), np.nan)
+    placecodes[matched] = matcher.placecodes[ranks[matched]]
+    adcodes = pd.to_numeric(data['adcode'], errors='coerce').to_numpy(dtype=np.float64)
+    keep = matched & ~np.isnan(placecodes) & ~np.isnan(adcodes) & data['_id'].notna().to_numpy()
+
+    rows = np.flatnonzero(keep)
+    results = {}
+    if keep_name:
+        # names holds the names of the matched rows only
+        results['name'] = np.asarray(names, dtype=object)[keep[matched]] if names else np.zeros(0, dtype=object)
+    results['_id'] = data['_id'].to_numpy(dtype=object)[rows]
+    results['adcode'] = adcodes[rows].astype(np.int64)
+    results['placesymbol'] = pd.Categorical.from_codes(ranks[rows], dtype=matcher.symbol_dtype)
+    results['placecode'] = placecodes[rows].astype(np.int64)
+    return pd.DataFrame(results, index=data.index[rows])
+
+class ShardWriter:
+    """
+        Append extraction results of one POI file to rolling output shards of max_rows_per_file rows,
+        named output_<file>_<n>.csv (or .parquet), so results never have to be held in memory as a whole.
+        close() must be called once the file is done.
+    """
+
+    def __init__(self, file_path: str, output_dir: str, max_rows_per_file: int, output_format: str = 'csv'):
+        check_format(output_format)
+        self.prefix = os.path.join(output_dir, f'output_{os.path.basename(file_path).split(".")[0]}')
+        self.max_rows_per_file = max_rows_per_file
+        self.output_format = output_format
+        self.paths: List[str] = []
+        self.rows = 0
+        self._rows_in_shard = 0
+        self._parquet_shard = None
+
+    def append(self, results: pd.DataFrame):
+        start_idx = 0
+        while start_idx < len(results):
+            if not self.paths or self._rows_in_shard >= self.max_rows_per_file:
+                # Roll over to a new shard
+                self.close()
+                self.paths.append(f'{self.prefix}_{len(self.paths) + 1}.{self.output_format}')
+                self._rows_in_shard = 0
+            take = min(self.max_rows_per_file - self._rows_in_shard, len(results) - start_idx)
+            part = results.iloc[start_idx:start_idx + take]
+            if self.output_format == 'parquet':
+                if self._parquet_shard is None:
+                    self._parquet_shard = ParquetShard(self.paths[-1])
+                self._parquet_shard.write(part)
             else:
-                return pd.Series([None]*5)
+                part.to_csv(self.paths[-1], mode='a' if self._rows_in_shard else 'w',
+                            index=False, header=not self._rows_in_shard, encoding='utf-8')
+            self._rows_in_shard += take
+            self.rows += take
+            start_idx += take
 
-        results = data.apply(apply_check_and_extract, axis=1, result_type='expand')
-        results.columns = ['name', '_id', 'adcode', 'placesymbol', 'placecode']
-        results.dropna(inplace=True)
+    def close(self):
+        if self._parquet_shard is not None:
+            self._parquet_shard.close()
+            self._parquet_shard = None
 
-        for start_idx in range(0, len(results), max_rows_per_file):
-            output_file = os.path.join(output_dir, f'output_{os.path.basename(file_path).split(".")[0]}_{start_idx//max_rows_per_file + 1}.csv')
-            results.iloc[start_idx:start_idx + max_rows_per_file].to_csv(output_file, index=False, header=True, encoding='utf-8')
+def process_csv(file_path: str, matcher: SymbolMatcher, output_dir: str, max_rows_per_file: int,
+                block_bytes: int = 16 * 1024 * 1024, quarantine_dir: str = None, output_format: str = 'csv',
+                events: EventLog = None, profile_path: str = None):
+    """
+        Extract placesymbols from one POI file.
+        The file is streamed in blocks of about block_bytes parsed by the C parser, and the matches are appended
+        to rolling shards, so peak memory depends on block_bytes rather than on the file size.
+        Malformed lines and lines that are not valid GBK are written with their line numbers to
+        quarantine_dir (default <output_dir>/quarantine). output_format is 'csv' or 'parquet'.
+        'chunk' and 'file' events (rows, matched, bad lines, seconds) and errors are emitted to events.
+        With profile_path the file is processed under cProfile and the profile is saved there.
+    """
+    if profile_path is not None:
+        return profile_call(profile_path, process_csv, file_path, matcher, output_dir, max_rows_per_file,
+                            block_bytes, quarantine_dir, output_format, events)
+    events = events or EventLog()
+    quarantine = QuarantineWriter(file_path, quarantine_dir or os.path.join(output_dir, 'quarantine'))
+    writer = ShardWriter(file_path, output_dir, max_rows_per_file, output_format)
+    start = time.perf_counter()
+    rows = matched = 0
+    try:
+        for block_index, (header, block, first_line_no) in enumerate(iter_line_blocks(file_path, block_bytes)):
+            block_start = time.perf_counter()
+            data, bad_lines = read_poi_block(header, block, first_line_no)
+            quarantine.append(bad_lines)
+            results = extract_matches(data, matcher)
+            writer.append(results)
+            rows += len(data)
+            matched += len(results)
+            events.emit('chunk', file=file_path, block=block_index, rows=len(data), matched=len(results),
+                        bad_lines=len(bad_lines), seconds=round(time.perf_counter() - block_start, 4))
     except Exception as e:
         print(f"Error processing file {file_path}: {e}")
+        events.error(e, file=file_path)
+    finally:
+        writer.close()
+    events.emit('file', file=file_path, rows=rows, matched=matched, bad_lines=quarantine.count,
+                shards=writer.paths, seconds=round(time.perf_counter() - start, 4))
     # Print the number of lines skipped
-    if skip_count > 0:
-        print(f"Skipped {skip_count} bad lines in file {file_path}")
+    if quarantine.count > 0:
+        print(f"Skipped {quarantine.count} bad lines in file {file_path}, see {quarantine.path}")
+
+def extract_from_index(match_index: MatchIndex, matcher: SymbolMatcher, output_dir: str, max_rows_per_file: int,
+                       output_format: str = 'csv') -> Dict[str, List[str]]:
+    """
+        Write the extraction shards of matcher's dictionary from a MatchIndex instead of rescanning the POI files.
+        The shards are the same as those parallel_process_csv writes with this matcher.
+        Returns the shard paths of each POI file.
+    """
+    shards = {}
+    writer = None
+    for file_path, results in match_index.derive(matcher.placesymbol_dict):
+        if file_path not in shards:
+            if writer is not None:
+                writer.close()
+            writer = ShardWriter(file_path, output_dir, max_rows_per_file, output_format)
+            shards[file_path] = writer.paths
+        writer.append(results)
+    if writer is not None:
+        writer.close()
+    return shards
+
+# Matcher and task options shipped to each worker process once by the pool initializer
+_worker_matcher = None
+_worker_keep_results = True
+_worker_count_pairs = False
+_worker_match_index = None
+_worker_profile = (None, None)
+_worker_dedup = False
+
+def _init_worker(matcher, keep_results: bool = True, count_pairs: bool = False, index_dir: str = None,
+                 profile_file: str = None, profile_path: str = None, dedup: bool = False):
+    global _worker_matcher, _worker_keep_results, _worker_count_pairs, _worker_match_index, _worker_profile, _worker_dedup
+    # A matcher saved as an artifact is loaded by each worker from its path instead of being pickled to it
+    _worker_matcher = SymbolMatcher.load(matcher) if isinstance(matcher, str) else matcher
+    _worker_keep_results = keep_results
+    _worker_count_pairs = count_pairs
+    _worker_match_index = MatchIndex.open(index_dir) if index_dir is not None else None
+    _worker_profile = (profile_file, profile_path)
+    _worker_dedup = dedup
+
+def _profile_part(profile_path: str, block_index: int) -> str:
+    return f'{profile_path}.{block_index:05d}.part'
+
+def _extract_block(file_path: str, block_index: int, header: bytes, block: bytes, first_line_no: int):
+    """
+        Worker task: parse one block of a POI file and extract its placesymbols.
+        Only the (placecode, adcode) counts are sent back when the results themselves are not needed.
+        When removing duplicates the results, without names unless they are written, and their hashed _ids
+        are sent back instead, since the counts can only be made once the duplicates are gone.
+        With a match index the worker also saves all superset hits of the block in it.
+        The blocks of the file chosen for profiling run under cProfile, each saving its own part.
+    """
+    profile_file, profile_path = _worker_profile
+    if profile_file is not None and os.path.abspath(file_path) == os.path.abspath(profile_file):
+        return profile_call(_profile_part(profile_path, block_index), _extract_block_task,
+                            file_path, block_index, header, block, first_line_no)
+    return _extract_block_task(file_path, block_index, header, block, first_line_no)
+
+def _extract_block_task(file_path: str, block_index: int, header: bytes, block: bytes, first_line_no: int):
+    start = time.perf_counter()
+    data, bad_lines = read_poi_block(header, block, first_line_no)
+    if _worker_match_index is not None:
+        _worker_match_index.write_part(file_path, block_index, data)
+    # The names are only needed in the output shards
+    results = extract_matches(data, _worker_matcher, keep_name=_worker_keep_results)
+    pairs = count_pairs(results) if _worker_count_pairs else None
+    matched = len(results)
+    hashes = hash_ids(results['_id']) if _worker_dedup else None
+    if not (_worker_keep_results or _worker_dedup):
+        results = None
+    return (file_path, block_index, results, pairs, hashes, bad_lines, len(data), matched, os.getpid(),
+            time.perf_counter() - start)
+
+def parallel_process_csv(file_paths: List[str], matcher: SymbolMatcher, output_dir: str, max_rows_per_file: int,
+                         max_workers: int = None, block_bytes: int = 32 * 1024 * 1024, max_pending: int = None,
+                         quarantine_dir: str = None, pair_counts: PairCounts = None,
+                         output_format: str = 'csv', manifest_path: str = None,
+                         index_dir: str = None, events: EventLog = None, progress: bool = None,
+                         profile_file: str = None, profile_path: str = None,
+                         dedup: IdDedup = None) -> Dict[int, Dict[str, float]]:
+    """
+        Extract placesymbols from many POI files with a pool of worker processes.
+        Files are cut into blocks of about block_bytes, and blocks are fed to the pool continuously,
+        keeping at most max_pending in flight or finished but waiting for an earlier block to be written,
+        so a single large file is spread over all workers and a slow block does not let results pile up.
+        Bad lines are quarantined per file as in process_csv. A file with a failed block counts for nothing:
+        its shards are removed and its counts are not added, and it is not recorded in the manifest.
+        With output_dir=None no shards are written; with pair_counts the (placecode, adcode) counts of
+        all results are accumulated into it, which is all that flow building needs.
+        With manifest_path, files whose content, dictionary version and output settings are unchanged since
+        the last run are skipped and their cached partial counts are used instead; every other file is recorded
+        in the manifest as soon as it is complete, so an interrupted run resumes after the last finished file.
+        With index_dir, a MatchIndex created there with MatchIndex.create is filled with all superset hits,
+        from which extract_from_index later derives the results of other dictionaries.
+        events receives a 'chunk' event per block and a 'file' event per file (rows, matched, bad lines, seconds),
+        the errors with their traceback, a 'worker' event per worker process (utilization is its busy time over
+        the run time) and a 'run' event with the totals and peak memory. progress shows a live progress line
+        (default: when stderr is a terminal). With profile_file the blocks of that POI file are run under cProfile
+        and their profiles merged into profile_path (default profile_<file>.prof in the current directory).
+        With dedup, matched POIs whose _id was already seen, in an earlier file of file_paths or earlier in the
+        same file, are left out of the shards and counts, and the number removed is added to the 'file' events
+        and to dedup.removed. Blocks are then written in file order, so the results of a file wait for the
+        earlier files to finish; with a manifest a file is only skipped if all earlier files are skipped too.
+        Returns the per-worker statistics {pid: {'chunks', 'rows', 'busy'}}.
+    """
+    max_workers = max_workers or os.cpu_count()
+    max_pending = max_pending or 2 * max_workers
+    events = events or EventLog()
+    run_start = time.perf_counter()
+    if profile_file is not None:
+        if profile_path is None:
+            profile_path = f'profile_{os.path.basename(profile_file).split(".")[0]}.prof'
+        # Parts left by an interrupted run would be merged into this profile
+        for part in glob.glob(glob.escape(profile_path) + '.*.part'):
+            os.remove(part)
+
+    match_index = MatchIndex.open(index_dir) if index_dir is not None else None
+    manifest = None
+    if manifest_path is not None:
+        settings = {'dictionary_version': matcher.version, 'output_format': output_format,
+                    'output_dir': os.path.abspath(output_dir) if output_dir is not None else None,
+                    'index_id': match_index.index_id if match_index is not None else None}
+        if dedup is not None:
+            # Only set when removing duplicates, so that the manifests of other runs stay valid
+            settings['dedup'] = True
+        manifest = RunManifest(manifest_path, settings)
+        # Without duplicates the results of a file depend on all earlier files
+        cached, file_paths = manifest.split(file_paths, prefix=dedup is not None)
+        if pair_counts is not None:
+            for file_path in cached:
+                pair_counts.add(manifest.counts(file_path))
+        if dedup is not None:
+            for file_path in cached:
+                dedup.add_seen(file_path, *manifest.ids(file_path))
+        for file_path in file_paths:
+            # Remove the old shards of a changed file, the new results may need fewer of them
+            entry = manifest.discard(file_path)
+            for shard in entry['shards'] if entry else []:
+                if output_dir is not None and os.path.dirname(shard) == os.path.abspath(output_dir) and os.path.exists(shard):
+                    os.remove(shard)
+        print(f"{len(cached)} files unchanged since the last run, {len(file_paths)} files to process")
+        events.emit('cached', files=len(cached), pending=len(file_paths))
+    if match_index is not None:
+        for file_path in file_paths:
+            match_index.clear(file_path)
+
+    def blocks():
+        for file_path in file_paths:
+            n_blocks = 0
+            try:
+                for header, block, first_line_no in iter_line_blocks(file_path, block_bytes):
+                    yield file_path, n_blocks, header, block, first_line_no
+                    n_blocks += 1
+            except OSError as e:
+                print(f"Error processing file {file_path}: {e}")
+                events.error(e, file=file_path)
+                failed.add(file_path)
+            # The number of blocks is known once the file has been read to the end
+            block_counts[file_path] = n_blocks
+
+    # Results of finished blocks wait here until all earlier blocks of the same file have been written
+    reorder_buffers = {file_path: {} for file_path in file_paths}
+    buffered = 0
+    next_blocks = dict.fromkeys(file_paths, 0)
+    writers = {}
+    if quarantine_dir is None and output_dir is not None:
+        quarantine_dir = os.path.join(output_dir, 'quarantine')
+    quarantines = {file_path: QuarantineWriter(file_path, quarantine_dir) for file_path in file_paths}
+    # Per-file partial counts, only added to pair_counts and recorded in the manifest once a file is complete,
+    # so that a file that fails halfway counts for nothing
+    file_pairs = {file_path: PairCounts() for file_path in file_paths} if pair_counts is not None or manifest is not None else {}
+    # Kept _id hashes of each file, recorded in the manifest so that a resumed run still sees them,
+    # or forgotten again if the file fails
+    file_ids = {file_path: [] for file_path in file_paths} if dedup is not None else {}
+    flush_from = 0
+    block_counts = {}
+    failed = set()
+    reported = set()
+    worker_stats = {}
+    file_stats = {file_path: {'rows': 0, 'matched': 0, 'start': None} for file_path in file_paths}
+    progress_bar = Progress(sum(os.path.getsize(file_path) for file_path in file_paths if os.path.exists(file_path)),
+                            'bytes', 'Extracting', enabled=progress)
+
+    def flush_file(file_path):
+        nonlocal buffered
+        buffer = reorder_buffers[file_path]
+        while next_blocks[file_path] in buffer:
+            results, hashes, bad_lines = buffer.pop(next_blocks[file_path])
+            buffered -= 1
+            quarantines[file_path].append(bad_lines)
+            if dedup is not None and file_path not in failed and results is not None:
+                first = dedup.keep_first(file_path, hashes)
+                results = results[first]
+                file_ids[file_path].append(hashes[first])
+                if pair_counts is not None or manifest is not None:
+                    add_pairs(file_path, count_pairs(results))
+            if file_path not in failed and results is not None and output_dir is not None:
+                if file_path not in writers:
+                    writers[file_path] = ShardWriter(file_path, output_dir, max_rows_per_file, output_format)
+                writers[file_path].append(results)
+            next_blocks[file_path] += 1
+
+    def flush(file_path):
+        nonlocal flush_from
+        if dedup is None:
+            flush_file(file_path)
+            return
+        # The first occurrence of an _id is kept, so blocks are written in file order whatever order they finish in
+        while flush_from < len(file_paths):
+            head = file_paths[flush_from]
+            flush_file(head)
+            if block_counts.get(head) != next_blocks[head]:
+                break
+            if head in failed:
+                # Later files must not lose POIs to the _ids of a file whose results are dropped
+                dedup.discard(head, file_ids.pop(head))
+            flush_from += 1
+
+    def add_pairs(file_path, pairs):
+        if file_path in file_pairs:
+            file_pairs[file_path].add(pairs)
+
+    def report_finished():
+        for file_path, n_blocks in block_counts.items():
+            if n_blocks == next_blocks[file_path] and file_path not in reported:
+                reported.add(file_path)
+                writer = writers.pop(file_path, None)
+                if writer is not None:
+                    writer.close()
+                if file_path in failed:
+                    # Drop the results of the blocks written before the failure, the file is redone on the next run
+                    for shard in writer.paths if writer else []:
+                        if os.path.exists(shard):
+                            os.remove(shard)
+                    writer = None
+                    if match_index is not None:
+                        match_index.clear(file_path)
+                else:
+                    counts = file_pairs.pop(file_path).to_frame() if file_path in file_pairs else None
+                    if pair_counts is not None and len(counts):
+                        pair_counts.add(counts)
+                duplicates = {}
+                if dedup is not None:
+                    duplicates['duplicates'] = dedup.removed.get(file_path, 0)
+                    if duplicates['duplicates'] > 0:
+                        print(f"Removed {duplicates['duplicates']} duplicate POIs from file {file_path}")
+                if manifest is not None and file_path not in failed:
+                    ids = np.concatenate(file_ids.pop(file_path) or [np.zeros(0, np.uint64)]) if dedup is not None else None
+                    manifest.record(file_path, counts, writer.paths if writer else [],
+                                    ids=ids, duplicates=duplicates.get('duplicates'))
+                file_pairs.pop(file_path, None)
+                file_ids.pop(file_path, None)
+                quarantine = quarantines[file_path]
+                if quarantine.count > 0:
+                    print(f"Skipped {quarantine.count} bad lines in file {file_path}" + (f", see {quarantine.path}" if quarantine.path else ""))
+                stats = file_stats[file_path]
+                events.emit('file', file=file_path, rows=stats['rows'], matched=stats['matched'], **duplicates,
+                            bad_lines=quarantine.count, shards=writer.paths if writer else [], failed=file_path in failed,
+                            seconds=round(time.perf_counter() - (stats['start'] or run_start), 4))
+
+    source = blocks()
+    # When removing duplicates the pairs are counted here, after the duplicates are gone
+    initargs = (matcher.artifact_path or matcher, output_dir is not None,
+                (pair_counts is not None or manifest is not None) and dedup is None,
+                index_dir, profile_file, profile_path, dedup is not None)
+    events.emit('start', files=len(file_paths), workers=max_workers, block_bytes=block_bytes)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=initargs) as executor:
+        pending = {}
+        exhausted = False
+        while True:
+            # Keep the queue fed up to max_pending blocks, counting the finished blocks that wait to be written:
+            # those wait for an earlier block that was submitted before them and is still pending
+            while not exhausted and len(pending) + buffered < max_pending:
+                task = next(source, None)
+                if task is None:
+                    exhausted = True
+                    break
+                pending[executor.submit(_extract_block, *task)] = (task[0], task[1], len(task[3]))
+                if file_stats[task[0]]['start'] is None:
+                    file_stats[task[0]]['start'] = time.perf_counter()
+            if not pending:
+                break
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                file_path, block_index, block_size = pending.pop(future)
+                progress_bar.update(block_size)
+                try:
+                    _, _, results, pairs, hashes, bad_lines, rows, matched, pid, busy = future.result()
+                except Exception as e:
+                    print(f"Error processing file {file_path}: {e}")
+                    events.error(e, file=file_path, block=block_index)
+                    failed.add(file_path)
+                    reorder_buffers[file_path][block_index] = (None, None, [])
+                    buffered += 1
+                    flush(file_path)
+                    continue
+                reorder_buffers[file_path][block_index] = (results, hashes, bad_lines)
+                buffered += 1
+                if pairs is not None and file_path not in failed:
+                    add_pairs(file_path, pairs)
+                stats = worker_stats.setdefault(pid, {'chunks': 0, 'rows': 0, 'busy': 0.0})
+                stats['chunks'] += 1
+                stats['rows'] += rows
+                stats['busy'] += busy
+                file_stats[file_path]['rows'] += rows
+                file_stats[file_path]['matched'] += matched
+                events.emit('chunk', file=file_path, block=block_index, rows=rows, matched=matched,
+                            bad_lines=len(bad_lines), seconds=round(busy, 4), worker=pid)
+                flush(file_path)
+            report_finished()
+    if dedup is not None:
+        flush(None)
+    report_finished()
+    progress_bar.close()
 
-def batch_process_csv(file_paths: List[str], batch_size: int, placesymbol_dict: Dict[str, int], output_dir: str, max_rows_per_file: int):
-    for i in range(0, len(file_paths), batch_size):
-        batch = file_paths[i:i + batch_size]
-        with concurrent.futures.ThreadPoolExecutor(max_workers=min(batch_size, os.cpu_count())) as executor:
-            futures = [executor.submit(process_csv, file_path, placesymbol_dict, output_dir, max_rows_per_file) for file_path in batch]
-            concurrent.futures.wait(futures)
+    run_seconds = time.perf_counter() - run_start
+    for pid, stats in sorted(worker_stats.items()):
+        rate = stats['rows'] / stats['busy'] if stats['busy'] > 0 else 0
+        print(f"Worker {pid}: {stats['chunks']} chunks, {stats['rows']} rows in {stats['busy']:.1f}s ({rate:.0f} rows/s)")
+        events.emit('worker', worker=pid, chunks=stats['chunks'], rows=stats['rows'], busy=round(stats['busy'], 4),
+                    utilization=round(stats['busy'] / run_seconds, 4) if run_seconds > 0 else None)
+    if profile_file is not None:
+        merged = merge_profiles(sorted(glob.glob(glob.escape(profile_path) + '.*.part')), profile_path)
+        if merged is not None:
+            print(f"Profile of {profile_file} written to {merged}, view it with python -m pstats {merged}")
+            events.emit('profile', file=profile_file, path=merged)
+    events.emit('run', files=len(file_paths), failed=len(failed),
+                rows=sum(stats['rows'] for stats in file_stats.values()),
+                matched=sum(stats['matched'] for stats in file_stats.values()),
+                bad_lines=sum(quarantine.count for quarantine in quarantines.values()),
+                **({'duplicates': sum(dedup.removed.values()), 'seen_ids_mb': round(dedup.seen.nbytes / 2**20, 1)}
+                   if dedup is not None else {}),
+                seconds=round(run_seconds, 4), peak_rss_mb=peak_rss_mb(), workers_peak_rss_mb=peak_rss_mb(children=True))
+    return worker_stats
 
-        gc.collect()
+if __name__ == '__main__':
+    starttime = time.time()
 
-# Load placesymbol_code.csv and create a dictionary
-placesymbol_code_file_path = 'data/output/placesymbol_code.csv'  # Update with actual path
-placesymbol_code_df = pd.read_csv(placesymbol_code_file_path)
-placesymbol_dict = placesymbol_code_df.set_index('placesymbol')['placecode'].to_dict()
+    # Load the dictionary compiled by SymbolDict.py, compiling placesymbol_code.csv again only if it has changed
+    placesymbol_code_file_path = 'data/output/placesymbol_code.csv'  # Update with actual path
+    matcher = SymbolMatcher.load_or_compile(placesymbol_code_file_path, 'data/output/placesymbol_code.pkl')
 
-# Directory where the CSV files are located
-csv_directory = r'C:\Users\jsj\Downloads\2018-POICSV-3'  # Update with the actual directory path
-output_dir = 'data/output/extractresult'  # Update with the actual output directory path
+    # Directory where the CSV files are located
+    csv_directory = r'C:\Users\jsj\Downloads\2018-POICSV-3'  # Update with the actual directory path
+    output_dir = 'data/output/extractresult'  # Update with the actual output directory path
+    output_format = 'csv'  # 'parquet' for compressed columnar shards (requires pyarrow)
+    # Files already processed with the same dictionary are skipped on the next run, set to None to redo everything
+    manifest_path = os.path.join(output_dir, 'manifest.json')
+    # Set to a directory prepared with MatchIndex.create(index_dir, superset symbols) to also keep all symbol hits,
+    # so that dictionary variants can be applied with extract_from_index without rescanning the POI files
+    index_dir = None
+    # Structured events of the run, one JSON object per line
+    events = EventLog(os.path.join(output_dir, 'events.jsonl'), stage='extraction')
+    # Set to one of the POI files to save a cProfile profile of its extraction
+    profile_file = None
+    # POIs of overlapping files are counted once: the first occurrence of each _id, in file name order, is kept
+    remove_duplicates = False
+    dedup = IdDedup() if remove_duplicates else None
 
-# List of file paths to process
-file_paths = glob.glob(os.path.join(csv_directory, '*.csv'))
+    # List of file paths to process
+    file_paths = sorted(glob.glob(os.path.join(csv_directory, '*.csv')))
 
-# Process the files in batches
-batch_size = 5  # Adjust based on your system's capability
-max_rows_per_file = 1000000  # One million rows per file
+    # Process the files with a pool of worker processes
+    max_workers = os.cpu_count()  # Adjust based on your system's capability
+    max_rows_per_file = 1000000  # One million rows per file
 
-batch_process_csv(file_paths, batch_size, placesymbol_dict, output_dir, max_rows_per_file)
+    parallel_process_csv(file_paths, matcher, output_dir, max_rows_per_file, max_workers=max_workers,
+                         output_format=output_format, manifest_path=manifest_path, index_dir=index_dir,
+                         events=events, profile_file=profile_file, dedup=dedup)
+    if dedup is not None:
+        # Next to the extraction results, not among them, so that SymbolicFlow does not read it as a shard
+        dedup.report().to_csv(os.path.join(os.path.dirname(output_dir), 'duplicates.csv'), index=False)
 
-end = time.time()
-print(f"Total time: {end - starttime} seconds")
+    end = time.time()
+    print(f"Total time: {end - starttime} seconds")
+    events.close()
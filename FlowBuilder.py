@@ -0,0 +1,408 @@
+"""
+Data description:
+                extraction results have fields name,_id,adcode,placesymbol,placecode
+                provincialcounties.csv is 省直辖县级行政单位的符号与编码
+                city_geocode.csv is 城市的地理编码, fields are fullname,adcode,gcj_x,gcj_y,wgs_x,wgs_y
+Function:
+                SymbolicFlow 中符号流构建的公共函数
+                规范化 adcode 和 placecode，构建 OD_code 并计数
+                normalize_od / count_od / merge_od_counts 为逐行实现，保留为 ODMatrix 的参照，tests/test_flow_builder.py 比较两者
+                对 (placecode, adcode) 计数后再规范化，与逐行规范化后计数的结果相同
+                为符号流添加城市名称与坐标
+                CityIndex 用预先计算的查找表把原始 adcode 映射为稠密的整数城市编号，
+                ODMatrix 在城市×城市的整数矩阵中累计计数，避免逐行构造字符串
+                FlowCube 按 (起点城市, 终点城市, 地名符号) 稀疏累计计数，只保存非零单元，
+                可汇总为 ODMatrix，或按符号、符号类型(mainname/alias/shortname)切片
+"""
+import os
+from typing import Iterable, List
+
+import numpy as np
+import pandas as pd
+
+from TableIO import write_table
+
+# 省会城市: 省级编码前4位 -> 省会城市编码前4位 (placecode)
+PROVINCIAL_CAPITALS = {
+    1300: 1301, 1400: 1401, 1500: 1501,
+    2100: 2101, 2200: 2201, 2300: 2301,
+    3200: 3201, 3300: 3301, 3400: 3401,
+    3500: 3501, 3600: 3601, 3700: 3701,
+    4100: 4101, 4200: 4201, 4300: 4301,
+    4400: 4401, 4500: 4501, 4600: 4601,
+    5100: 5101, 5200: 5201, 5300: 5301,
+    5400: 5401,
+    6100: 6101, 6200: 6201, 6300: 6301,
+    6400: 6401, 6500: 6501,
+}
+# 直辖市: 编码前2位 -> 城市编码前4位
+MUNICIPALITIES = {31: 3100, 11: 1100, 12: 1200, 50: 5000}
+
+
+def normalize_od(df_raw: pd.DataFrame, provincial_adcodes: Iterable[int], drop_local: bool = True) -> pd.DataFrame:
+    """
+        Normalize adcode and placecode to city level and add the 'OD_code' field.
+        Rows of provincial counties are removed, and so are local flows (adcode == placecode) when drop_local is set.
+    """
+    # 将省直辖县级市、港澳台纳入考虑范围之外
+    # 找出df中需要删除的行
+    provincial_adcodes = pd.Series(list(provincial_adcodes))
+    rows_to_delete = df_raw['placecode'].isin(provincial_adcodes) | df_raw['adcode'].isin(provincial_adcodes)
+    # 使用逻辑否定(~)来保留不需要删除的行
+    df = df_raw[~rows_to_delete].copy()
+
+    #将莱芜区370116处理为莱芜市371200
+    df['placecode'] = df['placecode'].astype(str).str[:6].replace('370116','371200')
+    # 截取adcode和placecode的前4位，并根据条件修改值，那曲地区5424处理为那曲市5406
+    df['adcode'] = df['adcode'].astype(str).str[:4].replace(['^31..', '^11..', '^12..', '^50..','5424'], ['3100', '1100', '1200', '5000','5406'], regex=True)#直辖市
+
+    df['placecode'] = df['placecode'].astype(str).str[:4].replace({
+        '1300': '1301', '1400': '1401', '1500': '1501', #省会城市
+        '2100': '2101', '2200': '2201', '2300': '2301', #省会城市
+        '3200': '3201', '3300': '3301', '3400': '3401', #省会城市
+        '3500': '3501', '3600': '3601', '3700': '3701', #省会城市
+        '4100': '4101', '4200': '4201', '4300': '4301', #省会城市
+        '4400': '4401', '4500': '4501', '4600': '4601', #省会城市
+        '5100': '5101', '5200': '5201', '5300': '5301', #省会城市
+        '5400': '5401',
+        '6100': '6101', '6200': '6201', '6300': '6301', #省会城市
+        '6400': '6401', '6500': '6501'#省会城市
+        })
+
+    df['placecode'] = df['placecode'].astype(str).str[:4].replace(['^31..', '^11..', '^12..', '^50..'], ['3100', '1100', '1200', '5000'], regex=True)#直辖市
+
+    # 删除adcode和placecode相同的行
+    if drop_local:
+        df = df[df['adcode'] != df['placecode']]
+
+    # 添加OD_code字段
+    df['OD_code'] = df['placecode'] + '00_' + df['adcode']+'00'
+
+    return df
+
+
+def count_od(df: pd.DataFrame) -> pd.DataFrame:
+    """
+        Count the OD_code of a normalized frame. Rows are weighted by 'count' if the frame has that field.
+    """
+    if 'count' in df.columns:
+        return df.groupby('OD_code', as_index=False)['count'].sum()
+    counts = df['OD_code'].value_counts().reset_index()
+    counts.columns = ['OD_code', 'count']
+    return counts
+
+
+def merge_od_counts(all_counts: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+        Merge the OD_code counts of several files into one count per OD_code, sorted by OD_code.
+    """
+    # 合并所有dataframe的OD_code计数
+    final_counts = pd.concat(all_counts, ignore_index=True).groupby('OD_code').sum().reset_index()
+    return final_counts
+
+
+def build_symbolflow(final_counts: pd.DataFrame, df_cities: pd.DataFrame) -> pd.DataFrame:
+    """
+        Add the name and coordinates of the origin and destination cities to the merged OD_code counts.
+    """
+    final_counts = final_counts.copy()
+    split_df = final_counts['OD_code'].str.split('_', expand=True)
+    final_counts['Ocity']= split_df[0].astype(int)
+    final_counts['Dcity']= split_df[1].astype(int)
+    #添加符号流的其他信息, Ocity, O_adcode, O_X, O_Y, Dcity, D_adcode, D_X, D_Y,
+    df_cities = df_cities.drop(['gcj_x','gcj_y'], axis=1)
+    merged_df = final_counts.merge(df_cities, left_on='Ocity', right_on='adcode',how='outer')
+    merged_df = merged_df.rename(columns={'fullname': 'Ocity_name','wgs_x':'O_X', 'wgs_y':'O_Y'})
+    df_symbolflow = merged_df.merge(df_cities, left_on='Dcity', right_on='adcode',how='outer')
+    df_symbolflow = df_symbolflow.rename(columns={'fullname': 'Dcity_name','wgs_x':'D_X', 'wgs_y':'D_Y'})
+    return df_symbolflow
+
+
+def count_pairs(results: pd.DataFrame, with_symbol: bool = False) -> pd.DataFrame:
+    """
+        Count the raw (placecode, adcode) pairs of extraction results, or (placecode, adcode, placesymbol)
+        triples with with_symbol, as a FlowCube needs.
+        The counts are all that flow building needs, and are much smaller than the results themselves.
+    """
+    keys = ['placecode', 'adcode', 'placesymbol'] if with_symbol else ['placecode', 'adcode']
+    return results.groupby(keys, observed=True).size().reset_index(name='count')
+
+
+class PairCounts:
+    """
+        Accumulate (placecode, adcode) counts from many chunks, merging them whenever the buffer grows large.
+    """
+
+    def __init__(self, compact_rows: int = 1000000):
+        self.compact_rows = compact_rows
+        self._parts: List[pd.DataFrame] = []
+        self._rows = 0
+
+    def add(self, counts: pd.DataFrame):
+        self._parts.append(counts)
+        self._rows += len(counts)
+        if self._rows > self.compact_rows:
+            self._compact()
+
+    def _compact(self):
+        if len(self._parts) > 1:
+            merged = pd.concat(self._parts, ignore_index=True).groupby(['placecode', 'adcode'], as_index=False)['count'].sum()
+            self._parts = [merged]
+            self._rows = len(merged)
+
+    def to_frame(self) -> pd.DataFrame:
+        self._compact()
+        if not self._parts:
+            return pd.DataFrame(columns=['placecode', 'adcode', 'count'])
+        return self._parts[0]
+
+
+def _prefix_maps():
+    """
+        Normalized 4-digit city code for every 4-digit prefix, for placecode (origin) and adcode (destination).
+        These are the rules of normalize_od expressed as integer lookup tables.
+    """
+    prefixes = np.arange(10000)
+    origin = prefixes.copy()
+    for province, capital in PROVINCIAL_CAPITALS.items():
+        origin[province] = capital
+    destination = prefixes.copy()
+    for head, city in MUNICIPALITIES.items():
+        origin[head * 100:(head + 1) * 100] = city
+        destination[head * 100:(head + 1) * 100] = city
+    #那曲地区5424处理为那曲市5406
+    destination[5424] = 5406
+    return origin, destination
+
+
+class CityIndex:
+    """
+        Map raw 6-digit adcodes to dense integer city indices with the rules of normalize_od.
+        Two precomputed tables of 1,000,000 entries give the normalized 4-digit city code of every
+        placecode and adcode (-1 for provincial counties), and a 10,000-entry table gives its index.
+        Indices are assigned in order of first appearance.
+    """
+
+    def __init__(self, provincial_adcodes: Iterable[int]):
+        origin_prefix, destination_prefix = _prefix_maps()
+        codes = np.arange(1000000)
+        self.origin_lut = origin_prefix[codes // 100].astype(np.int16)
+        self.destination_lut = destination_prefix[codes // 100].astype(np.int16)
+        #将莱芜区370116处理为莱芜市371200
+        self.origin_lut[370116] = origin_prefix[3712]
+        # 将省直辖县级市、港澳台纳入考虑范围之外
+        provincial = np.asarray([code for code in provincial_adcodes if 0 <= code < 1000000], dtype=np.int64)
+        self.origin_lut[provincial] = -1
+        self.destination_lut[provincial] = -1
+        # codes[i] is the normalized 4-digit code of city i
+        self.codes: List[int] = []
+        self._positions = np.full(10000, -1, dtype=np.int32)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def _lookup(self, raw_codes, lut: np.ndarray) -> np.ndarray:
+        if pd.api.types.is_integer_dtype(getattr(raw_codes, 'dtype', None)):
+            # Integer codes, such as those of extract_matches, are used as they are
+            raw_codes = np.asarray(raw_codes, dtype=np.int64)
+        else:
+            raw_codes = pd.to_numeric(pd.Series(raw_codes), errors='coerce').to_numpy(dtype=np.float64)
+        # Only 6-digit codes are valid adcodes
+        valid = (raw_codes >= 100000) & (raw_codes < 1000000)
+        prefix = np.full(len(raw_codes), -1, dtype=np.int32)
+        prefix[valid] = lut[raw_codes[valid].astype(np.int64)]
+        return prefix
+
+    def index(self, prefix: np.ndarray) -> np.ndarray:
+        """
+            Dense indices of normalized 4-digit city codes, adding codes not seen before. -1 stays -1.
+        """
+        valid = prefix >= 0
+        unseen = pd.unique(prefix[valid & (self._positions[np.where(valid, prefix, 0)] < 0)])
+        for code in unseen:
+            self._positions[code] = len(self.codes)
+            self.codes.append(int(code))
+        return np.where(valid, self._positions[np.where(valid, prefix, 0)], -1)
+
+    def origin_index(self, placecodes) -> np.ndarray:
+        return self.index(self._lookup(placecodes, self.origin_lut))
+
+    def destination_index(self, adcodes) -> np.ndarray:
+        return self.index(self._lookup(adcodes, self.destination_lut))
+
+
+class ODMatrix:
+    """
+        Accumulate symbol flow counts in a dense city x city integer matrix, rows are origins (placecode)
+        and columns destinations (adcode). Local flows stay on the diagonal.
+    """
+
+    def __init__(self, city_index: CityIndex):
+        self.city_index = city_index
+        self.counts = np.zeros((0, 0), dtype=np.int64)
+
+    def add(self, placecodes, adcodes, weights=None):
+        """
+            Add raw (placecode, adcode) rows, each counted once or weighted by weights.
+            Returns the counts that were added and, of those, the local flows; the rest of the rows
+            belong to provincial counties or have codes that do not map to a city.
+        """
+        origin = self.city_index.origin_index(placecodes)
+        destination = self.city_index.destination_index(adcodes)
+        n = len(self.city_index)
+        if n > len(self.counts):
+            grown = np.zeros((n, n), dtype=np.int64)
+            grown[:len(self.counts), :len(self.counts)] = self.counts
+            self.counts = grown
+        keep = (origin >= 0) & (destination >= 0)
+        weights = None if weights is None else np.asarray(weights, dtype=np.int64)[keep]
+        cells = np.bincount(origin[keep] * n + destination[keep], weights=weights, minlength=n * n)
+        cells = cells.reshape(n, n).astype(np.int64)
+        self.counts += cells
+        return int(cells.sum()), int(np.trace(cells))
+
+    def to_od_counts(self, drop_local: bool = True, local_only: bool = False) -> pd.DataFrame:
+        """
+            The merged OD_code counts, as merge_od_counts returns them.
+            drop_local leaves out the local flows (adcode == placecode), local_only keeps nothing else.
+        """
+        counts = self.counts
+        if local_only:
+            counts = np.diag(np.diag(counts))
+        elif drop_local:
+            counts = counts.copy()
+            np.fill_diagonal(counts, 0)
+        origin, destination = np.nonzero(counts)
+        codes = np.asarray(self.city_index.codes, dtype=np.int64)
+        od_code = pd.Series(codes[origin] * 100).astype(str) + '_' + pd.Series(codes[destination] * 100).astype(str)
+        final_counts = pd.DataFrame({'OD_code': od_code, 'count': counts[origin, destination]})
+        return final_counts.sort_values('OD_code').reset_index(drop=True)
+
+
+# Upper bound of the number of cities of a CityIndex, whose positions table has 10,000 entries
+CITY_CAPACITY = 10000
+
+
+class FlowCube:
+    """
+        Sparse (origin city, destination city, placesymbol) counts.
+        Cells are int64 keys ((origin * CITY_CAPACITY + destination) * number of symbols + symbol id), kept sorted
+        and unique with their counts, so memory grows with the number of non-zero cells only.
+        Symbol ids are positions in df_symbols (placesymbol_code.csv); its symboltype column, if present,
+        gives the type of each symbol.
+    """
+
+    def __init__(self, city_index: CityIndex, df_symbols: pd.DataFrame, compact_cells: int = 1000000):
+        self.city_index = city_index
+        # The last code of a repeated placesymbol wins in the dictionary, so does its type
+        df_symbols = df_symbols[df_symbols['placesymbol'].apply(lambda symbol: isinstance(symbol, str))]
+        df_symbols = df_symbols.drop_duplicates('placesymbol', keep='last')
+        self.symbols = pd.Index(df_symbols['placesymbol'])
+        if 'symboltype' in df_symbols.columns:
+            self.symbol_types = df_symbols['symboltype'].to_numpy(dtype=object)
+        else:
+            self.symbol_types = np.full(len(self.symbols), None, dtype=object)
+        self.compact_cells = compact_cells
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.values = np.zeros(0, dtype=np.int64)
+        self._parts = []
+        self._pending = 0
+
+    def add(self, placecodes, adcodes, placesymbols, weights=None):
+        """
+            Add raw (placecode, adcode, placesymbol) rows, each counted once or weighted by weights.
+            placesymbols may be strings or a categorical, as extract_matches gives them.
+            Rows of provincial counties and of symbols not in df_symbols are left out.
+        """
+        origin = self.city_index.origin_index(placecodes)
+        destination = self.city_index.destination_index(adcodes)
+        placesymbols = pd.Series(placesymbols)
+        if isinstance(placesymbols.dtype, pd.CategoricalDtype):
+            # Map the categories once instead of every row
+            codes = placesymbols.cat.codes.to_numpy()
+            symbol = np.where(codes >= 0, self.symbols.get_indexer(placesymbols.cat.categories)[codes], -1)
+        else:
+            symbol = self.symbols.get_indexer(placesymbols.astype(object))
+        keep = (origin >= 0) & (destination >= 0) & (symbol >= 0)
+        keys = (origin[keep].astype(np.int64) * CITY_CAPACITY + destination[keep]) * len(self.symbols) + symbol[keep]
+        weights = np.ones(len(keys), dtype=np.int64) if weights is None else np.asarray(weights, dtype=np.int64)[keep]
+        self._parts.append((keys, weights))
+        self._pending += len(keys)
+        if self._pending > self.compact_cells:
+            self._compact()
+
+    def _compact(self):
+        if not self._parts:
+            return
+        keys = np.concatenate([self.keys] + [keys for keys, _ in self._parts])
+        values = np.concatenate([self.values] + [values for _, values in self._parts])
+        self.keys, inverse = np.unique(keys, return_inverse=True)
+        self.values = np.bincount(inverse, weights=values, minlength=len(self.keys)).astype(np.int64)
+        self._parts = []
+        self._pending = 0
+
+    def __len__(self):
+        self._compact()
+        return len(self.keys)
+
+    def cells(self, symbol_types: Iterable[str] = None, symbols: Iterable[str] = None):
+        """
+            (origin, destination, symbol id, count) arrays of the non-zero cells,
+            only of the given symbol types and/or symbols when these are given.
+        """
+        self._compact()
+        n_symbols = max(len(self.symbols), 1)
+        od, symbol = np.divmod(self.keys, n_symbols)
+        keep = np.ones(len(self.keys), dtype=bool)
+        if symbol_types is not None:
+            keep &= np.isin(self.symbol_types[symbol], list(symbol_types))
+        if symbols is not None:
+            keep &= np.isin(symbol, self.symbols.get_indexer(list(symbols)))
+        od, symbol = od[keep], symbol[keep]
+        return od // CITY_CAPACITY, od % CITY_CAPACITY, symbol, self.values[keep]
+
+    def to_od_matrix(self, symbol_types: Iterable[str] = None, symbols: Iterable[str] = None) -> ODMatrix:
+        """
+            Roll the symbols up into an ODMatrix, of all symbols or of a slice of them.
+            Over all symbols this is the matrix SymbolicFlow builds from the same rows.
+        """
+        origin, destination, _, count = self.cells(symbol_types, symbols)
+        od_matrix = ODMatrix(self.city_index)
+        n = len(self.city_index)
+        od_matrix.counts = np.bincount(origin * n + destination, weights=count, minlength=n * n).reshape(n, n).astype(np.int64)
+        return od_matrix
+
+    def to_frame(self, drop_local: bool = True, local_only: bool = False,
+                 symbol_types: Iterable[str] = None, symbols: Iterable[str] = None) -> pd.DataFrame:
+        """
+            The counts per OD_code and placesymbol, with the symboltype, sorted by OD_code and placesymbol.
+            drop_local and local_only select the flows as in ODMatrix.to_od_counts.
+        """
+        origin, destination, symbol, count = self.cells(symbol_types, symbols)
+        if local_only:
+            keep = origin == destination
+        elif drop_local:
+            keep = origin != destination
+        else:
+            keep = np.ones(len(origin), dtype=bool)
+        origin, destination, symbol, count = origin[keep], destination[keep], symbol[keep], count[keep]
+        codes = np.asarray(self.city_index.codes, dtype=np.int64)
+        od_code = pd.Series(codes[origin] * 100).astype(str) + '_' + pd.Series(codes[destination] * 100).astype(str)
+        df = pd.DataFrame({'OD_code': od_code, 'placesymbol': self.symbols.to_numpy()[symbol], 'symboltype': self.symbol_types[symbol],
+                           'count': count})
+        return df.sort_values(['OD_code', 'placesymbol']).reset_index(drop=True)
+
+
+def write_symbolflows(od_matrix: ODMatrix, df_cities: pd.DataFrame, output_dir: str, output_format: str = 'csv'):
+    """
+        Write all symbol flow variants from one accumulated matrix:
+        OD_code_counts and Symbolicflows without local flows, Symbolicflows_withlocal with them,
+        and Symbolicflows_local with the local flows only, as csv or parquet files.
+    """
+    final_counts = od_matrix.to_od_counts(drop_local=True)
+    write_table(final_counts, os.path.join(output_dir, 'OD_code_counts.csv'), output_format)
+    write_table(build_symbolflow(final_counts, df_cities), os.path.join(output_dir, 'Symbolicflows.csv'), output_format)
+    withlocal_counts = od_matrix.to_od_counts(drop_local=False)
+    write_table(build_symbolflow(withlocal_counts, df_cities), os.path.join(output_dir, 'Symbolicflows_withlocal.csv'), output_format)
+    local_counts = od_matrix.to_od_counts(local_only=True)
+    write_table(build_symbolflow(local_counts, df_cities), os.path.join(output_dir, 'Symbolicflows_local.csv'), output_format)
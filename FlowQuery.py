@@ -0,0 +1,287 @@
+"""
+Data description:
+                Symbolicflows.csv is 符号流, fields include OD_code,count,Ocity,Dcity,Ocity_name,O_X,O_Y,Dcity_name,D_X,D_Y
+                city_od_metrics.csv is 城市指标, fields are cityname and the metric columns
+Function:
+                符号流与城市指标的查询服务
+                一次性建立按起点和按终点的 CSR 邻接索引(整数城市编号，每行按计数降序)与城市指标矩阵，保存为 .npy，
+                之后以内存映射方式加载，源文件变化(内容哈希不同)时自动重建
+                查询：渗透到城市X的前k个起点城市、城市X的符号流按距离段的分布、一组城市的指标
+                提供 Python 接口(FlowQuery)、本地 HTTP 接口和延迟基准测试
+
+                python FlowQuery.py build
+                python FlowQuery.py serve --port 8765     (GET /top_origins?city=440100&k=10 ...)
+                python FlowQuery.py benchmark
+"""
+import os
+import json
+import time
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Sequence, Union
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+import pandas as pd
+
+from CitiesAttributes import haversine_distances
+from Manifest import file_sha256
+from TableIO import read_table
+
+QUERY_INDEX_VERSION = 1
+DEFAULT_BANDS = (0, 100, 300, 500, 1000, 2000)
+_ARRAYS = ['adcodes', 'out_indptr', 'out_city', 'out_count', 'out_distance',
+           'in_indptr', 'in_city', 'in_count', 'in_distance', 'metric_values']
+
+City = Union[int, str]
+
+
+def _csr(rows: np.ndarray, cols: np.ndarray, counts: np.ndarray, distances: np.ndarray, n: int):
+    """
+        CSR adjacency of the flows grouped by rows, each row sorted by count, largest first.
+    """
+    order = np.lexsort((cols, -counts, rows))
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+    return indptr, cols[order].astype(np.int32), counts[order], distances[order].astype(np.float32)
+
+
+def _name_ids(names: List[str]) -> Dict[str, int]:
+    name_ids = {}
+    for city_id, name in enumerate(names):
+        if name:
+            name_ids.setdefault(name, city_id)
+    return name_ids
+
+
+class FlowQuery:
+    """
+        Read-only queries over the symbol flows and city metrics, answered from memory-mapped CSR indexes.
+        City ids are positions in adcodes; cities are given by adcode or by full name.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray], names: List[str], metric_columns: List[str]):
+        for name in _ARRAYS:
+            setattr(self, name, arrays[name])
+        self.names = names
+        self.metric_columns = metric_columns
+        self._ids = {int(adcode): city_id for city_id, adcode in enumerate(self.adcodes)}
+        self._ids_by_name = _name_ids(names)
+
+    @classmethod
+    def build(cls, flows_path: str, metrics_path: str, index_dir: str) -> 'FlowQuery':
+        """
+            Build the indexes from Symbolicflows and city_od_metrics and save them in index_dir.
+        """
+        df = read_table(flows_path)
+        # Rows left by the outer merges in SymbolicFlow have no count
+        df = df.dropna(subset=['count', 'Ocity', 'Dcity'])
+        cities = pd.concat([df[['Ocity', 'Ocity_name']].set_axis(['adcode', 'name'], axis=1),
+                            df[['Dcity', 'Dcity_name']].set_axis(['adcode', 'name'], axis=1)])
+        cities = cities.drop_duplicates('adcode').sort_values('adcode')
+        adcodes = cities['adcode'].to_numpy(dtype=np.int64)
+        names = [name if isinstance(name, str) else '' for name in cities['name']]
+        origin = np.searchsorted(adcodes, df['Ocity'].to_numpy(dtype=np.int64))
+        destination = np.searchsorted(adcodes, df['Dcity'].to_numpy(dtype=np.int64))
+        counts = df['count'].to_numpy(dtype=np.int64)
+        distances = haversine_distances(*(df[column].to_numpy(dtype=np.float64) for column in ['O_X', 'O_Y', 'D_X', 'D_Y']))
+
+        n = len(adcodes)
+        arrays = {'adcodes': adcodes}
+        out_csr = _csr(origin, destination, counts, distances, n)
+        in_csr = _csr(destination, origin, counts, distances, n)
+        for direction, csr in [('out', out_csr), ('in', in_csr)]:
+            for name, array in zip(['indptr', 'city', 'count', 'distance'], csr):
+                arrays[f'{direction}_{name}'] = array
+
+        df_metrics = read_table(metrics_path)
+        metric_columns = [column for column in df_metrics.columns
+                          if column != 'cityname' and pd.api.types.is_numeric_dtype(df_metrics[column])]
+        metrics = np.full((n, len(metric_columns)), np.nan)
+        # The metrics are keyed by city name, which the first city of that name gets
+        name_ids = _name_ids(names)
+        rows = np.array([name_ids.get(name, -1) for name in df_metrics['cityname']], dtype=np.int64)
+        known = rows >= 0
+        metrics[rows[known]] = df_metrics.loc[known, metric_columns].to_numpy(dtype=np.float64)
+        arrays['metric_values'] = metrics
+
+        os.makedirs(index_dir, exist_ok=True)
+        for name, array in arrays.items():
+            # Write then rename, so that an interrupted build never leaves a half written index
+            tmp_path = os.path.join(index_dir, f'{name}.tmp.npy')
+            np.save(tmp_path, array)
+            os.replace(tmp_path, os.path.join(index_dir, f'{name}.npy'))
+        metadata = {'version': QUERY_INDEX_VERSION, 'names': names, 'metric_columns': metric_columns,
+                    'flows_sha256': file_sha256(flows_path), 'metrics_sha256': file_sha256(metrics_path)}
+        with open(os.path.join(index_dir, 'flowquery.json'), 'w', encoding='utf-8') as f:
+            json.dump(metadata, f, ensure_ascii=False)
+        return cls(arrays, names, metric_columns)
+
+    @classmethod
+    def load(cls, flows_path: str, metrics_path: str, index_dir: str) -> 'FlowQuery':
+        """
+            Memory-map the indexes from index_dir, rebuilding them first if either source file has changed.
+        """
+        try:
+            with open(os.path.join(index_dir, 'flowquery.json'), encoding='utf-8') as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            metadata = {}
+        if (metadata.get('version') != QUERY_INDEX_VERSION or metadata.get('flows_sha256') != file_sha256(flows_path)
+                or metadata.get('metrics_sha256') != file_sha256(metrics_path)):
+            return cls.build(flows_path, metrics_path, index_dir)
+        arrays = {name: np.load(os.path.join(index_dir, f'{name}.npy'), mmap_mode='r') for name in _ARRAYS}
+        return cls(arrays, metadata['names'], metadata['metric_columns'])
+
+    def city_id(self, city: City) -> int:
+        """
+            Id of a city given by adcode (int or digit string) or full name. Raises KeyError for unknown cities.
+        """
+        if isinstance(city, str) and not city.isdigit():
+            return self._ids_by_name[city]
+        return self._ids[int(city)]
+
+    def _city(self, city_id: int) -> Dict:
+        return {'adcode': int(self.adcodes[city_id]), 'name': self.names[city_id]}
+
+    def _top(self, indptr, cities, counts, city: City, k: int) -> List[Dict]:
+        city_id = self.city_id(city)
+        start = indptr[city_id]
+        end = min(indptr[city_id + 1], start + k)
+        return [dict(self._city(other), count=int(count)) for other, count in zip(cities[start:end], counts[start:end])]
+
+    def top_origins(self, city: City, k: int = 10) -> List[Dict]:
+        """
+            The k origin cities whose symbols appear most often in city, with their counts.
+        """
+        return self._top(self.in_indptr, self.in_city, self.in_count, city, k)
+
+    def top_destinations(self, city: City, k: int = 10) -> List[Dict]:
+        """
+            The k destination cities in which the symbols of city appear most often, with their counts.
+        """
+        return self._top(self.out_indptr, self.out_city, self.out_count, city, k)
+
+    def outflow_by_distance(self, city: City, bands: Sequence[float] = DEFAULT_BANDS) -> List[Dict]:
+        """
+            Outgoing flow counts of city per distance band in km, [bands[i], bands[i + 1]), the last band open ended.
+        """
+        city_id = self.city_id(city)
+        start, end = self.out_indptr[city_id], self.out_indptr[city_id + 1]
+        distances, counts = self.out_distance[start:end], self.out_count[start:end]
+        band = np.searchsorted(bands, distances, side='right') - 1
+        # Flows shorter than the first band or without coordinates are left out
+        keep = (band >= 0) & ~np.isnan(distances)
+        totals = np.bincount(band[keep], weights=counts[keep], minlength=len(bands))
+        uppers = list(bands[1:]) + [None]
+        return [{'from_km': lower, 'to_km': upper, 'count': int(total)} for lower, upper, total in zip(bands, uppers, totals)]
+
+    def metrics(self, cities: Sequence[City]) -> List[Dict]:
+        """
+            The metrics of each city, None where a metric has no value.
+        """
+        rows = []
+        for city in cities:
+            city_id = self.city_id(city)
+            values = self.metric_values[city_id]
+            rows.append(dict(self._city(city_id), **{column: None if np.isnan(value) else float(value)
+                                                    for column, value in zip(self.metric_columns, values)}))
+        return rows
+
+
+def make_handler(flow_query: FlowQuery):
+    """
+        HTTP handler answering GET /top_origins, /top_destinations, /outflow_by_distance and /metrics with JSON.
+        Errors are answered with {'error': ...}: 404 for unknown cities and paths, 400 for bad parameters, 500 otherwise.
+    """
+
+    class FlowQueryHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            try:
+                if url.path == '/top_origins':
+                    result = flow_query.top_origins(params['city'], int(params.get('k', 10)))
+                elif url.path == '/top_destinations':
+                    result = flow_query.top_destinations(params['city'], int(params.get('k', 10)))
+                elif url.path == '/outflow_by_distance':
+                    bands = [float(band) for band in params['bands'].split(',')] if 'bands' in params else DEFAULT_BANDS
+                    result = flow_query.outflow_by_distance(params['city'], bands)
+                elif url.path == '/metrics':
+                    result = flow_query.metrics(params['cities'].split(','))
+                else:
+                    self._send(404, {'error': f'unknown path {url.path}'})
+                    return
+            except KeyError as e:
+                self._send(404, {'error': f'unknown city or missing parameter {e}'})
+                return
+            except ValueError as e:
+                self._send(400, {'error': str(e)})
+                return
+            except Exception as e:
+                # Any other failure still gets a JSON answer instead of a dropped connection
+                self._send(500, {'error': f'{type(e).__name__}: {e}'})
+                return
+            self._send(200, result)
+
+        def _send(self, status: int, body):
+            payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return FlowQueryHandler
+
+
+def benchmark(flow_query: FlowQuery, n_queries: int = 10000, k: int = 10, seed: int = 0) -> pd.DataFrame:
+    """
+        Latency of each query type over n_queries random cities, in microseconds.
+    """
+    rng = np.random.default_rng(seed)
+    adcodes = [int(adcode) for adcode in flow_query.adcodes]
+    queries = {
+        'top_origins': lambda city: flow_query.top_origins(city, k),
+        'top_destinations': lambda city: flow_query.top_destinations(city, k),
+        'outflow_by_distance': lambda city: flow_query.outflow_by_distance(city),
+        'metrics (10 cities)': lambda city: flow_query.metrics(adcodes[:9] + [city]),
+    }
+    rows = []
+    for name, query in queries.items():
+        latencies = np.empty(n_queries)
+        for i, city_id in enumerate(rng.integers(len(adcodes), size=n_queries)):
+            start = time.perf_counter()
+            query(adcodes[city_id])
+            latencies[i] = time.perf_counter() - start
+        latencies *= 1e6
+        rows.append({'query': name, 'mean_us': latencies.mean(), 'p50_us': np.percentile(latencies, 50),
+                     'p99_us': np.percentile(latencies, 99), 'max_us': latencies.max()})
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Query symbol flows and city metrics')
+    parser.add_argument('command', choices=['build', 'serve', 'benchmark'])
+    parser.add_argument('--flows', default='data/output/Symbolicflows.csv')
+    parser.add_argument('--metrics', default='data/output/city_od_metrics.csv')
+    parser.add_argument('--index', default='data/output/flowquery')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        flow_query = FlowQuery.build(args.flows, args.metrics, args.index)
+        print(f"Indexed {len(flow_query.adcodes)} cities and {len(flow_query.out_city)} flows in {args.index}")
+    else:
+        starttime = time.time()
+        flow_query = FlowQuery.load(args.flows, args.metrics, args.index)
+        print(f"Loaded in {(time.time() - starttime) * 1000:.1f} ms")
+        if args.command == 'benchmark':
+            print(benchmark(flow_query).to_string(index=False, float_format='%.1f'))
+        else:
+            server = ThreadingHTTPServer(('127.0.0.1', args.port), make_handler(flow_query))
+            print(f"Serving on http://127.0.0.1:{args.port}")
+            server.serve_forever()
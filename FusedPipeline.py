@@ -0,0 +1,81 @@
+"""
+Data description:
+                placesymbol_code.csv is 地名符号与地名编号的映射字典, fields are 'placesymbol', 'placecode'.
+                csv_directory is documentary of POI files
+                city_geocode.csv is 城市的地理编码
+Function:
+                从原始POI文件直接构建符号流，不经过 extractresult 中间csv文件
+                各进程提取地名符号后只返回 (placecode, adcode) 计数，在内存中合并
+                将合并后的计数映射为城市编号并在城市×城市矩阵中累计，再构建 OD_code，结果与 ExtractPlaceSymbol + SymbolicFlow 相同
+                可选地同时写出逐条POI的提取结果
+"""
+import os
+import glob
+import time
+from typing import Iterable, List
+
+import pandas as pd
+
+from SymbolMatcher import SymbolMatcher
+from ExtractPlaceSymbol import parallel_process_csv
+from FlowBuilder import PairCounts, CityIndex, ODMatrix, write_symbolflows
+from Instrumentation import EventLog
+from PoiDedup import IdDedup
+
+
+def build_od_matrix_from_poi(file_paths: List[str], matcher: SymbolMatcher, provincial_adcodes: Iterable[int],
+                             output_dir: str = None, max_rows_per_file: int = 1000000, max_workers: int = None,
+                             output_format: str = 'csv', manifest_path: str = None,
+                             events: EventLog = None, dedup: IdDedup = None) -> ODMatrix:
+    """
+        Go from raw POI files to the city x city count matrix in one pass, local flows included.
+        The per-POI extraction results are only written when output_dir is given, as csv or parquet shards.
+        With manifest_path only new or changed POI files are processed, see parallel_process_csv.
+        events receives the extraction events and a 'flows' event with the matched POIs dropped as
+        provincial counties and the local flows.
+        With dedup, POIs whose _id appears in several files are only counted once, see parallel_process_csv.
+    """
+    events = events or EventLog()
+    pair_counts = PairCounts()
+    parallel_process_csv(file_paths, matcher, output_dir, max_rows_per_file, max_workers=max_workers,
+                         pair_counts=pair_counts, output_format=output_format, manifest_path=manifest_path,
+                         events=events, dedup=dedup)
+    pairs = pair_counts.to_frame()
+    od_matrix = ODMatrix(CityIndex(provincial_adcodes))
+    kept, local = od_matrix.add(pairs['placecode'], pairs['adcode'], weights=pairs['count'])
+    rows = int(pairs['count'].sum())
+    events.emit('flows', rows=rows, provincial=rows - kept, local=local)
+    return od_matrix
+
+
+if __name__ == '__main__':
+    starttime = time.time()
+
+    # Load the compiled dictionary shared by all files, compiling it first if placesymbol_code.csv has changed
+    matcher = SymbolMatcher.load_or_compile('data/output/placesymbol_code.csv', 'data/output/placesymbol_code.pkl')
+    #读取省直辖县级行政单位的符号与编码
+    df_provincialcounties = pd.read_csv('data/input/provincialcounties.csv', header=0)
+
+    # Directory where the CSV files are located
+    csv_directory = r'C:\Users\jsj\Downloads\2018-POICSV-3'  # Update with the actual directory path
+    file_paths = sorted(glob.glob(os.path.join(csv_directory, '*.csv')))
+    # Set to 'data/output/extractresult' to also keep the per-POI extraction results
+    output_dir = None
+    output_format = 'csv'  # 'parquet' for compressed columnar files (requires pyarrow)
+    # Per-file partial counts of earlier runs are reused for unchanged files, set to None to redo everything
+    manifest_path = 'data/output/poi_manifest.json'
+    # Set to IdDedup() to count the POIs of overlapping files once
+    dedup = None
+
+    events = EventLog('data/output/events.jsonl', stage='fused')
+    od_matrix = build_od_matrix_from_poi(file_paths, matcher, df_provincialcounties['adcode'], output_dir=output_dir,
+                                         output_format=output_format, manifest_path=manifest_path, events=events,
+                                         dedup=dedup)
+
+    df_cities = pd.read_csv('data/output/city_geocode.csv', header=0)
+    write_symbolflows(od_matrix, df_cities, 'data/output', output_format=output_format)
+    if dedup is not None:
+        dedup.report().to_csv('data/output/duplicates.csv', index=False)
+
+    print(f"Total time: {time.time() - starttime} seconds")
+    events.close()
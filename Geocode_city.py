@@ -1,62 +1,171 @@
 import os
+import json
+import time
+import threading
+import concurrent.futures
 import requests
+from requests.adapters import HTTPAdapter
+import numpy as np
 import pandas as pd
-from chinacoordtran import gcj02towgs84
-def get_city_info(row, amap_key):
-    city_name = row['fullname']  
-    try:
-        url = f'https://restapi.amap.com/v3/geocode/geo?address={city_name}&output=JSON&key={amap_key}'
-        response = requests.get(url)
-        data = response.json()
-        if data and data['geocodes']:
-            location = data['geocodes'][0]['location'].split(',')
-            lng, lat = map(float, location)
-            wgs84_lng, wgs84_lat = gcj02_to_wgs84(lng, lat)
-            return {
-                #'city_name': city_name,  # 添加城市名称
-                #'adcode': data['geocodes'][0]['adcode'],
-                'gcj_x': lng,
-                'gcj_y': lat,
-                'wgs_x': wgs84_lng,
-                'wgs_y': wgs84_lat,
-                    
-            }
-        else:
-            return None
-    except Exception as e:
-        print(f"Error fetching data for {city_name}: {e}")
-        return None
-    
+from CoordTransform import gcj02_to_wgs84_batch
 def gcj02_to_wgs84(lng, lat):
-    gcj02towgs84Instance = gcj02towgs84()
-    result =gcj02towgs84Instance.CoordTran(lng, lat)
-    return(result.X, result.Y)
-df= pd.read_csv('data\input\AMap_adcode.csv', header=0)
-# 提取直辖市和地级市
-# 直辖市条件：adcode以00结尾，且为110000、120000、310000、500000之一
-# 地级市条件：adcode以00结尾，但不是110000、120000、310000、500000
-direct_municipalities = df[df['adcode'].isin([110000, 120000, 310000, 500000])]
-prefecture_level_cities = df[(df['adcode'] % 100 == 0) & ~df['adcode'].isin([110100, 120100, 310100, 500100]) & (df['adcode'] % 10000 != 0)]
-# 合并直辖市和地级市
-df_cities = pd.concat([direct_municipalities, prefecture_level_cities]).reset_index(drop=True)
-# 删除重庆市郊县
-df_cities = df_cities[~df_cities['fullname'].str.contains('重庆市郊县')]
-#城市的地理编码
-amap_key = '7a4a38d38a85569db6bb34c536a7f45b'#'您的高德API Key'
-# df_cities.to_csv('data/test.csv')
-df_cities[['gcj_x','gcj_y','wgs_x','wgs_y']] = df_cities.apply(get_city_info, args=(amap_key,),axis=1, result_type='expand')
-
-#更新莱芜市信息,高德api返回的莱芜市地理编码与济南市相同
-# 为每列指定更新值
-update_values = {'gcj_x':117.675828,'gcj_y':36.214895,'wgs_x':117.66994899263214, 'wgs_y':36.21489948744972}  # 根据需要添加更多列
-# 更新fullname为'莱芜市'的行
-df_cities.loc[df_cities['fullname'] == '莱芜市', list(update_values.keys())] = list(update_values.values())
-
-# 导出为CSV文件
-output_file_path = 'data\output\city_geocode.csv'
-# 检查目录是否存在，如果不存在则创建
-output_dir = os.path.dirname(output_file_path)
-if not os.path.exists(output_dir):
-    os.makedirs(output_dir)
-df_cities.to_csv(output_file_path, index=False)
-print(f"城市信息已导出到 {output_file_path}")
+    # 单点转换，与批量转换共用 CoordTransform 中的公式
+    wgs84_lng, wgs84_lat = gcj02_to_wgs84_batch(lng, lat)
+    return(float(wgs84_lng), float(wgs84_lat))
+
+class RateLimiter:
+    """
+    Thread-safe limiter that spaces requests at least 1/qps seconds apart.
+    """
+    def __init__(self, qps):
+        self.interval = 1.0 / qps if qps else 0.0
+        self._lock = threading.Lock()
+        self._next_time = 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_time)
+            self._next_time = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+class GeocodeClient:
+    """
+    AMap geocoding client with a pooled session, a bounded number of requests in flight,
+    a QPS limit, retry with exponential backoff and an on-disk cache keyed by fullname.
+    The cache stores the GCJ-02 'location' of the first geocode, or null when AMap found nothing,
+    so reruns only hit the network for names that are not cached yet.
+    """
+    # AMap infocodes worth retrying: QPS / concurrency limits exceeded and service busy
+    RETRY_INFOCODES = {'10004', '10014', '10019', '10020', '10021', '10022', '10029'}
+
+    def __init__(self, amap_key, base_url='https://restapi.amap.com', cache_path=None,
+                 max_in_flight=8, qps=50, max_retries=3, backoff=0.5, timeout=10):
+        self.amap_key = amap_key
+        self.url = base_url.rstrip('/') + '/v3/geocode/geo'
+        self.cache_path = cache_path
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.rate_limiter = RateLimiter(qps)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_in_flight)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.cache = {}
+        if cache_path and os.path.exists(cache_path):
+            with open(cache_path, encoding='utf-8') as f:
+                self.cache = json.load(f)
+        self._cache_lock = threading.Lock()
+
+    def save_cache(self):
+        if not self.cache_path:
+            return
+        cache_dir = os.path.dirname(self.cache_path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = self.cache_path + '.tmp'
+        with self._cache_lock, open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.cache, f, ensure_ascii=False, indent=0)
+        os.replace(tmp_path, self.cache_path)
+
+    def _fetch_location(self, city_name):
+        """
+        Query AMap for one name, retrying transient failures. Returns the 'lng,lat' string or None.
+        """
+        params = {'address': city_name, 'output': 'JSON', 'key': self.amap_key}
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.wait()
+            try:
+                response = self.session.get(self.url, params=params, timeout=self.timeout)
+                if response.status_code >= 500 or response.status_code == 429:
+                    raise requests.HTTPError(f"HTTP {response.status_code}")
+                response.raise_for_status()
+                data = response.json()
+                if data.get('status') == '1':
+                    geocodes = data.get('geocodes') or []
+                    return geocodes[0]['location'] if geocodes else None
+                if data.get('infocode') not in self.RETRY_INFOCODES:
+                    raise ValueError(f"AMap error {data.get('infocode')}: {data.get('info')}")
+                error = requests.HTTPError(f"AMap limit {data.get('infocode')}: {data.get('info')}")
+            except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+                error = e
+            if attempt < self.max_retries:
+                time.sleep(self.backoff * 2 ** attempt)
+        raise error
+
+    def geocode(self, city_name):
+        """
+        GCJ-02 (lng, lat) of one name, or None if AMap has no result or the request failed.
+        """
+        if city_name not in self.cache:
+            try:
+                location = self._fetch_location(city_name)
+            except Exception as e:
+                print(f"Error fetching data for {city_name}: {e}")
+                return None
+            with self._cache_lock:
+                self.cache[city_name] = location
+        location = self.cache[city_name]
+        if not location:
+            return None
+        lng, lat = map(float, location.split(','))
+        return lng, lat
+
+    def geocode_many(self, city_names):
+        """
+        Geocode many names with at most max_in_flight concurrent requests, then save the cache.
+        Returns a list of results in the order of city_names.
+        """
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+                return list(executor.map(self.geocode, city_names))
+        finally:
+            self.save_cache()
+
+def geocode_cities(df_cities, client):
+    """
+    Add the gcj_x, gcj_y, wgs_x, wgs_y fields to df_cities by geocoding its 'fullname' field.
+    All coordinates are converted to WGS-84 in one batch.
+    """
+    results = client.geocode_many(df_cities['fullname'].tolist())
+    gcj = np.array([result or (np.nan, np.nan) for result in results], dtype=np.float64).reshape(-1, 2)
+    df_cities = df_cities.copy()
+    df_cities['gcj_x'], df_cities['gcj_y'] = gcj[:, 0], gcj[:, 1]
+    df_cities['wgs_x'], df_cities['wgs_y'] = gcj02_to_wgs84_batch(gcj[:, 0], gcj[:, 1])
+    return df_cities
+
+if __name__ == '__main__':
+    df= pd.read_csv('data\\input\\AMap_adcode.csv', header=0)
+    # 提取直辖市和地级市
+    # 直辖市条件：adcode以00结尾，且为110000、120000、310000、500000之一
+    # 地级市条件：adcode以00结尾，但不是110000、120000、310000、500000
+    direct_municipalities = df[df['adcode'].isin([110000, 120000, 310000, 500000])]
+    prefecture_level_cities = df[(df['adcode'] % 100 == 0) & ~df['adcode'].isin([110100, 120100, 310100, 500100]) & (df['adcode'] % 10000 != 0)]
+    # 合并直辖市和地级市
+    df_cities = pd.concat([direct_municipalities, prefecture_level_cities]).reset_index(drop=True)
+    # 删除重庆市郊县
+    df_cities = df_cities[~df_cities['fullname'].str.contains('重庆市郊县')]
+    #城市的地理编码
+    amap_key = '7a4a38d38a85569db6bb34c536a7f45b'#'您的高德API Key'
+    # df_cities.to_csv('data/test.csv')
+    # 并发、限速、带重试与本地缓存的地理编码，重复运行只请求缓存中没有的城市
+    client = GeocodeClient(amap_key, cache_path='data\\output\\geocode_cache.json', max_in_flight=8, qps=50)
+    df_cities = geocode_cities(df_cities, client)
+
+    #更新莱芜市信息,高德api返回的莱芜市地理编码与济南市相同
+    # 为每列指定更新值
+    update_values = {'gcj_x':117.675828,'gcj_y':36.214895,'wgs_x':117.66994899263214, 'wgs_y':36.21489948744972}  # 根据需要添加更多列
+    # 更新fullname为'莱芜市'的行
+    df_cities.loc[df_cities['fullname'] == '莱芜市', list(update_values.keys())] = list(update_values.values())
+
+    # 导出为CSV文件
+    output_file_path = 'data\\output\\city_geocode.csv'
+    # 检查目录是否存在，如果不存在则创建
+    output_dir = os.path.dirname(output_file_path)
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    df_cities.to_csv(output_file_path, index=False)
+    print(f"城市信息已导出到 {output_file_path}")
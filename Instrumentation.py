@@ -0,0 +1,185 @@
+"""
+Function:
+                各阶段脚本共用的运行监测
+                EventLog: 以 JSON lines 格式记录结构化事件(每个文件、每个块的耗时、读取行数、匹配行数、
+                          删除的省直辖县级行和本地符号流、格式错误的行、工作进程利用率、峰值内存、错误及其 traceback)
+                Progress: 在终端显示实时进度(已处理量、速度、预计剩余时间)
+                profile_call / merge_profiles: 可选地用 cProfile 记录指定文件的热点路径，
+                          并行提取时各块的 profile 合并为一个 .prof 文件，用 python -m pstats 查看
+"""
+import os
+import sys
+import json
+import time
+import cProfile
+import pstats
+import traceback
+from contextlib import contextmanager
+from typing import Callable, List, Optional, TextIO
+
+
+def peak_rss_bytes(children: bool = False) -> Optional[int]:
+    """
+        Peak resident set size of this process (or of its largest finished child process) in bytes,
+        from resource on Unix or from psutil, if installed, on Windows. None if neither is available.
+    """
+    try:
+        import resource
+    except ImportError:
+        resource = None
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+        return peak if sys.platform == 'darwin' else peak * 1024
+    if children:
+        return None
+    try:
+        import psutil
+    except ImportError:
+        return None
+    memory = psutil.Process().memory_info()
+    return getattr(memory, 'peak_wset', memory.rss)
+
+
+def peak_rss_mb(children: bool = False) -> Optional[float]:
+    peak = peak_rss_bytes(children)
+    return round(peak / 2**20, 1) if peak is not None else None
+
+
+class EventLog:
+    """
+        Append structured events to a JSON lines file, one object per line with the time ('ts', seconds since
+        the epoch), the stage, the process id and the event name, followed by the fields of the event.
+        Without a path events are dropped, so that stage functions can always emit them.
+    """
+
+    def __init__(self, path: str = None, stage: str = None):
+        self.path = path
+        self.stage = stage
+        self._file = None
+        if path is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._file = open(path, 'a', encoding='utf-8')
+
+    def emit(self, event: str, **fields):
+        if self._file is None:
+            return
+        record = {'ts': round(time.time(), 3), 'stage': self.stage, 'pid': os.getpid(), 'event': event}
+        record.update(fields)
+        self._file.write(json.dumps(record, ensure_ascii=False, default=_json_default) + '\n')
+        self._file.flush()
+
+    def error(self, error: BaseException, **fields):
+        """
+            Emit an 'error' event with the exception type, message and traceback.
+        """
+        self.emit('error', error_type=type(error).__name__, message=str(error),
+                  traceback=''.join(traceback.format_exception(type(error), error, error.__traceback__)), **fields)
+
+    @contextmanager
+    def timed(self, event: str, **fields):
+        """
+            Emit event with its duration in 'seconds' once the block is done; the block can add fields to
+            the yielded dict. An exception is emitted as an 'error' event and raised again.
+        """
+        start = time.perf_counter()
+        extra = {}
+        try:
+            yield extra
+        except Exception as e:
+            self.error(e, during=event, **fields)
+            raise
+        self.emit(event, seconds=round(time.perf_counter() - start, 4), **fields, **extra)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _json_default(value):
+    # numpy integers and floats have item(), anything else is written as text
+    return value.item() if hasattr(value, 'item') else str(value)
+
+
+class Progress:
+    """
+        Live progress on one terminal line: done/total, rate and estimated time left.
+        Redrawn at most every min_interval seconds, and only when stream is a terminal unless enabled is set.
+    """
+
+    def __init__(self, total: float, unit: str = 'rows', label: str = '', stream: TextIO = None,
+                 min_interval: float = 0.5, enabled: bool = None):
+        self.total = total
+        self.unit = unit
+        self.label = label
+        self.stream = stream or sys.stderr
+        self.min_interval = min_interval
+        self.enabled = self.stream.isatty() if enabled is None else enabled
+        self.done = 0
+        self._start = time.perf_counter()
+        self._last_draw = 0.0
+        self._drawn_done = None
+
+    def update(self, n: float = 1, **status):
+        self.done += n
+        now = time.perf_counter()
+        if self.enabled and (now - self._last_draw >= self.min_interval or self.done >= self.total):
+            self._draw(now, status)
+
+    def _draw(self, now: float, status):
+        elapsed = now - self._start
+        rate = self.done / elapsed if elapsed > 0 else 0
+        left = (self.total - self.done) / rate if rate > 0 else float('nan')
+        percent = 100 * self.done / self.total if self.total else 100
+        scale, unit, digits = (2**20, 'MB', 1) if self.unit == 'bytes' else (1, self.unit, 0)
+        text = (f"{self.label} {percent:5.1f}% {self.done / scale:,.{digits}f}/{self.total / scale:,.{digits}f} {unit} "
+                f"{rate / scale:,.1f} {unit}/s, {left:,.0f}s left")
+        text += ''.join(f", {key} {value}" for key, value in status.items())
+        self.stream.write('\r' + text.ljust(100)[:160])
+        self.stream.flush()
+        self._last_draw = now
+        self._drawn_done = self.done
+
+    def close(self):
+        if self.enabled:
+            if self._drawn_done != self.done:
+                self._draw(time.perf_counter(), {})
+            self.stream.write('\n')
+            self.stream.flush()
+
+
+def profile_call(profile_path: str, function: Callable, *args, **kwargs):
+    """
+        Call function under cProfile and save the profile to profile_path. Returns what function returns.
+    """
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(function, *args, **kwargs)
+    finally:
+        os.makedirs(os.path.dirname(os.path.abspath(profile_path)), exist_ok=True)
+        profiler.dump_stats(profile_path)
+
+
+def merge_profiles(part_paths: List[str], profile_path: str, remove_parts: bool = True) -> Optional[str]:
+    """
+        Merge the profiles of the blocks of a file, made by several processes, into one profile file.
+        Returns profile_path, or None when there is nothing to merge.
+    """
+    part_paths = [path for path in part_paths if os.path.exists(path)]
+    if not part_paths:
+        return None
+    stats = pstats.Stats(part_paths[0])
+    for path in part_paths[1:]:
+        stats.add(path)
+    stats.dump_stats(profile_path)
+    if remove_parts:
+        for path in part_paths:
+            os.remove(path)
+    return profile_path
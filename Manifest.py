@@ -0,0 +1,146 @@
+"""
+Function:
+                记录每个输入文件的大小、修改时间、内容哈希，以及处理该文件时的参数(如地名符号字典版本)
+                同时记录该文件的缓存结果：提取结果分片与 (placecode, adcode) 部分计数
+                再次运行时只处理新增或变化的文件，其余文件直接使用缓存的部分计数；
+                每处理完一个文件就保存一次，运行中断后从上次完成的文件继续
+                按 _id 去重时还缓存每个文件保留的 _id 哈希和删除的重复POI数量
+"""
+import os
+import json
+import hashlib
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+MANIFEST_VERSION = 1
+
+
+def file_sha256(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class RunManifest:
+    """
+        manifest.json of a run: for every processed input file its size, mtime, sha256, the settings it was
+        processed with, its output shards and the path of its cached (placecode, adcode, count) partial counts.
+        A file is current when its size and content are unchanged, its settings equal the settings of this run
+        and all its cached outputs still exist. Partial counts are kept in <manifest dir>/<manifest name>_partials,
+        so that manifests of the same input files in one directory do not share them, as are the kept _id hashes
+        of runs that remove duplicate POIs.
+    """
+
+    def __init__(self, path: str, settings: Dict = None):
+        self.path = path
+        self.settings = settings or {}
+        self.partials_dir = os.path.splitext(os.path.abspath(path))[0] + '_partials'
+        self.files: Dict[str, Dict] = {}
+        try:
+            with open(path, encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = {}
+        if manifest.get('version') == MANIFEST_VERSION:
+            self.files = manifest.get('files', {})
+
+    def is_current(self, file_path: str) -> bool:
+        entry = self.files.get(os.path.abspath(file_path))
+        if entry is None or entry['settings'] != self.settings:
+            return False
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return False
+        if stat.st_size != entry['size']:
+            return False
+        if stat.st_mtime_ns != entry['mtime_ns']:
+            # Only hash when the file has been touched, a file copied back with the same content stays current
+            if file_sha256(file_path) != entry['sha256']:
+                return False
+            entry['mtime_ns'] = stat.st_mtime_ns
+        outputs = entry['shards'] + [entry['counts']] + ([entry['ids']] if entry.get('ids') else [])
+        return all(os.path.exists(path) for path in outputs)
+
+    def split(self, file_paths: Iterable[str], prefix: bool = False):
+        """
+            Split file_paths into (current, pending) lists, keeping their order.
+            With prefix, every file after the first pending one is pending too, for results that depend
+            on the earlier files, such as those without duplicates.
+        """
+        current, pending = [], []
+        for file_path in file_paths:
+            (current if not (prefix and pending) and self.is_current(file_path) else pending).append(file_path)
+        return current, pending
+
+    def counts(self, file_path: str) -> pd.DataFrame:
+        """
+            Cached (placecode, adcode, count) partial counts of a current file.
+        """
+        return pd.read_csv(self.files[os.path.abspath(file_path)]['counts'])
+
+    def ids(self, file_path: str):
+        """
+            Cached kept _id hashes of a current file and the number of duplicates removed from it.
+        """
+        entry = self.files[os.path.abspath(file_path)]
+        return np.load(entry['ids']), entry['duplicates']
+
+    def shards(self, file_path: str) -> List[str]:
+        entry = self.files.get(os.path.abspath(file_path))
+        return list(entry['shards']) if entry else []
+
+    def discard(self, file_path: str) -> Optional[Dict]:
+        """
+            Forget a file that is about to be processed again and delete its cached partial counts.
+            Returns the old entry, so that the caller can remove shards that will not be overwritten.
+        """
+        entry = self.files.pop(os.path.abspath(file_path), None)
+        for path in [entry['counts'], entry.get('ids')] if entry is not None else []:
+            if path and os.path.exists(path):
+                os.remove(path)
+        return entry
+
+    def record(self, file_path: str, counts: pd.DataFrame, shards: Iterable[str] = (), ids: np.ndarray = None,
+               duplicates: int = None):
+        """
+            Record a completely processed file with its partial counts and output shards, and save the manifest.
+            ids are the kept _id hashes and duplicates the number of duplicates removed, when removing them.
+        """
+        file_path = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+        # The partial counts are named after the file, with a hash of its full path against equal basenames
+        stem = os.path.splitext(os.path.basename(file_path))[0]
+        path_hash = hashlib.sha1(file_path.encode('utf-8')).hexdigest()[:8]
+        counts_path = os.path.join(self.partials_dir, f'{stem}_{path_hash}.csv')
+        os.makedirs(self.partials_dir, exist_ok=True)
+        counts.to_csv(counts_path + '.tmp', index=False)
+        os.replace(counts_path + '.tmp', counts_path)
+        ids_path = None
+        if ids is not None:
+            ids_path = os.path.join(self.partials_dir, f'{stem}_{path_hash}.ids.npy')
+            with open(ids_path + '.tmp', 'wb') as f:
+                np.save(f, ids)
+            os.replace(ids_path + '.tmp', ids_path)
+        self.files[file_path] = {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha256': file_sha256(file_path),
+            'settings': self.settings,
+            'shards': [os.path.abspath(path) for path in shards],
+            'counts': counts_path,
+        }
+        if ids is not None:
+            self.files[file_path].update(ids=ids_path, duplicates=duplicates)
+        self.save()
+
+    def save(self):
+        # Write then rename, so that an interrupted run never leaves a half written manifest
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'version': MANIFEST_VERSION, 'files': self.files}, f, indent=2, ensure_ascii=False)
+        os.replace(self.path + '.tmp', self.path)
@@ -0,0 +1,289 @@
+"""
+Data description:
+                placesymbol_code.csv is 地名符号与地名编号的映射字典, fields are 'placesymbol', 'placecode'.
+                POI files are GBK encoded csv files, fields include name,_id,adcode
+                provincialcounties.csv is 省直辖县级行政单位的符号与编码
+                city_geocode.csv is 城市的地理编码
+Function:
+                以分片(map-reduce)方式构建符号流，可分布到多台机器上运行
+                plan:   协调者把POI文件列表切分为若干分片，大文件按字节范围切分，计划保存为 plan.json
+                map:    每个分片独立提取地名符号，只输出 (placecode, adcode) 计数，
+                        写为自描述的部分计数文件，记录字典版本、所属计划、覆盖的文件与字节范围和行数
+                reduce: 合并一个计划(或明确列出的任意数量)的部分计数文件，检查字典版本一致、字节范围不重叠、分片齐全，
+                        构建 Symbolicflows.csv 等符号流并添加地理编码
+                计划记录每个文件的大小和修改时间，文件在计划之后变化时 map 报错，需要重新制定计划
+                local:  在本机用多个工作进程代替多台机器，依次完成 plan、map、reduce
+
+                python MapReduce.py plan <poi_dir> <plan.json> --shards N
+                python MapReduce.py map <plan.json> <shard> <partial_dir>      (每台机器运行各自的分片)
+                python MapReduce.py reduce <partial_dir or files...> --plan <plan.json> --output data/output
+                python MapReduce.py local <poi_dir> <partial_dir> --shards N --workers N --output data/output
+"""
+import os
+import glob
+import json
+import time
+import hashlib
+import argparse
+import concurrent.futures
+from typing import Dict, Iterable, List, Tuple
+
+import pandas as pd
+
+from SymbolMatcher import SymbolMatcher
+from PoiReader import iter_line_blocks, read_poi_block
+from ExtractPlaceSymbol import extract_matches
+from FlowBuilder import count_pairs, PairCounts, CityIndex, ODMatrix, write_symbolflows
+
+PARTIAL_FORMAT = 'symbolflow-partial'
+PARTIAL_VERSION = 1
+
+
+def plan_shards(file_paths: List[str], n_shards: int, min_split_bytes: int = 64 * 1024 * 1024) -> Dict:
+    """
+        Split the POI files into n_shards shards of about the same number of bytes.
+        A shard is a list of {'file', 'size', 'mtime_ns', 'start', 'end'} byte ranges; files are only cut when
+        a shard boundary falls inside them and both pieces hold at least min_split_bytes.
+        The ranges are raw offsets, map_shard aligns them to line boundaries.
+        The plan_id hashes the shards, so a plan of changed files gets a new plan_id.
+    """
+    files = [(os.path.abspath(file_path), os.stat(file_path)) for file_path in sorted(file_paths)]
+    total = sum(stat.st_size for _, stat in files)
+    target = max(1, -(-total // max(1, n_shards)))
+    shards, ranges, filled = [], [], 0
+    for file_path, stat in files:
+        size, start = stat.st_size, 0
+        while start < size:
+            end = min(size, start + target - filled)
+            if end < size and end - start < min_split_bytes:
+                if ranges:
+                    # Too little room left in this shard for a piece of the file, start the next shard
+                    shards.append(ranges)
+                    ranges, filled = [], 0
+                    continue
+                end = min(size, start + min_split_bytes)
+            # Do not leave a sliver of a file behind
+            if size - end < min_split_bytes:
+                end = size
+            ranges.append({'file': file_path, 'size': size, 'mtime_ns': stat.st_mtime_ns, 'start': start, 'end': end})
+            filled += end - start
+            start = end
+            if filled >= target:
+                shards.append(ranges)
+                ranges, filled = [], 0
+    if ranges:
+        shards.append(ranges)
+    plan = {'shards': shards}
+    plan['plan_id'] = hashlib.sha256(json.dumps(shards).encode('utf-8')).hexdigest()[:16]
+    return plan
+
+
+def _write_json(obj, path: str):
+    # Write then rename, so that a partial file only exists once its shard is complete
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(obj, f, ensure_ascii=False)
+    os.replace(path + '.tmp', path)
+
+
+def load_plan(path: str) -> Dict:
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def map_shard(plan: Dict, shard: int, matcher: SymbolMatcher, block_bytes: int = 16 * 1024 * 1024) -> Dict:
+    """
+        Extract the placesymbols of one shard of plan and count the (placecode, adcode) pairs.
+        Returns the self-describing partial: dictionary version, plan and shard, byte ranges, rows, bad lines and counts.
+    """
+    ranges = plan['shards'][shard]
+    pair_counts = PairCounts()
+    rows = bad_line_count = 0
+    for byte_range in ranges:
+        stat = os.stat(byte_range['file'])
+        # A changed file would shift the byte ranges, the other shards may already have read the old content
+        if stat.st_size != byte_range['size'] or stat.st_mtime_ns != byte_range['mtime_ns']:
+            raise ValueError(f"{byte_range['file']} has changed since the plan was made")
+        for header, block, first_line_no in iter_line_blocks(byte_range['file'], block_bytes,
+                                                             byte_range['start'], byte_range['end']):
+            data, bad_lines = read_poi_block(header, block, first_line_no)
+            pair_counts.add(count_pairs(extract_matches(data, matcher, keep_name=False)))
+            rows += len(data)
+            bad_line_count += len(bad_lines)
+    # Pairs whose codes are not numbers can never map to a city
+    counts = pair_counts.to_frame()[['placecode', 'adcode', 'count']].apply(pd.to_numeric, errors='coerce').dropna()
+    return {
+        'format': PARTIAL_FORMAT,
+        'version': PARTIAL_VERSION,
+        'dictionary_version': matcher.version,
+        'plan_id': plan['plan_id'],
+        'shard': shard,
+        'shards': len(plan['shards']),
+        'inputs': ranges,
+        'rows': rows,
+        'bad_lines': bad_line_count,
+        'columns': ['placecode', 'adcode', 'count'],
+        'data': counts.astype('int64').values.tolist(),
+    }
+
+
+def partial_path(partial_dir: str, plan: Dict, shard: int) -> str:
+    return os.path.join(partial_dir, f"partial_{plan['plan_id']}_{shard:05d}.json")
+
+
+def read_partial(path: str) -> Dict:
+    with open(path, encoding='utf-8') as f:
+        partial = json.load(f)
+    if partial.get('format') != PARTIAL_FORMAT or partial.get('version') != PARTIAL_VERSION:
+        raise ValueError(f"{path} is not a version {PARTIAL_VERSION} partial count file")
+    return partial
+
+
+def reduce_partials(partial_paths: Iterable[str], provincial_adcodes: Iterable[int], plan: Dict = None) -> ODMatrix:
+    """
+        Merge partial count files into one city x city matrix. With plan, all partials must belong to it;
+        without, they may come from any number of plans.
+        Raises ValueError when the partials were made with different dictionaries, when two partials
+        cover the same bytes of a file, or when a shard of one of the plans is missing.
+    """
+    pair_counts = PairCounts()
+    dictionary_versions = set()
+    shards_seen: Dict[str, set] = {}
+    shards_expected: Dict[str, int] = {}
+    if plan is not None:
+        # Also catches a plan none of whose shards were given
+        shards_seen[plan['plan_id']] = set()
+        shards_expected[plan['plan_id']] = len(plan['shards'])
+    ranges_by_file: Dict[str, List] = {}
+    for path in partial_paths:
+        partial = read_partial(path)
+        if plan is not None and partial['plan_id'] != plan['plan_id']:
+            raise ValueError(f"{path} belongs to plan {partial['plan_id']}, not to plan {plan['plan_id']}")
+        dictionary_versions.add(partial['dictionary_version'])
+        shards_seen.setdefault(partial['plan_id'], set()).add(partial['shard'])
+        shards_expected[partial['plan_id']] = partial['shards']
+        for byte_range in partial['inputs']:
+            ranges_by_file.setdefault(byte_range['file'], []).append((byte_range['start'], byte_range['end'], path))
+        pair_counts.add(pd.DataFrame(partial['data'], columns=partial['columns'], dtype='int64'))
+
+    if len(dictionary_versions) > 1:
+        raise ValueError(f"Partials were made with different symbol dictionaries: {sorted(dictionary_versions)}")
+    for file_path, ranges in ranges_by_file.items():
+        ranges.sort()
+        for (_, end, path), (start, _, other_path) in zip(ranges, ranges[1:]):
+            if start < end:
+                raise ValueError(f"{path} and {other_path} both cover bytes {start}-{end} of {file_path}")
+    for plan_id, seen in shards_seen.items():
+        missing = sorted(set(range(shards_expected[plan_id])) - seen)
+        if missing:
+            raise ValueError(f"Plan {plan_id} is missing the partials of shards {missing}")
+
+    pairs = pair_counts.to_frame()
+    od_matrix = ODMatrix(CityIndex(provincial_adcodes))
+    od_matrix.add(pairs['placecode'], pairs['adcode'], weights=pairs['count'])
+    return od_matrix
+
+
+# Matcher shipped to each local worker process once by the pool initializer
+_node_matcher = None
+
+
+def _init_node(matcher):
+    global _node_matcher
+    _node_matcher = SymbolMatcher.load(matcher) if isinstance(matcher, str) else matcher
+
+
+def _map_task(plan: Dict, shard: int, partial_dir: str) -> str:
+    path = partial_path(partial_dir, plan, shard)
+    _write_json(map_shard(plan, shard, _node_matcher), path)
+    return path
+
+
+def run_local(file_paths: List[str], matcher: SymbolMatcher, partial_dir: str, n_shards: int = None,
+              max_workers: int = None, min_split_bytes: int = 64 * 1024 * 1024) -> Tuple[Dict, List[str]]:
+    """
+        Plan and map all shards with a pool of local worker processes standing in for the nodes.
+        Shards whose partial file already exists are not mapped again; partials of other plans in partial_dir,
+        such as those of files that have changed since, are left alone. Returns the plan and its partial file paths.
+    """
+    max_workers = max_workers or os.cpu_count()
+    plan = plan_shards(file_paths, n_shards or 4 * max_workers, min_split_bytes)
+    _write_json(plan, os.path.join(partial_dir, f"plan_{plan['plan_id']}.json"))
+    paths = [partial_path(partial_dir, plan, shard) for shard in range(len(plan['shards']))]
+    todo = [shard for shard, path in enumerate(paths) if not os.path.exists(path)]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, initializer=_init_node,
+                                                initargs=(matcher.artifact_path or matcher,)) as executor:
+        for path in executor.map(_map_task, [plan] * len(todo), todo, [partial_dir] * len(todo)):
+            print(f"Wrote {path}")
+    return plan, paths
+
+
+def _list_partials(paths: List[str], plan_id: str = None) -> List[str]:
+    """
+        The partial files given and those in the given directories, only those of plan_id in the directories.
+    """
+    partials = []
+    for path in paths:
+        if os.path.isdir(path):
+            partials.extend(sorted(glob.glob(os.path.join(glob.escape(path), f"partial_{plan_id or '*'}_*.json"))))
+        else:
+            partials.append(path)
+    return partials
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build symbol flows in map-reduce shards')
+    parser.add_argument('--dictionary', default='data/output/placesymbol_code.csv')
+    parser.add_argument('--compiled-dictionary', default='data/output/placesymbol_code.pkl')
+    parser.add_argument('--provincialcounties', default='data/input/provincialcounties.csv')
+    parser.add_argument('--geocode', default='data/output/city_geocode.csv')
+    commands = parser.add_subparsers(dest='command', required=True)
+    plan_parser = commands.add_parser('plan')
+    plan_parser.add_argument('poi_dir')
+    plan_parser.add_argument('plan')
+    plan_parser.add_argument('--shards', type=int, required=True)
+    map_parser = commands.add_parser('map')
+    map_parser.add_argument('plan')
+    map_parser.add_argument('shard', type=int)
+    map_parser.add_argument('partial_dir')
+    reduce_parser = commands.add_parser('reduce')
+    reduce_parser.add_argument('partials', nargs='+')
+    reduce_parser.add_argument('--plan', help='only reduce the partials of this plan, required for directories')
+    reduce_parser.add_argument('--output', default='data/output')
+    local_parser = commands.add_parser('local')
+    local_parser.add_argument('poi_dir')
+    local_parser.add_argument('partial_dir')
+    local_parser.add_argument('--shards', type=int)
+    local_parser.add_argument('--workers', type=int)
+    local_parser.add_argument('--output', default='data/output')
+    args = parser.parse_args()
+
+    starttime = time.time()
+    partials = plan = None
+    if args.command == 'plan':
+        plan = plan_shards(glob.glob(os.path.join(args.poi_dir, '*.csv')), args.shards)
+        _write_json(plan, args.plan)
+        print(f"Plan {plan['plan_id']}: {len(plan['shards'])} shards")
+    elif args.command == 'map':
+        plan = load_plan(args.plan)
+        path = partial_path(args.partial_dir, plan, args.shard)
+        matcher = SymbolMatcher.load_or_compile(args.dictionary, args.compiled_dictionary)
+        _write_json(map_shard(plan, args.shard, matcher), path)
+        print(f"Wrote {path}")
+    elif args.command == 'reduce':
+        # A directory may also hold the partials of earlier plans, made from older versions of the files
+        if args.plan is None and any(os.path.isdir(path) for path in args.partials):
+            parser.error('reduce needs --plan to read the partials of a directory')
+        plan = load_plan(args.plan) if args.plan is not None else None
+        partials = _list_partials(args.partials, plan['plan_id'] if plan is not None else None)
+    else:
+        matcher = SymbolMatcher.load_or_compile(args.dictionary, args.compiled_dictionary)
+        plan, partials = run_local(glob.glob(os.path.join(args.poi_dir, '*.csv')), matcher, args.partial_dir,
+                             args.shards, args.workers)
+
+    if partials is not None:
+        df_provincialcounties = pd.read_csv(args.provincialcounties, header=0)
+        od_matrix = reduce_partials(partials, df_provincialcounties['adcode'], plan)
+        df_cities = pd.read_csv(args.geocode, header=0)
+        write_symbolflows(od_matrix, df_cities, args.output)
+    print(f"Total time: {time.time() - starttime} seconds")
@@ -0,0 +1,186 @@
+"""
+Data description:
+                POI files are GBK encoded csv files, fields include name,_id,adcode
+                placesymbol_code.csv is 地名符号与地名编号的映射字典, fields are 'placesymbol', 'placecode'.
+Function:
+                POI 匹配索引：用一个超集字典(所有候选地名符号)在提取阶段找出每条POI名称中出现的所有符号及其首次出现的位置
+                POI文件的每个块保存为一个 .npz 文件，只保存有命中的POI：去掉括号后的 name、_id、adcode，
+                以及 CSR 形式的命中 (offsets, symbol_ids, positions)
+                修改 city_alias.csv、minority.csv 或 SymbolDict 的去重规则后，新字典的 placesymbol/placecode
+                只需在索引上过滤出新字典中的符号，再取 (位置, 字典排序) 最小的命中，不必重新扫描原始 GBK 文件
+                结果与用新字典重新运行 ExtractPlaceSymbol 相同，前提是新字典的符号都在超集字典中
+"""
+import os
+import re
+import json
+import glob
+import uuid
+import hashlib
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from SymbolMatcher import SymbolMatcher
+
+INDEX_VERSION = 3
+
+# Parentheses and their contents are removed from names before matching, as in match_and_extract
+_PARENTHESES = re.compile(r'\([^)]*\)')
+
+
+def symbols_from_csvs(csv_paths: Iterable[str]) -> List[str]:
+    """
+        The union of the placesymbols of several dictionary variants, in order of first appearance.
+    """
+    symbols = {}
+    for csv_path in csv_paths:
+        for symbol in pd.read_csv(csv_path)['placesymbol']:
+            if isinstance(symbol, str):
+                symbols.setdefault(symbol, None)
+    return list(symbols)
+
+
+class MatchIndex:
+    """
+        Directory with index.json (format version and the superset symbols, whose position is the symbol id)
+        and one <file>_<path hash>_<block>.npz part per block of each indexed POI file.
+    """
+
+    def __init__(self, index_dir: str, symbols: List[str], index_id: str = None):
+        self.index_dir = index_dir
+        # The symbol ids are the ranks of the matcher, which skips repeated symbols and those that are not strings
+        self.symbols = [symbol for symbol in dict.fromkeys(symbols) if isinstance(symbol, str)]
+        # Changes whenever the index is created again, so that a run manifest notices the lost parts
+        self.index_id = index_id
+        self.matcher = SymbolMatcher({symbol: symbol_id for symbol_id, symbol in enumerate(self.symbols)})
+
+    @classmethod
+    def create(cls, index_dir: str, symbols: Iterable[str]) -> 'MatchIndex':
+        """
+            Start an empty index over the superset symbols, removing the parts of an earlier index.
+        """
+        os.makedirs(index_dir, exist_ok=True)
+        for part in glob.glob(os.path.join(index_dir, '*.npz')):
+            os.remove(part)
+        match_index = cls(index_dir, symbols, uuid.uuid4().hex)
+        with open(os.path.join(index_dir, 'index.json'), 'w', encoding='utf-8') as f:
+            json.dump({'version': INDEX_VERSION, 'index_id': match_index.index_id, 'symbols': match_index.symbols},
+                      f, ensure_ascii=False)
+        return match_index
+
+    @classmethod
+    def open(cls, index_dir: str) -> 'MatchIndex':
+        with open(os.path.join(index_dir, 'index.json'), encoding='utf-8') as f:
+            metadata = json.load(f)
+        if metadata.get('version') != INDEX_VERSION:
+            raise ValueError(f"{index_dir} has index version {metadata.get('version')}, expected {INDEX_VERSION}")
+        return cls(index_dir, metadata['symbols'], metadata['index_id'])
+
+    def _stem(self, file_path: str) -> str:
+        # Named after the file, with a hash of its full path against equal basenames in other directories
+        file_path = os.path.abspath(file_path)
+        path_hash = hashlib.sha1(file_path.encode('utf-8')).hexdigest()[:8]
+        return os.path.join(self.index_dir, f"{os.path.basename(file_path).split('.')[0]}_{path_hash}")
+
+    def clear(self, file_path: str):
+        """
+            Remove the parts of a POI file that is about to be indexed again.
+        """
+        for part in glob.glob(glob.escape(self._stem(file_path)) + '_[0-9][0-9][0-9][0-9][0-9].npz'):
+            os.remove(part)
+
+    def write_part(self, file_path: str, block_index: int, data: pd.DataFrame):
+        """
+            Find all superset symbols in the names of one block of POIs and save the POIs with at least one hit.
+            adcode is saved as a number, NaN if it is not one.
+        """
+        rows, names, offsets, symbol_ids, positions = [], [], [0], [], []
+        for row, name in enumerate(data['name']):
+            if not isinstance(name, str):
+                continue
+            name_modified = _PARENTHESES.sub('', name)
+            found = self.matcher.find_all(name_modified)
+            if not found:
+                continue
+            rows.append(row)
+            names.append(name_modified)
+            symbol_ids.extend(found.keys())
+            positions.extend(found.values())
+            offsets.append(len(symbol_ids))
+        _ids = data['_id'].iloc[rows]
+        adcodes = pd.to_numeric(data['adcode'].iloc[rows], errors='coerce').to_numpy(dtype=np.float64)
+        # extract_matches drops the POIs without _id or with an adcode that is not a number
+        valid = _ids.notna().to_numpy() & ~np.isnan(adcodes)
+        path = f'{self._stem(file_path)}_{block_index:05d}.npz'
+        # Write then rename, so that an interrupted run never leaves a truncated part
+        with open(path + '.tmp', 'wb') as f:
+            np.savez_compressed(f, source=np.array(os.path.abspath(file_path)), name=np.array(names, dtype=str),
+                                _id=_ids.astype(str).to_numpy(dtype=str),
+                                adcode=adcodes, valid=valid, offsets=np.array(offsets, dtype=np.int64),
+                                symbol_ids=np.array(symbol_ids, dtype=np.int32),
+                                positions=np.array(positions, dtype=np.int32))
+        os.replace(path + '.tmp', path)
+
+    def parts(self) -> List[str]:
+        """
+            All parts, grouped by POI file and in block order.
+        """
+        def key(path):
+            stem, block = os.path.splitext(os.path.basename(path))[0].rsplit('_', 1)
+            return stem, int(block)
+        return sorted(glob.glob(os.path.join(self.index_dir, '*_[0-9][0-9][0-9][0-9][0-9].npz')), key=key)
+
+    def derive(self, placesymbol_dict: Dict[str, int]) -> Iterator[Tuple[str, pd.DataFrame]]:
+        """
+            Yield (POI file, results) for every part, the results being those extract_matches gives with
+            a SymbolMatcher of placesymbol_dict: the hit with the smallest (position, rank) of each POI.
+            Raises ValueError if placesymbol_dict has symbols that are not in the superset.
+        """
+        # Symbols, ranks and codes as in SymbolMatcher
+        symbols = [symbol for symbol in placesymbol_dict if isinstance(symbol, str)]
+        symbol_dtype = pd.CategoricalDtype(symbols)
+        symbol_ids = {symbol: symbol_id for symbol_id, symbol in enumerate(self.symbols)}
+        missing = [symbol for symbol in symbols if symbol not in symbol_ids]
+        if missing:
+            raise ValueError(f"{len(missing)} placesymbols are not in the index, e.g. {missing[:5]}; rebuild it with a larger superset")
+        # rank of each superset symbol in the new dictionary, -1 if it is not in it
+        ranks = np.full(len(self.symbols), -1, dtype=np.int64)
+        ranks[[symbol_ids[symbol] for symbol in symbols]] = np.arange(len(symbols))
+        code_array = pd.to_numeric(pd.Series([placesymbol_dict[symbol] for symbol in symbols], dtype=object),
+                                   errors='coerce').to_numpy(dtype=np.float64)
+
+        for path in self.parts():
+            with np.load(path) as part:
+                poi = np.repeat(np.arange(len(part['offsets']) - 1), np.diff(part['offsets']))
+                hit_ranks = ranks[part['symbol_ids']]
+                keep = hit_ranks >= 0
+                poi, hit_ranks, positions = poi[keep], hit_ranks[keep], part['positions'][keep]
+                # The first hit of each POI after sorting by POI, position and rank
+                order = np.lexsort((hit_ranks, positions, poi))
+                poi, hit_ranks = poi[order], hit_ranks[order]
+                first = np.ones(len(poi), dtype=bool)
+                first[1:] = poi[1:] != poi[:-1]
+                poi, hit_ranks = poi[first], hit_ranks[first]
+                # Symbols without a placecode drop their POIs, as in extract_matches
+                keep = part['valid'][poi] & ~np.isnan(code_array[hit_ranks])
+                poi, hit_ranks = poi[keep], hit_ranks[keep]
+                results = pd.DataFrame({
+                    'name': part['name'][poi].astype(object),
+                    '_id': part['_id'][poi].astype(object),
+                    'adcode': part['adcode'][poi].astype(np.int64),
+                    'placesymbol': pd.Categorical.from_codes(hit_ranks, dtype=symbol_dtype),
+                    'placecode': code_array[hit_ranks].astype(np.int64),
+                })
+                source = str(part['source'])
+            yield source, results
+
+
+if __name__ == '__main__':
+    from ExtractPlaceSymbol import extract_from_index
+
+    # Re-derive the extraction results of the current dictionary from the index built during extraction,
+    # instead of rescanning the raw POI files
+    match_index = MatchIndex.open('data/output/matchindex')
+    matcher = SymbolMatcher.load_or_compile('data/output/placesymbol_code.csv', 'data/output/placesymbol_code.pkl')
+    extract_from_index(match_index, matcher, 'data/output/extractresult', 1000000)
@@ -0,0 +1,124 @@
+"""
+Data description:
+                POI files are GBK encoded csv files, fields include name,_id,adcode
+Function:
+                按 _id 跨文件去重：POI 数据分为许多覆盖范围重叠的文件，同一个POI出现在多个文件中时只保留第一次出现
+                (按文件顺序和行号)，避免在符号流中重复计数
+                _id 哈希为 64 位整数，保存在几段有序的 uint64 数组中(类似 LSM：新的一段与大小相近的前一段合并)，
+                每个 _id 约占 8 字节，不需要 Python set 保存数千万个字符串
+                只对提取到地名符号的POI去重，未匹配的POI不影响符号流
+                记录每个文件删除的重复POI数量
+"""
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+
+def hash_ids(ids) -> np.ndarray:
+    """
+        64-bit hashes of _ids, the same in every process. Numbers and strings with the same text hash alike.
+        Two different _ids share a hash with probability about n^2 / 2^65, 3e-4 for 100 million _ids.
+    """
+    ids = pd.Series(ids, dtype=object).astype(str).to_numpy(dtype=object)
+    return pd.util.hash_array(ids, categorize=False)
+
+
+class SeenIds:
+    """
+        Set of 64-bit _id hashes, kept as sorted uint64 runs of decreasing size.
+        A new run is merged with the previous one while it is at least half its size,
+        so there are O(log n) runs and every hash is merged O(log n) times.
+    """
+
+    def __init__(self):
+        self.runs: List[np.ndarray] = []
+
+    def __len__(self):
+        return sum(len(run) for run in self.runs)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(run.nbytes for run in self.runs)
+
+    def contains(self, hashes: np.ndarray) -> np.ndarray:
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        found = np.zeros(len(hashes), dtype=bool)
+        for run in self.runs:
+            positions = np.searchsorted(run, hashes)
+            inside = positions < len(run)
+            found[inside] |= run[positions[inside]] == hashes[inside]
+        return found
+
+    def add_new(self, hashes: np.ndarray) -> np.ndarray:
+        """
+            Add hashes and return the mask of those seen for the first time, the first of repeats within hashes.
+        """
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        first = np.zeros(len(hashes), dtype=bool)
+        unique, first_positions = np.unique(hashes, return_index=True)
+        unseen = ~self.contains(unique)
+        first[first_positions[unseen]] = True
+        run = unique[unseen]
+        while self.runs and len(run) >= len(self.runs[-1]) // 2:
+            # Both runs are sorted and disjoint, the stable sort merges them in linear time
+            run = np.sort(np.concatenate([self.runs.pop(), run]), kind='stable')
+        if len(run):
+            self.runs.append(run)
+        return first
+
+    def remove(self, hashes: np.ndarray):
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        runs = [run[~np.isin(run, hashes)] for run in self.runs]
+        self.runs = [run for run in runs if len(run)]
+
+
+class IdDedup:
+    """
+        Remove the POIs whose _id was already seen, in an earlier file or earlier in the same file.
+        Results must be filtered in file order and, within a file, in line order; parallel_process_csv does so.
+        removed and kept count the duplicates removed from and the POIs kept in each file.
+    """
+
+    def __init__(self):
+        self.seen = SeenIds()
+        self.removed: Dict[str, int] = {}
+        self.kept: Dict[str, int] = {}
+
+    def keep_first(self, file_path: str, hashes: np.ndarray) -> np.ndarray:
+        """
+            Mask of the _id hashes of the next results of file_path that were not seen yet.
+        """
+        first = self.seen.add_new(hashes)
+        self.removed[file_path] = self.removed.get(file_path, 0) + int((~first).sum())
+        self.kept[file_path] = self.kept.get(file_path, 0) + int(first.sum())
+        return first
+
+    def add_seen(self, file_path: str, hashes: np.ndarray, removed: int = 0):
+        """
+            Mark the kept _id hashes of a file processed in an earlier run as seen.
+        """
+        self.seen.add_new(hashes)
+        self.removed[file_path] = self.removed.get(file_path, 0) + removed
+        self.kept[file_path] = self.kept.get(file_path, 0) + len(hashes)
+
+    def discard(self, file_path: str, kept_hashes):
+        """
+            Forget a file whose results are dropped: its kept _id hashes (the hashes keep_first let through,
+            one array per call) are no longer seen and its counts are removed.
+        """
+        if kept_hashes:
+            self.seen.remove(np.concatenate(kept_hashes))
+        self.removed.pop(file_path, None)
+        self.kept.pop(file_path, None)
+
+    def report(self) -> pd.DataFrame:
+        """
+            Per file: the matched POIs kept and the duplicates removed.
+        """
+        files = list(dict.fromkeys(list(self.kept) + list(self.removed)))
+        return pd.DataFrame({
+            'file': files,
+            'kept': [self.kept.get(file, 0) for file in files],
+            'duplicates': [self.removed.get(file, 0) for file in files],
+        })
@@ -0,0 +1,133 @@
+"""
+Data description:
+                POI files are GBK encoded csv files with a header line, fields include name,_id,adcode
+Function:
+                按字节块读取POI文件，每个块只包含完整的行
+                使用 pandas 的 C 解析器解析每个块
+                将格式错误的行和无法按GBK解码的行连同行号写入隔离文件(quarantine)，并统计跳过的行数
+"""
+import io
+import os
+import re
+import csv
+import warnings
+from typing import Iterator, List, Tuple
+
+import pandas as pd
+
+# (line number in the POI file, reason, raw line)
+BadLine = Tuple[int, str, bytes]
+
+_SKIPPED_LINE = re.compile(r'Skipping line (\d+): (.*)')
+
+
+def iter_line_blocks(file_path: str, block_bytes: int, start: int = 0, end: int = None) -> Iterator[Tuple[bytes, bytes, int]]:
+    """
+        Read a POI file as (header, block, first_line_no) triples of raw bytes, each block holding whole lines.
+        first_line_no is the 1-based line number of the first line of the block, the header being line 1.
+        GBK never uses the newline byte inside a multi-byte character, so splitting on it is safe
+        as long as records do not contain quoted line breaks.
+        With a byte range [start, end) only the lines that start inside it are read, so that the ranges of
+        a split file together read every line exactly once. The lines before start are counted, not parsed.
+    """
+    with open(file_path, 'rb') as f:
+        header = f.readline()
+        line_no = 2
+        position = f.tell()
+        if start > position:
+            # Count the lines up to byte start - 1, then skip the rest of the line it belongs to
+            while position < start - 1:
+                chunk = f.read(min(block_bytes, start - 1 - position))
+                if not chunk:
+                    break
+                line_no += chunk.count(b'\n')
+                position += len(chunk)
+            line_no += f.readline().count(b'\n')
+            position = f.tell()
+        while end is None or position < end:
+            block = f.read(block_bytes if end is None else min(block_bytes, end - position))
+            if not block:
+                break
+            # Extend the block to the end of its last line
+            if not block.endswith(b'\n'):
+                block += f.readline()
+            yield header, block, line_no
+            line_no += block.count(b'\n')
+            position = f.tell()
+
+
+def _drop_undecodable_lines(block: bytes, first_line_no: int) -> Tuple[bytes, List[int], List[BadLine]]:
+    """
+        Remove the lines of a block that are not valid GBK.
+        Returns the cleaned block, the original line numbers of the kept lines and the removed lines.
+    """
+    lines = block.split(b'\n')
+    kept, kept_line_nos, bad_lines = [], [], []
+    for offset, line in enumerate(lines):
+        try:
+            line.decode('gbk')
+        except UnicodeDecodeError as e:
+            bad_lines.append((first_line_no + offset, f'GBK decode error: {e.reason}', line.rstrip(b'\r')))
+            continue
+        kept.append(line)
+        kept_line_nos.append(first_line_no + offset)
+    return b'\n'.join(kept), kept_line_nos, bad_lines
+
+
+def read_poi_block(header: bytes, block: bytes, first_line_no: int = 2) -> Tuple[pd.DataFrame, List[BadLine]]:
+    """
+        Parse one block of a POI file with the C parser.
+        Returns the parsed rows and the bad lines (malformed or not GBK) with their line numbers in the file.
+    """
+    bad_lines = []
+    kept_line_nos = None
+    try:
+        block.decode('gbk')
+    except UnicodeDecodeError:
+        # Rare: fall back to a line by line check to isolate the offending lines
+        block, kept_line_nos, bad_lines = _drop_undecodable_lines(block, first_line_no)
+
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always', pd.errors.ParserWarning)
+        data = pd.read_csv(io.BytesIO(header + block), encoding='GBK', engine='c', on_bad_lines='warn')
+
+    malformed = []
+    for warning in caught:
+        if issubclass(warning.category, pd.errors.ParserWarning):
+            malformed.extend(_SKIPPED_LINE.findall(str(warning.message)))
+    if malformed:
+        lines = block.split(b'\n')
+        for parser_line_no, reason in malformed:
+            # Parser line numbers count the header as line 1
+            offset = int(parser_line_no) - 2
+            line_no = kept_line_nos[offset] if kept_line_nos is not None else first_line_no + offset
+            bad_lines.append((line_no, reason, lines[offset].rstrip(b'\r')))
+        bad_lines.sort(key=lambda bad_line: bad_line[0])
+    return data, bad_lines
+
+
+class QuarantineWriter:
+    """
+        Collect the bad lines of one POI file into <quarantine_dir>/<file name>, with columns line,reason,raw.
+        The file is only created when the first bad line arrives. With quarantine_dir=None bad lines are only counted.
+    """
+
+    def __init__(self, file_path: str, quarantine_dir: str = None):
+        self.path = os.path.join(quarantine_dir, os.path.basename(file_path)) if quarantine_dir else None
+        self.count = 0
+
+    def append(self, bad_lines: List[BadLine]):
+        if not bad_lines:
+            return
+        if self.path is None:
+            self.count += len(bad_lines)
+            return
+        if not self.count:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'a' if self.count else 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            if not self.count:
+                writer.writerow(['line', 'reason', 'raw'])
+            for line_no, reason, raw in bad_lines:
+                writer.writerow([line_no, reason, raw.decode('gbk', errors='backslashreplace')])
+        self.count += len(bad_lines)
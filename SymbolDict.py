@@ -7,61 +7,94 @@ Data description:
 Function:
                 从AMap_adcode.csv提取极简化的地名符号
                 并与简称和别称的地名符合合并，构建地名符号与地名编号的映射字典
+                symboltype 记录符号的类型：mainname(极简化的地名)、alias(别称，如羊城)、shortname(省级简称，如粤)
+                同时输出编译好的字典 placesymbol_code.pkl(带版本号的 SymbolMatcher 自动机)，提取阶段只需加载一次
 """
+import re
+from typing import Iterable
+
 import pandas as pd
-#读取AMap_adcode.csv, addname_adcode.csv, minority.csv为df_mainname,df_aliasname和list_minority
-df = pd.read_csv('data/input/AMap_adcode.csv')
-df_alias = pd.read_csv('data/input/city_alias.csv')
-df_shortname_code = pd.read_csv('data/input/shortname_adcode copy.csv')
-minority_names_df = pd.read_csv('data/input/minority.csv',header=None)
-# Convert the minority names into a set for faster lookup.
-minority_names = set(minority_names_df.iloc[:, 0].values)
+
+from SymbolMatcher import SymbolMatcher
+
+# Specific substrings removed after the minority names, like'自治','特别'.
+REMOVED_SUBSTRINGS = ['自治', '特别', '行政', '直辖', '左翼前', '左翼中', '左翼后', '右翼前', '右翼中', '右翼后', '左翼']
+
+
+def compile_name_pattern(minority_names: Iterable[str]) -> re.Pattern:
+    """
+        One precompiled pattern for the minority names and the specific substrings.
+        Longer alternatives come first, so that '左翼前' is removed as a whole rather than as '左翼'.
+    """
+    names = sorted(set(minority_names) | set(REMOVED_SUBSTRINGS), key=len, reverse=True)
+    return re.compile('|'.join(re.escape(name) for name in names))
+
 
 # Function to process city names.
-def minimalize_city_name(city_name):
-    # Remove minority chracters in city names.
-    for minority in minority_names:
-        city_name = city_name.replace(minority, '')
-    
-    # Remove specific substrings,like'自治','特别'.
-    city_name = city_name.replace('自治', '').replace('特别', '').replace('行政', '').replace('直辖', '')
-    city_name = city_name.replace('左翼前', '').replace('左翼中', '').replace('左翼后', '').replace('右翼前', '').replace('右翼中', '').replace('右翼后', '').replace('左翼', '')
+def minimalize_city_name(city_name: str, name_pattern: re.Pattern) -> str:
+    # Remove minority chracters and specific substrings in city names in one pass.
+    city_name = name_pattern.sub('', city_name)
     # Remove the last character if the length is greater than 2, the administrative unit character is removed
     if len(city_name) > 2:
         city_name = city_name[:-1]
 
     return city_name
-"""
-对df的操作
-"""
-#删除地名中包含“市辖区”的行
-df = df[~df['fullname'].str.contains("市辖区")]
-#对地名极简化处理
-df['fullname'] = df['fullname'].apply(minimalize_city_name)
-#对极简化后的重复地名处理
-# 找出 'fullname' 列重复的所有行
-duplicates = df[df['fullname'].duplicated(keep=False)]
-# 对于重复的 'fullname'，保留 'adcode' 末尾包含两个 0 或四个 0 的行,当简化后的地名重复时，删除小地名，保留大地名
-df_filtered = duplicates[duplicates['adcode'].astype(str).str.endswith('00') | 
-                         duplicates['adcode'].astype(str).str.endswith('0000')]
-# 从原始 df 中删除不满足条件的重复行得到df_mainname_code
-df_mainname_code = pd.concat([df.drop(duplicates.index), df_filtered], ignore_index=True)
-df_mainname_code = df_mainname_code.rename(columns={'fullname': 'mainname'})
-"""
-对df_alias的操作
-"""
-#将df_alias与 df_mainname_code 连接
-df_alias_mergedcode = pd.merge(df_alias, df_mainname_code, on='mainname', how='left')
-df_alias_code = df_alias_mergedcode[['alias','adcode']]
-print(df_alias_code)
-#纵向合并df_mainname_code,df_alias_code,df_shortname_code为df_placesymbol_code,需要修改为一致的列名
-df_mainname_code.rename(columns={'mainname': 'placesymbol', 'adcode': 'placecode'}, inplace=True)
-df_alias_code.rename(columns={'alias': 'placesymbol', 'adcode': 'placecode'}, inplace=True)
-df_shortname_code.rename(columns={'shortname': 'placesymbol', 'adcode': 'placecode'}, inplace=True)
-# 使用 concat 方法纵向合并这三个 DataFrame，并直接对合并后的 DataFrame 按照 'code' 升序排列，重置行索引
-df_placesymbol_code = pd.concat([df_mainname_code, df_alias_code, df_shortname_code], ignore_index=True).sort_values(by='placecode').reset_index(drop=True)
-#输出地名符号与地名编码
-df_placesymbol_code.to_csv('data/output/placesymbol_code.csv',index=0)
 
-# # 将 DataFrame 转换为字典，以 'code' 列作为键，'name' 列作为值
-# dictionary = df_placesymbol_code.set_index('name')['code'].to_dict()
+
+def build_symbol_dict(df: pd.DataFrame, df_alias: pd.DataFrame, df_shortname_code: pd.DataFrame,
+                      minority_names: Iterable[str]) -> pd.DataFrame:
+    """
+        Build the placesymbol_code table from AMap_adcode, city_alias, shortname_adcode and the minority names:
+        columns placesymbol, placecode, symboltype, sorted by placecode.
+    """
+    # Compile the minority names and the specific substrings into one pattern.
+    name_pattern = compile_name_pattern(minority_names)
+    """
+    对df的操作
+    """
+    #删除地名中包含“市辖区”的行
+    df = df[~df['fullname'].str.contains("市辖区")].copy()
+    #对地名极简化处理
+    df['fullname'] = df['fullname'].apply(minimalize_city_name, name_pattern=name_pattern)
+    #对极简化后的重复地名处理
+    # 找出 'fullname' 列重复的所有行
+    duplicates = df[df['fullname'].duplicated(keep=False)]
+    # 对于重复的 'fullname'，保留 'adcode' 末尾包含两个 0 或四个 0 的行,当简化后的地名重复时，删除小地名，保留大地名
+    df_filtered = duplicates[duplicates['adcode'].astype(str).str.endswith('00') |
+                             duplicates['adcode'].astype(str).str.endswith('0000')]
+    # 从原始 df 中删除不满足条件的重复行得到df_mainname_code
+    df_mainname_code = pd.concat([df.drop(duplicates.index), df_filtered], ignore_index=True)
+    df_mainname_code = df_mainname_code.rename(columns={'fullname': 'mainname'})
+    """
+    对df_alias的操作
+    """
+    #将df_alias与 df_mainname_code 连接
+    df_alias_mergedcode = pd.merge(df_alias, df_mainname_code, on='mainname', how='left')
+    df_alias_code = df_alias_mergedcode[['alias','adcode']]
+    #纵向合并df_mainname_code,df_alias_code,df_shortname_code为df_placesymbol_code,需要修改为一致的列名
+    df_mainname_code = df_mainname_code.rename(columns={'mainname': 'placesymbol', 'adcode': 'placecode'})
+    df_alias_code = df_alias_code.rename(columns={'alias': 'placesymbol', 'adcode': 'placecode'})
+    df_shortname_code = df_shortname_code.rename(columns={'shortname': 'placesymbol', 'adcode': 'placecode'})
+    #记录符号类型，用于按类型拆分符号流
+    df_mainname_code['symboltype'] = 'mainname'
+    df_alias_code = df_alias_code.assign(symboltype='alias')
+    df_shortname_code['symboltype'] = 'shortname'
+    # 使用 concat 方法纵向合并这三个 DataFrame，并直接对合并后的 DataFrame 按照 'code' 升序排列，重置行索引
+    return pd.concat([df_mainname_code, df_alias_code, df_shortname_code], ignore_index=True).sort_values(by='placecode').reset_index(drop=True)
+
+
+if __name__ == '__main__':
+    #读取AMap_adcode.csv, addname_adcode.csv, minority.csv为df_mainname,df_aliasname和list_minority
+    df = pd.read_csv('data/input/AMap_adcode.csv')
+    df_alias = pd.read_csv('data/input/city_alias.csv')
+    df_shortname_code = pd.read_csv('data/input/shortname_adcode copy.csv')
+    minority_names_df = pd.read_csv('data/input/minority.csv',header=None)
+    df_placesymbol_code = build_symbol_dict(df, df_alias, df_shortname_code, minority_names_df.iloc[:, 0].values)
+    #输出地名符号与地名编码
+    df_placesymbol_code.to_csv('data/output/placesymbol_code.csv',index=0)
+    #输出编译好的字典，由 csv 重新读取构建，与直接读取 placesymbol_code.csv 的结果完全相同
+    SymbolMatcher.from_csv('data/output/placesymbol_code.csv').save('data/output/placesymbol_code.pkl',
+                                                                    'data/output/placesymbol_code.csv')
+
+    # # 将 DataFrame 转换为字典，以 'code' 列作为键，'name' 列作为值
+    # dictionary = df_placesymbol_code.set_index('name')['code'].to_dict()
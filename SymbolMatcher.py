@@ -0,0 +1,219 @@
+"""
+Data description:
+                placesymbol_code.csv is 地名符号与地名编号的映射字典, fields are 'placesymbol', 'placecode'.
+Function:
+                将地名符号字典编译为 Aho-Corasick 自动机
+                对每个POI名称只做一次线性扫描，找出最先出现的地名符号
+                find_all 找出名称中出现的所有地名符号及其首次出现的位置，用于建立匹配索引(MatchIndex)
+
+                Tie-break: 当多个符号在同一位置开始时（如“吉”与“吉林”），
+                取在 placesymbol_dict 中排序最靠前的符号，即 placesymbol_code.csv 中最先出现的符号，
+                与 check_and_extract 中 min(symbol_positions, key=symbol_positions.get) 的行为一致。
+
+                编译好的自动机可保存为 placesymbol_code.pkl，记录格式版本、字典版本与源 csv 的哈希，
+                之后直接加载，不必重新读取 csv 并构建自动机；源 csv 变化时自动重新编译
+                first_rank 返回符号的排序号，配合 placecodes 数组与 symbol_dtype(分类类型)构建紧凑的提取结果
+"""
+import os
+import json
+import pickle
+import hashlib
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from Manifest import file_sha256
+
+ARTIFACT_VERSION = 3
+
+
+class SymbolMatcher:
+    """
+        Aho-Corasick automaton over the keys of a placesymbol dictionary.
+        Built once, then find_first() scans a name in a single left-to-right pass.
+    """
+
+    def __init__(self, placesymbol_dict: Dict[str, int]):
+        self.placesymbol_dict = dict(placesymbol_dict)
+        # The rank of a symbol is its position in the dictionary, used to break ties
+        self.symbols: List[str] = [symbol for symbol in self.placesymbol_dict if isinstance(symbol, str)]
+        self.max_len = max((len(symbol) for symbol in self.symbols), default=0)
+        # placecodes[rank] is the code of a symbol as a float, NaN if it has none (an alias without a city);
+        # symbol_dtype is the categorical type of placesymbol columns, whose codes are the ranks
+        self.placecodes = pd.to_numeric(pd.Series([self.placesymbol_dict[symbol] for symbol in self.symbols],
+                                                  dtype=object), errors='coerce').to_numpy(dtype=np.float64)
+        self.symbol_dtype = pd.CategoricalDtype(self.symbols)
+        self._version: Optional[str] = None
+        # Path of the compiled artifact this matcher was saved to or loaded from
+        self.artifact_path: Optional[str] = None
+
+        # goto[node] maps a character to the child node, fail[node] is the failure link
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # best[node] is (length, rank) of the longest symbol ending at node, or None
+        self._best: List[Optional[Tuple[int, int]]] = [None]
+        # own[node] is the rank of the symbol spelled by node, or None;
+        # output[node] is the nearest node with a symbol among node and its failure chain, 0 if none
+        self._own: List[Optional[int]] = [None]
+        self._output: List[int] = [0]
+        self._empty_rank: Optional[int] = None
+
+        for rank, symbol in enumerate(self.symbols):
+            if not symbol:
+                # An empty symbol is found at position 0 of every name
+                if self._empty_rank is None:
+                    self._empty_rank = rank
+                continue
+            node = 0
+            for ch in symbol:
+                child = self._goto[node].get(ch)
+                if child is None:
+                    child = len(self._goto)
+                    self._goto[node][ch] = child
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._best.append(None)
+                    self._own.append(None)
+                    self._output.append(0)
+                node = child
+            if self._best[node] is None:
+                self._best[node] = (len(symbol), rank)
+                self._own[node] = rank
+
+        # Breadth-first construction of the failure links
+        queue = deque(self._goto[0].values())
+        for node in queue:
+            self._output[node] = node if self._own[node] is not None else 0
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                if node:
+                    self._fail[child] = self._goto[fallback].get(ch, 0)
+                # A node's own symbol is always longer than any symbol reached via its failure link
+                if self._best[child] is None:
+                    self._best[child] = self._best[self._fail[child]]
+                self._output[child] = child if self._own[child] is not None else self._output[self._fail[child]]
+
+    @classmethod
+    def from_csv(cls, file_path: str) -> 'SymbolMatcher':
+        """
+            Build the matcher from placesymbol_code.csv.
+        """
+        placesymbol_code_df = pd.read_csv(file_path)
+        return cls(placesymbol_code_df.set_index('placesymbol')['placecode'].to_dict())
+
+    @property
+    def version(self) -> str:
+        """
+            Content hash of the dictionary, symbols in rank order with their codes.
+            Extraction results depend on both, so they are only reused for the same version.
+        """
+        if self._version is None:
+            items = [[symbol, int(self.placesymbol_dict[symbol])] for symbol in self.symbols]
+            self._version = hashlib.sha256(json.dumps(items, ensure_ascii=False).encode('utf-8')).hexdigest()[:16]
+        return self._version
+
+    def save(self, path: str, source_path: str = None):
+        """
+            Save the compiled matcher as a versioned artifact, with the hash of the csv it was built from.
+        """
+        artifact = {'format': ARTIFACT_VERSION, 'version': self.version,
+                    'source_sha256': file_sha256(source_path) if source_path else None, 'matcher': self}
+        # Write then rename, so that a worker never loads a half written artifact
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(artifact, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+        self.artifact_path = path
+
+    @classmethod
+    def load(cls, path: str, source_path: str = None) -> 'SymbolMatcher':
+        """
+            Load a compiled artifact. With source_path, raise ValueError when that csv has changed since.
+        """
+        with open(path, 'rb') as f:
+            artifact = pickle.load(f)
+        if artifact.get('format') != ARTIFACT_VERSION:
+            raise ValueError(f"{path} has artifact format {artifact.get('format')}, expected {ARTIFACT_VERSION}")
+        if source_path is not None and artifact['source_sha256'] != file_sha256(source_path):
+            raise ValueError(f"{path} was not compiled from the current {source_path}")
+        matcher = artifact['matcher']
+        matcher.artifact_path = path
+        return matcher
+
+    @classmethod
+    def load_or_compile(cls, source_path: str, artifact_path: str) -> 'SymbolMatcher':
+        """
+            Load the artifact compiled from placesymbol_code.csv, compiling and saving it first if it is missing or stale.
+        """
+        try:
+            return cls.load(artifact_path, source_path)
+        except (OSError, ValueError, KeyError, pickle.UnpicklingError, EOFError):
+            matcher = cls.from_csv(source_path)
+            matcher.save(artifact_path, source_path)
+            return matcher
+
+    def find_first(self, text: str) -> Optional[Tuple[int, str]]:
+        """
+            Return (position, symbol) of the placesymbol that appears first in text, or None.
+            Symbols starting at the same position are resolved by their rank in placesymbol_dict.
+        """
+        best_start, best_rank = self._first(text)
+        if best_start < 0:
+            return None
+        return best_start, self.symbols[best_rank]
+
+    def first_rank(self, text: str) -> int:
+        """
+            Rank of the symbol find_first returns, -1 if there is none.
+        """
+        best_start, best_rank = self._first(text)
+        return best_rank if best_start >= 0 else -1
+
+    def _first(self, text: str) -> Tuple[int, Optional[int]]:
+        goto, fail, best = self._goto, self._fail, self._best
+        best_start = 0 if self._empty_rank is not None else -1
+        best_rank = self._empty_rank
+        # Once i has moved max_len past best_start, no later match can start earlier
+        horizon = best_start + self.max_len - 1 if best_start >= 0 else len(text)
+        node = 0
+        for i, ch in enumerate(text):
+            if i > horizon:
+                break
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            hit = best[node]
+            if hit is not None:
+                start = i - hit[0] + 1
+                if best_start < 0 or start < best_start or (start == best_start and hit[1] < best_rank):
+                    best_start, best_rank = start, hit[1]
+                    horizon = best_start + self.max_len - 1
+        return best_start, best_rank
+
+    def find_all(self, text: str) -> Dict[int, int]:
+        """
+            Return {rank: position} of every placesymbol in text, at its first occurrence.
+            find_first(text) is the hit with the smallest (position, rank).
+        """
+        goto, fail, own, output = self._goto, self._fail, self._own, self._output
+        symbols = self.symbols
+        found = {self._empty_rank: 0} if self._empty_rank is not None else {}
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            # Every symbol ending at i is on the output chain of node
+            hit = output[node]
+            while hit:
+                rank = own[hit]
+                if rank not in found:
+                    found[rank] = i - len(symbols[rank]) + 1
+                hit = output[fail[hit]]
+        return found
@@ -11,6 +11,10 @@ Function:
                 添加字段“OD_code”：基于新的 adcode 和 placecode 值创建“OD_code”字段。
                 计数并合并：对每个dataframe的OD_code进行计数，然后合并所有的计数结果。
                 导出最终结果为csv：将合并后的结果导出为一个新的CSV文件。
+                一次扫描同时导出不含本地符号流的 Symbolicflows.csv、含本地符号流的 Symbolicflows_withlocal.csv
+                和只含本地符号流的 Symbolicflows_local.csv
+                使用 manifest 时只读取新增或变化的文件，其余文件使用缓存的 (placecode, adcode) 部分计数
+                可选地在同一次扫描中同时累计 (起点城市, 终点城市, 地名符号) 的稀疏计数 FlowCube，导出按地名符号拆分的符号流
 
 
                 判断符号是本地还是外地符号,地级市前4位是否相同,直辖市是前3位是否相同
@@ -19,94 +23,103 @@ Function:
                 则
                
 """
-import os
-import glob
 import pandas as pd
-
-
-def process_csv(file_path):
-    # 读取CSV文件
-    df_raw = pd.read_csv(file_path,header=0)
-    
-    # 将省直辖县级市、港澳台纳入考虑范围之外
-    # 找出df中需要删除的行
-    rows_to_delete = df_raw['placecode'].isin(df_provincialcounties['adcode']) | df_raw['adcode'].isin(df_provincialcounties['adcode'])
-    # 使用逻辑否定(~)来保留不需要删除的行
-    df= df_raw[~rows_to_delete]
-    
-    #添加条件判断句，修改前打印是否满足条件
-    
-    #将莱芜区370116处理为莱芜市371200
-    df.loc[:, 'placecode'] = df['placecode'].astype(str).str[:6].replace('370116','371200')
-    #将那曲地区542400处理为那曲市540600
-    # contains_value = df['adcode'].astype(str).str.contains('542400')
-    # if contains_value.any(): 
-    #     print("file_path")
-    # df.loc[:, 'adcode'] = df['adcode'].astype(str).str[:6].replace('542400','540600')
-    # 截取adcode和placecode的前4位，并根据条件修改值
-    df.loc[:, 'adcode'] = df['adcode'].astype(str).str[:4].replace(['^31..', '^11..', '^12..', '^50..','5424'], ['3100', '1100', '1200', '5000','5406'], regex=True)#直辖市
-
-    
-    df.loc[:, 'placecode'] = df['placecode'].astype(str).str[:4].replace({
-        #'1101': '1100', '1201': '1200', '3101': '3100', '5001': '5000',#直辖市
-        '1300': '1301', '1400': '1401', '1500': '1501', #省会城市
-        '2100': '2101', '2200': '2201', '2300': '2301', #省会城市
-        '3200': '3201', '3300': '3301', '3400': '3401', #省会城市
-        '3500': '3501', '3600': '3601', '3700': '3701', #省会城市
-        '4100': '4101', '4200': '4201', '4300': '4301', #省会城市
-        '4400': '4401', '4500': '4501', '4600': '4601', #省会城市
-        '5100': '5101', '5200': '5201', '5300': '5301', #省会城市
-        '5400': '5401',
-        '6100': '6101', '6200': '6201', '6300': '6301', #省会城市
-        '6400': '6401', '6500': '6501'#省会城市
-        })
-    
-    df.loc[:, 'placecode'] = df['placecode'].astype(str).str[:4].replace(['^31..', '^11..', '^12..', '^50..'], ['3100', '1100', '1200', '5000'], regex=True)#直辖市
-    
-
-    # 删除adcode和placecode相同的行
-    df = df[df['adcode'] != df['placecode']]
-
-    # 添加OD_code字段
-    df['OD_code'] = df['placecode'] + '00_' + df['adcode']+'00'
-
-    return df
-
-#读取省直辖县级行政单位的符号与编码
-df_provincialcounties = pd.read_csv('data\input\provincialcounties.csv',header=0)
-# 设定文件夹路径
-folder_path = 'data\output\extractresult'  # 替换为你的文件夹路径
-
-# 获取所有CSV文件路径
-csv_files = glob.glob(os.path.join(folder_path, "*.csv"))
-
-# 初始化一个空的DataFrame来存储最终计数结果
-all_counts = []
-
-# 处理每个CSV文件
-for file in csv_files:
-    df = process_csv(file)
-    # 计算OD_code的计数
-    counts = df['OD_code'].value_counts().reset_index()
-    counts.columns = ['OD_code', 'count']
-    # 合并计数
-    all_counts.append(counts)
-
-# 合并所有dataframe的OD_code计数
-final_counts = pd.concat(all_counts, ignore_index=True).groupby('OD_code').sum().reset_index()
-final_counts.to_csv('data\output\OD_code_counts.csv', index=False)
-
-split_df = final_counts['OD_code'].str.split('_', expand=True)
-final_counts['Ocity']= split_df[0].astype(int)
-final_counts['Dcity']= split_df[1].astype(int)
-#添加符号流的其他信息, Ocity, O_adcode, O_X, O_Y, Dcity, D_adcode, D_X, D_Y,
-df_cities = pd.read_csv('data\output\city_geocode.csv',header=0)
-df_cities.drop(['gcj_x','gcj_y'], axis=1, inplace=True)
-merged_df = final_counts.merge(df_cities, left_on='Ocity', right_on='adcode',how='outer')
-merged_df = merged_df.rename(columns={'fullname': 'Ocity_name','wgs_x':'O_X', 'wgs_y':'O_Y'})
-df_symbolflow = merged_df.merge(df_cities, left_on='Dcity', right_on='adcode',how='outer')
-df_symbolflow = df_symbolflow.rename(columns={'fullname': 'Dcity_name','wgs_x':'D_X', 'wgs_y':'D_Y'})
-
-# 导出结果为CSV
-df_symbolflow.to_csv('data\output\Symbolicflows.csv', index=False)
-
+from typing import Iterable, List
+from FlowBuilder import CityIndex, ODMatrix, FlowCube, count_pairs, write_symbolflows
+from TableIO import read_table, write_table, list_tables
+from Manifest import RunManifest
+from Instrumentation import EventLog, Progress, peak_rss_mb
+
+
+def process_csv(file_path, od_matrix, cube=None):
+    # 读取CSV或parquet文件，只需要adcode和placecode两列，累计 FlowCube 时还需要placesymbol
+    df_raw = read_table(file_path, columns=['adcode','placecode'] + (['placesymbol'] if cube is not None else []))
+    # 将adcode和placecode映射为城市编号，在城市×城市矩阵中累计计数，省直辖县级市被删除
+    kept, local = od_matrix.add(df_raw['placecode'], df_raw['adcode'])
+    if cube is not None:
+        cube.add(df_raw['placecode'], df_raw['adcode'], df_raw['placesymbol'])
+    return len(df_raw), kept, local
+
+def build_od_matrix(csv_files: List[str], provincial_adcodes: Iterable[int], manifest_path: str = None,
+                    events: EventLog = None, progress: bool = None, cube: FlowCube = None) -> ODMatrix:
+    """
+        Scan the extraction results once into a city x city matrix.
+        Local flows are kept on the diagonal, so every symbol flow variant can be taken from the same matrix.
+        With cube, a FlowCube, the (origin, destination, placesymbol) counts are accumulated into it
+        from the same reads, and the matrix shares its CityIndex; cube.to_od_matrix() then equals the returned matrix.
+        With manifest_path only new or changed files are read, the others add their cached partial counts,
+        which are (placecode, adcode, placesymbol) counts when a cube is accumulated. Runs with and without
+        a cube should use different manifests, each one invalidates the cached counts of the other.
+        A 'file' event per file gives the rows read, the rows dropped as provincial counties (or with codes that
+        do not map to a city) and the local flows; progress shows a live progress line over the files.
+    """
+    events = events or EventLog()
+    od_matrix = ODMatrix(cube.city_index if cube is not None else CityIndex(provincial_adcodes))
+    # Partial counts without placesymbol cannot fill a cube, so those runs keep their own cache entries
+    settings = {'placesymbol': True} if cube is not None else None
+    manifest = RunManifest(manifest_path, settings) if manifest_path is not None else None
+    columns = ['adcode', 'placecode'] + (['placesymbol'] if cube is not None else [])
+    pending = set(csv_files)
+    if manifest is not None:
+        cached, pending = manifest.split(csv_files)
+        print(f"{len(cached)} files unchanged since the last run, {len(pending)} files to read")
+        pending = set(pending)
+    progress_bar = Progress(len(csv_files), 'files', 'Building flows', enabled=progress)
+    totals = {'rows': 0, 'provincial': 0, 'local': 0}
+    # 处理每个CSV文件
+    for file in csv_files:
+        with events.timed('file', file=file, cached=file not in pending) as fields:
+            if manifest is None:
+                rows, kept, local = process_csv(file, od_matrix, cube)
+            else:
+                if file in pending:
+                    manifest.discard(file)
+                    pairs = count_pairs(read_table(file, columns=columns), with_symbol=cube is not None)
+                    manifest.record(file, pairs)
+                else:
+                    pairs = manifest.counts(file)
+                rows = int(pairs['count'].sum())
+                kept, local = od_matrix.add(pairs['placecode'], pairs['adcode'], weights=pairs['count'])
+                if cube is not None:
+                    cube.add(pairs['placecode'], pairs['adcode'], pairs['placesymbol'], weights=pairs['count'])
+            fields.update(rows=rows, provincial=rows - kept, local=local)
+        for key, value in [('rows', rows), ('provincial', rows - kept), ('local', local)]:
+            totals[key] += value
+        progress_bar.update(1)
+    progress_bar.close()
+    events.emit('run', files=len(csv_files), **totals, peak_rss_mb=peak_rss_mb())
+    return od_matrix
+
+if __name__ == '__main__':
+    #读取省直辖县级行政单位的符号与编码
+    df_provincialcounties = pd.read_csv('data\\input\\provincialcounties.csv',header=0)
+    # 设定文件夹路径
+    folder_path = 'data\\output\\extractresult'  # 替换为你的文件夹路径
+
+    # 获取所有CSV与parquet文件路径
+    csv_files = list_tables(folder_path)
+
+    # 运行事件，每行一个 JSON 对象
+    events = EventLog('data\\output\\events.jsonl', stage='flows')
+    # 按地名符号拆分的符号流：OD_code, placesymbol, symboltype, count，与城市×城市矩阵在同一次扫描中累计
+    build_cube = False
+    cube = None
+    if build_cube:
+        df_symbols = pd.read_csv('data\\output\\placesymbol_code.csv', header=0)
+        cube = FlowCube(CityIndex(df_provincialcounties['adcode']), df_symbols)
+    # 一次扫描累计城市×城市的计数矩阵，只读取上次运行后新增或变化的文件
+    # 累计 FlowCube 的缓存计数含 placesymbol，使用单独的 manifest，与不累计 FlowCube 的运行交替时互不影响
+    manifest_path = 'data\\output\\flow_manifest_by_symbol.json' if build_cube else 'data\\output\\flow_manifest.json'
+    od_matrix = build_od_matrix(csv_files, df_provincialcounties['adcode'], manifest_path=manifest_path,
+                                events=events, cube=cube)
+
+    #添加符号流的其他信息, Ocity, O_adcode, O_X, O_Y, Dcity, D_adcode, D_X, D_Y,
+    df_cities = pd.read_csv('data\\output\\city_geocode.csv',header=0)
+
+    # 导出结果为CSV: Symbolicflows.csv, Symbolicflows_withlocal.csv, Symbolicflows_local.csv
+    # output_format='parquet' 导出为列式存储，供后续内部读取
+    with events.timed('write'):
+        write_symbolflows(od_matrix, df_cities, 'data\\output', output_format='csv')
+    if cube is not None:
+        write_table(cube.to_frame(), 'data\\output\\Symbolicflows_by_symbol.csv')
+    events.close()
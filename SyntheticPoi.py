@@ -0,0 +1,188 @@
+"""
+Data description:
+                placesymbol_code.csv is 地名符号与地名编号的映射字典, fields are 'placesymbol', 'placecode'.
+                AMap_adcode.csv is 高德行政区划+sdcode
+Function:
+                生成合成的POI文件，用于在没有授权POI数据的环境下测试和基准测试
+                文件为GBK编码的csv，列与POI数据相同：name,_id,adcode,address,type,lng,lat
+                名称由不含地名符号的常见POI用词组成，按给定比例(match_rate)插入 placesymbol_code.csv 中的地名符号，
+                部分名称带括号后缀(如 "(西湖店)")，其中的地名符号在提取时会被去掉
+                按给定比例写入格式错误的行(字段过多)和无法按GBK解码的行
+                按给定比例(duplicate_rate)重复使用前面文件的 _id，模拟覆盖范围重叠的POI文件
+                同时可生成与行政区划对应的合成城市地理编码 city_geocode.csv
+
+                python SyntheticPoi.py <output_dir> --files 4 --rows 1000000 --match-rate 0.3
+"""
+import os
+import argparse
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from SymbolMatcher import SymbolMatcher
+
+POI_COLUMNS = ['name', '_id', 'adcode', 'address', 'type', 'lng', 'lat']
+
+# Common words of POI names, those containing a placesymbol of the dictionary are left out
+FILLER_WORDS = ['超市', '便利店', '饭店', '酒楼', '银行', '药房', '花园', '小区', '大厦', '公司', '学校', '医院',
+                '宾馆', '网吧', '理发店', '五金店', '水果店', '家具城', '汽修厂', '幼儿园', '加油站', '停车场',
+                '书店', '茶馆', '烧烤', '面馆', '诊所', '邮局', '菜市场', '服装店', '眼镜店', '健身房']
+POI_TYPES = ['餐饮服务', '购物服务', '生活服务', '住宿服务', '医疗保健服务', '金融保险服务', '科教文化服务', '汽车服务']
+
+
+def filler_words(matcher: SymbolMatcher, words: Sequence[str] = FILLER_WORDS) -> List[str]:
+    """
+        The words that contain no placesymbol of matcher, so that only inserted symbols are matched.
+    """
+    words = [word for word in words if matcher.find_first(word) is None]
+    if not words:
+        raise ValueError("Every filler word contains a placesymbol")
+    return words
+
+
+def generate_names(rng: np.random.Generator, n_rows: int, symbols: Sequence[str], fillers: Sequence[str],
+                   match_rate: float = 0.3, suffix_rate: float = 0.2) -> Tuple[List[str], np.ndarray]:
+    """
+        n_rows POI names of one to three filler words. A fraction match_rate of the names has a placesymbol
+        at the start or between two words, a fraction suffix_rate has a parenthesized branch suffix
+        holding a placesymbol or a filler word.
+        Returns the names and the mask of the names with a placesymbol outside the parentheses.
+    """
+    n_words = rng.integers(1, 4, n_rows)
+    words = rng.integers(0, len(fillers), (n_rows, 3))
+    matched = rng.random(n_rows) < match_rate
+    symbol_ids = rng.integers(0, len(symbols), n_rows)
+    # Position of the symbol among the words, 0 being the start of the name
+    symbol_positions = rng.integers(0, n_words)
+    suffixed = rng.random(n_rows) < suffix_rate
+    suffix_symbols = rng.random(n_rows) < 0.5
+    suffix_ids = rng.integers(0, len(symbols), n_rows)
+
+    names = []
+    for row in range(n_rows):
+        parts = [fillers[word] for word in words[row, :n_words[row]]]
+        if matched[row]:
+            parts.insert(symbol_positions[row], symbols[symbol_ids[row]])
+        if suffixed[row]:
+            branch = symbols[suffix_ids[row]] if suffix_symbols[row] else fillers[words[row, 0]]
+            parts.append(f'({branch}店)')
+        names.append(''.join(parts))
+    return names, matched
+
+
+def generate_poi_csv(file_path: str, n_rows: int, symbols: Sequence[str], fillers: Sequence[str],
+                     adcodes: Sequence[int], match_rate: float = 0.3, suffix_rate: float = 0.2,
+                     bad_line_rate: float = 0.001, id_offset: int = 0, seed: int = 0,
+                     chunk_rows: int = 100000, duplicate_rate: float = 0.0) -> Dict[str, int]:
+    """
+        Write one synthetic GBK POI file of n_rows data lines.
+        _ids are 'B0' followed by id_offset + row in hexadecimal, so files with different offsets share no _id,
+        except for a fraction duplicate_rate of the rows that reuse a random _id below id_offset, as POIs of
+        overlapping files do.
+        A fraction bad_line_rate of the lines is malformed: half of them have too many fields,
+        the other half contain bytes that are not valid GBK.
+        Returns the number of data lines, of well-formed lines with a placesymbol, of bad lines
+        and of lines with a reused _id.
+    """
+    rng = np.random.default_rng(seed)
+    adcodes = np.asarray(adcodes)
+    stats = {'rows': 0, 'matched': 0, 'bad_lines': 0, 'duplicates': 0}
+    with open(file_path, 'wb') as f:
+        f.write((','.join(POI_COLUMNS) + '\n').encode('gbk'))
+        for chunk_start in range(0, n_rows, chunk_rows):
+            n = min(chunk_rows, n_rows - chunk_start)
+            names, matched = generate_names(rng, n, symbols, fillers, match_rate, suffix_rate)
+            codes = adcodes[rng.integers(0, len(adcodes), n)]
+            types = rng.integers(0, len(POI_TYPES), n)
+            lng = rng.uniform(73.5, 134.8, n)
+            lat = rng.uniform(18.2, 53.5, n)
+            bad = rng.random(n) < bad_line_rate
+            id_numbers = id_offset + chunk_start + np.arange(n)
+            if id_offset > 0 and duplicate_rate > 0:
+                reused = rng.random(n) < duplicate_rate
+                id_numbers[reused] = rng.integers(0, id_offset, int(reused.sum()))
+                stats['duplicates'] += int(reused.sum())
+            lines = []
+            for row in range(n):
+                _id = f'B0{id_numbers[row]:08X}'
+                line = f'{names[row]},{_id},{codes[row]},{names[row][:2]}路{row % 500}号,{POI_TYPES[types[row]]},{lng[row]:.6f},{lat[row]:.6f}\n'
+                encoded = line.encode('gbk', errors='replace')
+                if bad[row]:
+                    # Too many fields, or a byte sequence that is not GBK
+                    encoded = encoded[:-1] + b',x,y\n' if row % 2 else b'\xff\xfe' + encoded
+                lines.append(encoded)
+            f.write(b''.join(lines))
+            stats['rows'] += n
+            stats['bad_lines'] += int(bad.sum())
+            stats['matched'] += int((matched & ~bad).sum())
+    return stats
+
+
+def district_adcodes(df_adcode: pd.DataFrame) -> np.ndarray:
+    """
+        The county level adcodes of AMap_adcode.csv, which are the adcodes POIs carry.
+    """
+    adcodes = df_adcode['adcode'].astype(int)
+    return adcodes[adcodes % 100 != 0].to_numpy()
+
+
+def synthetic_geocode(df_adcode: pd.DataFrame, seed: int = 0) -> pd.DataFrame:
+    """
+        A city_geocode.csv with the cities of AMap_adcode.csv at random coordinates inside China's bounding box,
+        for running flow building and city metrics without the geocoding service.
+    """
+    rng = np.random.default_rng(seed)
+    df = df_adcode[['fullname', 'adcode']].copy()
+    df['gcj_x'] = rng.uniform(73.5, 134.8, len(df))
+    df['gcj_y'] = rng.uniform(18.2, 53.5, len(df))
+    df['wgs_x'] = df['gcj_x'] - 0.005
+    df['wgs_y'] = df['gcj_y'] - 0.002
+    return df
+
+
+def generate_poi_files(output_dir: str, n_files: int, rows_per_file: int, df_symbols: pd.DataFrame,
+                       df_adcode: pd.DataFrame, match_rate: float = 0.3, suffix_rate: float = 0.2,
+                       bad_line_rate: float = 0.001, seed: int = 0, duplicate_rate: float = 0.0) -> List[str]:
+    """
+        Write n_files synthetic POI files poi_00000.csv ... of rows_per_file lines each into output_dir.
+        The names use the placesymbols of df_symbols (placesymbol_code.csv), the adcodes the counties of df_adcode.
+        Returns the file paths.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    matcher = SymbolMatcher(dict(zip(df_symbols['placesymbol'], df_symbols['placecode'])))
+    symbols = [symbol for symbol in df_symbols['placesymbol'] if isinstance(symbol, str)]
+    fillers = filler_words(matcher)
+    adcodes = district_adcodes(df_adcode)
+    file_paths = []
+    for file_no in range(n_files):
+        file_path = os.path.join(output_dir, f'poi_{file_no:05d}.csv')
+        generate_poi_csv(file_path, rows_per_file, symbols, fillers, adcodes, match_rate, suffix_rate,
+                         bad_line_rate, id_offset=file_no * rows_per_file, seed=seed + file_no,
+                         duplicate_rate=duplicate_rate)
+        file_paths.append(file_path)
+    return file_paths
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate synthetic GBK POI files')
+    parser.add_argument('output_dir')
+    parser.add_argument('--files', type=int, default=4)
+    parser.add_argument('--rows', type=int, default=1000000, help='data lines per file')
+    parser.add_argument('--match-rate', type=float, default=0.3)
+    parser.add_argument('--suffix-rate', type=float, default=0.2)
+    parser.add_argument('--bad-line-rate', type=float, default=0.001)
+    parser.add_argument('--duplicate-rate', type=float, default=0.0, help='rows reusing an _id of an earlier file')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--dictionary', default='data/output/placesymbol_code.csv')
+    parser.add_argument('--adcode', default='data/input/AMap_adcode.csv')
+    parser.add_argument('--geocode', help='also write a synthetic city_geocode.csv here')
+    args = parser.parse_args()
+
+    df_symbols = pd.read_csv(args.dictionary)
+    df_adcode = pd.read_csv(args.adcode)
+    paths = generate_poi_files(args.output_dir, args.files, args.rows, df_symbols, df_adcode, args.match_rate,
+                               args.suffix_rate, args.bad_line_rate, args.seed, args.duplicate_rate)
+    print(f"Wrote {len(paths)} files of {args.rows} lines to {args.output_dir}")
+    if args.geocode:
+        synthetic_geocode(df_adcode, args.seed).to_csv(args.geocode, index=False)
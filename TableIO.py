@@ -0,0 +1,124 @@
+"""
+Function:
+                中间结果与最终结果的读写，支持 csv 与列式存储 parquet 两种格式
+                parquet 中 placesymbol 为字典编码，adcode、placecode 为整数，使用 zstd 压缩
+                读取 parquet 时只读取需要的列
+                parquet 需要安装 pyarrow，csv 不需要
+"""
+import os
+from typing import List
+
+import pandas as pd
+
+FORMATS = ('csv', 'parquet')
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("output_format='parquet' requires pyarrow, install it with 'pip install pyarrow'") from e
+    return pyarrow
+
+
+def check_format(output_format: str):
+    if output_format not in FORMATS:
+        raise ValueError(f"output_format must be one of {FORMATS}, got {output_format!r}")
+    if output_format == 'parquet':
+        _pyarrow()
+
+
+def extraction_schema(with_name: bool = True):
+    """
+        Arrow schema of the extraction results: name,_id,adcode,placesymbol,placecode, name being optional.
+    """
+    pa = _pyarrow()
+    return pa.schema(([('name', pa.string())] if with_name else []) + [
+        ('_id', pa.string()),
+        ('adcode', pa.int64()),
+        ('placesymbol', pa.dictionary(pa.int32(), pa.string())),
+        ('placecode', pa.int64()),
+    ])
+
+
+def extraction_table(results: pd.DataFrame):
+    """
+        Convert extraction results to an Arrow table with integer codes and a dictionary-encoded placesymbol.
+    """
+    pa = _pyarrow()
+    columns = {}
+    if 'name' in results.columns:
+        columns['name'] = results['name'].astype(str)
+    placesymbols = results['placesymbol']
+    columns.update({
+        '_id': results['_id'].astype(str),
+        'adcode': pd.to_numeric(results['adcode'], errors='coerce').astype('Int64'),
+        # The categorical of extract_matches is written as it is, only the used symbols end up in the file
+        'placesymbol': (placesymbols.cat.remove_unused_categories() if isinstance(placesymbols.dtype, pd.CategoricalDtype)
+                        else placesymbols.astype(str).astype('category')),
+        'placecode': pd.to_numeric(results['placecode'], errors='coerce').astype('Int64'),
+    })
+    return pa.Table.from_pandas(pd.DataFrame(columns), schema=extraction_schema('name' in columns),
+                                preserve_index=False)
+
+
+class ParquetShard:
+    """
+        One parquet output shard, written row group by row group.
+    """
+
+    def __init__(self, path: str):
+        _pyarrow()
+        self.path = path
+        # Opened at the first write, once it is known whether the results have names
+        self.writer = None
+
+    def write(self, results: pd.DataFrame):
+        table = extraction_table(results)
+        if self.writer is None:
+            self.writer = _pyarrow().parquet.ParquetWriter(self.path, table.schema, compression='zstd')
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def table_path(path: str, output_format: str) -> str:
+    """
+        path with its extension replaced by that of output_format.
+    """
+    return os.path.splitext(path)[0] + '.' + output_format
+
+
+def write_table(df: pd.DataFrame, path: str, output_format: str = 'csv') -> str:
+    """
+        Write a result table as csv or parquet, the extension of path follows output_format.
+    """
+    check_format(output_format)
+    path = table_path(path, output_format)
+    if output_format == 'parquet':
+        df.to_parquet(path, index=False, compression='zstd')
+    else:
+        df.to_csv(path, index=False)
+    return path
+
+
+def read_table(path: str, columns: List[str] = None) -> pd.DataFrame:
+    """
+        Read a csv or parquet table, only the given columns.
+    """
+    if path.endswith('.parquet'):
+        _pyarrow()
+        return pd.read_parquet(path, columns=columns)
+    return pd.read_csv(path, header=0, usecols=columns)
+
+
+def list_tables(folder_path: str, prefix: str = 'output_') -> List[str]:
+    """
+        The csv and parquet tables of a folder whose name starts with prefix, by default the extraction shards
+        output_<file>_<n>, so that reports kept in the same folder are not read as results. Sorted by name.
+    """
+    return sorted(os.path.join(folder_path, name) for name in os.listdir(folder_path)
+                  if name.startswith(prefix) and (name.endswith('.csv') or name.endswith('.parquet')))
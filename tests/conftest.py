@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The modules are flat scripts at the repository root
+sys.path.insert(0, REPO_DIR)
+
+from SymbolDict import build_symbol_dict
+
+
+@pytest.fixture(scope='session')
+def placesymbol_code_path(tmp_path_factory):
+    """
+        placesymbol_code.csv built by SymbolDict from the dictionary data in the repository.
+    """
+    df = build_symbol_dict(pd.read_csv(os.path.join(REPO_DIR, 'AMap_adcode.csv')),
+                           pd.read_csv(os.path.join(REPO_DIR, 'city_alias.csv')),
+                           pd.read_csv(os.path.join(REPO_DIR, 'shortname_adcode.csv')),
+                           pd.read_csv(os.path.join(REPO_DIR, 'minority.csv'), header=None).iloc[:, 0].values)
+    path = tmp_path_factory.mktemp('dictionary') / 'placesymbol_code.csv'
+    df.to_csv(path, index=0)
+    return str(path)
@@ -0,0 +1,102 @@
+"""
+Function:
+                向量化的玫瑰熵、玫瑰引力与逐行计算的 calculate_od_metrics 结果一致
+                rose_entropy_sweep 合并基础区间得到的各区间玫瑰熵与逐个区间单独计算的结果一致
+                稀疏边表上的加权 PageRank、HITS 与稠密矩阵特征向量的结果一致
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from CitiesAttributes import calculate_od_metrics, calculate_od_metrics_vectorized, rose_entropy_sweep, \
+    calculate_network_metrics
+
+METRICS = ['entropy_out', 'entropy_in', 'gravity_out', 'gravity_in']
+
+
+@pytest.fixture(scope='module')
+def flows():
+    """
+        Symbolic flows between 30 random cities in China, with a few local flows (zero distance) and
+        a city that only sends flows and one that only receives them.
+    """
+    rng = np.random.default_rng(0)
+    names = np.array([f'city{i}' for i in range(30)], dtype=object)
+    x, y = rng.uniform(75, 134, len(names)), rng.uniform(18, 53, len(names))
+    o, d = rng.integers(0, 28, 400), rng.integers(0, 28, 400)
+    o = np.concatenate([o, [28, 28, 5]])
+    d = np.concatenate([d, [3, 7, 29]])
+    return pd.DataFrame({
+        'Ocity_name': names[o], 'Dcity_name': names[d],
+        'O_X': x[o], 'O_Y': y[o], 'D_X': x[d], 'D_Y': y[d],
+        'count': rng.integers(1, 1000, len(o)),
+    })
+
+
+def test_vectorized_metrics_match_row_wise(flows):
+    expected = calculate_od_metrics(flows).sort_values('cityname', ignore_index=True)
+    result = calculate_od_metrics_vectorized(flows).sort_values('cityname', ignore_index=True)
+    assert list(result.columns) == list(expected.columns)
+    assert result['cityname'].tolist() == expected['cityname'].tolist()
+    for column in METRICS:
+        # The row-wise version leaves None for cities without flows in a direction, the vectorized one NaN
+        np.testing.assert_allclose(result[column].to_numpy(dtype=np.float64),
+                                   expected[column].to_numpy(dtype=np.float64), rtol=1e-10, atol=1e-9)
+    only_out = result['cityname'] == 'city28'
+    assert result.loc[only_out, ['entropy_in', 'gravity_in']].isna().all(axis=None)
+
+
+@pytest.mark.parametrize('intervals, base_interval', [((5, 10, 15, 20, 30, 45, 60, 90), None),
+                                                      ((20, 40, 120), None), ((30, 90), 15)])
+def test_sweep_matches_single_intervals(flows, intervals, base_interval):
+    sweep = rose_entropy_sweep(flows, intervals, base_interval)
+    assert sorted(sweep['interval'].unique()) == sorted(intervals)
+    for interval in intervals:
+        single = calculate_od_metrics_vectorized(flows, interval=interval)
+        for direction in ['out', 'in']:
+            rows = sweep[(sweep['interval'] == interval) & (sweep['direction'] == direction)]
+            expected = single.dropna(subset=[f'entropy_{direction}'])
+            assert rows['cityname'].tolist() == expected['cityname'].tolist()
+            np.testing.assert_allclose(rows['entropy'].to_numpy(), expected[f'entropy_{direction}'].to_numpy(),
+                                       rtol=1e-10, atol=1e-12)
+
+
+@pytest.mark.parametrize('intervals, base_interval', [((7,), None), ((20, 30), 20), ((20,), 7)])
+def test_sweep_rejects_bad_intervals(flows, intervals, base_interval):
+    with pytest.raises(ValueError):
+        rose_entropy_sweep(flows, intervals, base_interval)
+
+
+def _principal(matrix):
+    """
+        The eigenvector of the largest eigenvalue, scaled to sum to 1.
+    """
+    values, vectors = np.linalg.eig(matrix)
+    vector = np.abs(np.real(vectors[:, np.argmax(np.real(values))]))
+    return vector / vector.sum()
+
+
+def test_network_metrics_match_dense_reference(flows):
+    damping = 0.85
+    # Repeated pairs of cities are summed into one edge
+    metrics = calculate_network_metrics(pd.concat([flows, flows.iloc[:20]], ignore_index=True), damping)
+    cities = list(metrics['cityname'])
+    n = len(cities)
+    weights = np.zeros((n, n))
+    position = {city: i for i, city in enumerate(cities)}
+    for df in [flows, flows.iloc[:20]]:
+        np.add.at(weights, (df['Ocity_name'].map(position).to_numpy(), df['Dcity_name'].map(position).to_numpy()),
+                  df['count'].to_numpy(dtype=np.float64))
+    np.testing.assert_allclose(metrics['strength_out'], weights.sum(axis=1))
+    np.testing.assert_allclose(metrics['strength_in'], weights.sum(axis=0))
+
+    # Google matrix: rows of cities without outgoing flows (city29) jump to any city
+    strength_out = weights.sum(axis=1, keepdims=True)
+    transition = np.where(strength_out > 0, weights / np.where(strength_out > 0, strength_out, 1), 1.0 / n)
+    google = damping * transition + (1 - damping) / n
+    assert (strength_out == 0).any()
+    np.testing.assert_allclose(metrics['pagerank'], _principal(google.T), rtol=1e-7, atol=1e-10)
+    assert metrics['pagerank'].sum() == pytest.approx(1)
+
+    np.testing.assert_allclose(metrics['hub'], _principal(weights @ weights.T), rtol=1e-7, atol=1e-10)
+    np.testing.assert_allclose(metrics['authority'], _principal(weights.T @ weights), rtol=1e-7, atol=1e-10)
@@ -0,0 +1,105 @@
+"""
+Function:
+                CityGeometry 的距离、方位角矩阵与逐对计算一致；city_geocode.csv 不变时复用缓存，
+                内容变化或版本不同时重建
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import CityGeometry as city_geometry
+from CityGeometry import CityGeometry
+from CitiesAttributes import haversine_distance, calculate_bearing
+
+
+def write_geocode(path, cities):
+    pd.DataFrame(cities, columns=['fullname', 'adcode', 'wgs_x', 'wgs_y']).to_csv(path, index=False)
+
+
+@pytest.fixture
+def builds(monkeypatch):
+    """
+        Number of CityGeometry.build calls.
+    """
+    calls = []
+    build = CityGeometry.build.__func__
+
+    def counting_build(cls, geocode_path, cache_dir):
+        calls.append(geocode_path)
+        return build(cls, geocode_path, cache_dir)
+
+    monkeypatch.setattr(CityGeometry, 'build', classmethod(counting_build))
+    return calls
+
+
+CITIES = [('北京市', 110000, 116.40, 39.90), ('上海市', 310000, 121.47, 31.23),
+          ('广州市', 440100, 113.26, 23.13), ('成都市', 510100, 104.07, 30.57)]
+
+
+def test_lookup_matches_pairwise(tmp_path):
+    geocode_path = tmp_path / 'city_geocode.csv'
+    write_geocode(geocode_path, CITIES)
+    geometry = CityGeometry.load(str(geocode_path), str(tmp_path / 'geometry'))
+    o = [110000, 310000, 440100, 510100, 110000, 999999]
+    d = [310000, 510100, 110000, 440100, 110000, 110000]
+    distance, bearing_out, bearing_in = geometry.lookup(o, d)
+    coords = {adcode: (x, y) for _, adcode, x, y in CITIES}
+    for i in range(5):
+        (o_x, o_y), (d_x, d_y) = coords[o[i]], coords[d[i]]
+        assert distance[i] == pytest.approx(haversine_distance(o_x, o_y, d_x, d_y), rel=1e-12, abs=1e-9)
+        if o[i] != d[i]:
+            assert bearing_out[i] == pytest.approx(calculate_bearing(o_x, o_y, d_x, d_y), rel=1e-12)
+            assert bearing_in[i] == pytest.approx(calculate_bearing(d_x, d_y, o_x, o_y), rel=1e-12)
+    # Unknown cities get NaN
+    assert np.isnan([distance[5], bearing_out[5], bearing_in[5]]).all()
+
+
+def test_cache_reused_until_geocode_changes(tmp_path, builds):
+    geocode_path, cache_dir = tmp_path / 'city_geocode.csv', str(tmp_path / 'geometry')
+    write_geocode(geocode_path, CITIES)
+    CityGeometry.load(str(geocode_path), cache_dir)
+    CityGeometry.load(str(geocode_path), cache_dir)
+    assert len(builds) == 1
+
+    # Rewriting the same content keeps the cache, it is keyed on the content hash and not on the mtime
+    write_geocode(geocode_path, CITIES)
+    CityGeometry.load(str(geocode_path), cache_dir)
+    assert len(builds) == 1
+
+    # A moved city is rebuilt
+    moved = CITIES[:3] + [('成都市', 510100, 103.0, 30.0)]
+    write_geocode(geocode_path, moved)
+    geometry = CityGeometry.load(str(geocode_path), cache_dir)
+    assert len(builds) == 2
+    distance, _, _ = geometry.lookup([110000], [510100])
+    assert distance[0] == pytest.approx(haversine_distance(116.40, 39.90, 103.0, 30.0))
+
+    # A new city is rebuilt
+    write_geocode(geocode_path, moved + [('武汉市', 420100, 114.30, 30.59)])
+    geometry = CityGeometry.load(str(geocode_path), cache_dir)
+    assert len(builds) == 3
+    assert 420100 in geometry.adcodes
+
+
+@pytest.mark.parametrize('metadata', ['version', 'missing', 'corrupt'])
+def test_cache_rebuilt_on_stale_metadata(tmp_path, builds, metadata):
+    geocode_path, cache_dir = tmp_path / 'city_geocode.csv', str(tmp_path / 'geometry')
+    write_geocode(geocode_path, CITIES)
+    CityGeometry.load(str(geocode_path), cache_dir)
+    metadata_path = os.path.join(cache_dir, 'city_geometry.json')
+    if metadata == 'version':
+        with open(metadata_path, encoding='utf-8') as f:
+            data = json.load(f)
+        data['version'] = city_geometry.GEOMETRY_VERSION - 1
+        with open(metadata_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+    elif metadata == 'missing':
+        os.remove(metadata_path)
+    else:
+        with open(metadata_path, 'w', encoding='utf-8') as f:
+            f.write('{')
+    CityGeometry.load(str(geocode_path), cache_dir)
+    assert len(builds) == 2
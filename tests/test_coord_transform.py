@@ -0,0 +1,51 @@
+"""
+Function:
+                批量坐标转换与 chinacoordtran 逐点 CoordTran 的结果一致，中国范围外的坐标保持不变
+"""
+import numpy as np
+import pytest
+
+from CoordTransform import gcj02_to_wgs84_batch, wgs84_to_gcj02_batch, out_of_china
+
+chinacoordtran = pytest.importorskip('chinacoordtran')
+
+
+def _points():
+    rng = np.random.default_rng(0)
+    # Mostly inside China's bounding box, the rest anywhere on earth
+    lng = np.concatenate([rng.uniform(73.0, 136.0, 16000), rng.uniform(-180.0, 180.0, 4000)])
+    lat = np.concatenate([rng.uniform(3.0, 54.0, 16000), rng.uniform(-90.0, 90.0, 4000)])
+    # On and just inside the edges of the box
+    edge_lng = np.array([73.66, 73.6601, 135.05, 135.0499, 105.0, 105.0, 105.0, 105.0, 0.0, -73.66])
+    edge_lat = np.array([35.0, 35.0, 35.0, 35.0, 3.86, 3.8601, 53.55, 53.5499, 0.0, 35.0])
+    return np.concatenate([lng, edge_lng]), np.concatenate([lat, edge_lat])
+
+
+@pytest.mark.parametrize('batch, per_point', [
+    (gcj02_to_wgs84_batch, chinacoordtran.gcj02towgs84),
+    (wgs84_to_gcj02_batch, chinacoordtran.wgs84togcj02),
+])
+def test_batch_equals_per_point(batch, per_point):
+    lng, lat = _points()
+    converter = per_point()
+    expected = [converter.CoordTran(x, y) for x, y in zip(lng.tolist(), lat.tolist())]
+    expected_lng = np.array([point.X for point in expected])
+    expected_lat = np.array([point.Y for point in expected])
+    batch_lng, batch_lat = batch(lng, lat)
+    np.testing.assert_allclose(batch_lng, expected_lng, rtol=0, atol=1e-12)
+    np.testing.assert_allclose(batch_lat, expected_lat, rtol=0, atol=1e-12)
+
+    outside = out_of_china(lng, lat)
+    assert 0 < outside.sum() < len(lng)
+    np.testing.assert_array_equal(batch_lng[outside], lng[outside])
+    np.testing.assert_array_equal(batch_lat[outside], lat[outside])
+    assert (batch_lng[~outside] != lng[~outside]).all()
+
+
+def test_scalars_and_nan():
+    lng, lat = gcj02_to_wgs84_batch(116.397428, 39.90923)
+    expected = chinacoordtran.gcj02towgs84().CoordTran(116.397428, 39.90923)
+    assert (float(lng), float(lat)) == pytest.approx((expected.X, expected.Y), abs=1e-12)
+    # Cities AMap did not find stay NaN
+    lng, lat = gcj02_to_wgs84_batch([np.nan, 116.4], [np.nan, 39.9])
+    assert np.isnan(lng[0]) and np.isnan(lat[0]) and not np.isnan(lng[1])
@@ -0,0 +1,73 @@
+"""
+Function:
+                CityIndex / ODMatrix 的计数与逐行规范化的 normalize_od、count_od、merge_od_counts 完全相同，
+                包括省直辖县级市、直辖市、省级编码、莱芜区、那曲地区等特殊编码，不含、含本地符号流及只含本地符号流
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from FlowBuilder import CityIndex, ODMatrix, normalize_od, count_od, merge_od_counts, count_pairs
+from conftest import REPO_DIR
+
+SPECIAL_CODES = [110000, 110105, 120101, 310101, 500101, 500229, 130000, 440000, 440305, 540000, 542400, 542421,
+                 540600, 370116, 371200, 370102, 650000, 659001, 419001, 429004, 469001]
+
+
+@pytest.fixture(scope='module')
+def provincial_adcodes():
+    return pd.read_csv(os.path.join(REPO_DIR, 'provincialcounties.csv'))['adcode']
+
+
+@pytest.fixture(scope='module')
+def tables():
+    """
+        Extraction results of three files, with codes of every city and the special codes above.
+    """
+    rng = np.random.default_rng(0)
+    adcodes = np.concatenate([pd.read_csv(os.path.join(REPO_DIR, 'AMap_adcode.csv'))['adcode'].to_numpy(),
+                              SPECIAL_CODES])
+    frames = []
+    for _ in range(3):
+        placecode = adcodes[rng.integers(0, len(adcodes), 30000)]
+        adcode = adcodes[rng.integers(0, len(adcodes), 30000)]
+        local = rng.random(len(adcode)) < 0.2
+        adcode[local] = placecode[local] // 100 * 100 + rng.integers(0, 20, local.sum())
+        frames.append(pd.DataFrame({'adcode': adcode, 'placecode': placecode}))
+    return frames
+
+
+def _reference(tables, provincial_adcodes, drop_local=True, local_only=False):
+    all_counts = []
+    for df in tables:
+        df = normalize_od(df, provincial_adcodes, drop_local=drop_local and not local_only)
+        if local_only:
+            df = df[df['adcode'] == df['placecode']]
+        all_counts.append(count_od(df))
+    return merge_od_counts(all_counts)
+
+
+@pytest.mark.parametrize('options', [dict(), dict(drop_local=False), dict(local_only=True)])
+@pytest.mark.parametrize('weighted', [False, True])
+def test_od_matrix_equals_row_wise_normalization(tables, provincial_adcodes, options, weighted):
+    od_matrix = ODMatrix(CityIndex(provincial_adcodes))
+    for df in tables:
+        if weighted:
+            pairs = count_pairs(df)
+            od_matrix.add(pairs['placecode'], pairs['adcode'], weights=pairs['count'])
+        else:
+            od_matrix.add(df['placecode'], df['adcode'])
+    expected = _reference(tables, provincial_adcodes, **options)
+    assert len(expected) > 0
+    pd.testing.assert_frame_equal(od_matrix.to_od_counts(**options), expected)
+
+
+def test_string_codes(tables, provincial_adcodes):
+    # Codes read as text, as from shards with missing values, give the same counts
+    od_matrix = ODMatrix(CityIndex(provincial_adcodes))
+    for df in tables:
+        od_matrix.add(df['placecode'].astype(str), df['adcode'].astype(str))
+    pd.testing.assert_frame_equal(od_matrix.to_od_counts(drop_local=False),
+                                  _reference(tables, provincial_adcodes, drop_local=False))
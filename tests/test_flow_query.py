@@ -0,0 +1,143 @@
+"""
+Function:
+                FlowQuery 的 CSR 索引查询与直接在符号流表上筛选排序的结果相同，内存映射加载后结果不变；
+                HTTP 接口返回与 Python 接口相同的 JSON，未知城市、错误参数和其他异常都返回 JSON 错误
+"""
+import json
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from FlowQuery import FlowQuery, make_handler, DEFAULT_BANDS
+from CitiesAttributes import haversine_distance
+
+N_CITIES = 12
+
+
+@pytest.fixture(scope='module')
+def sources(tmp_path_factory):
+    """
+        Symbolicflows.csv between N_CITIES cities, with tied counts and a row left by the outer merges,
+        and city_od_metrics.csv with a missing value and a city without flows.
+    """
+    rng = np.random.default_rng(0)
+    adcodes = np.arange(N_CITIES) * 100 + 110100
+    names = np.array([f'城市{i}' for i in range(N_CITIES)], dtype=object)
+    x, y = rng.uniform(100, 125, N_CITIES), rng.uniform(20, 45, N_CITIES)
+    pairs = [(o, d) for o in range(N_CITIES) for d in range(N_CITIES) if o != d and rng.random() < 0.6]
+    o, d = np.array(pairs).T
+    df = pd.DataFrame({'OD_code': [f'{adcodes[i]}_{adcodes[j]}' for i, j in pairs],
+                       'count': rng.integers(1, 6, len(pairs)).astype(float),
+                       'Ocity': adcodes[o], 'Dcity': adcodes[d], 'Ocity_name': names[o],
+                       'O_X': x[o], 'O_Y': y[o], 'Dcity_name': names[d], 'D_X': x[d], 'D_Y': y[d]})
+    df.loc[len(df)] = ['999999_110100', np.nan, np.nan, 110100, None, np.nan, np.nan, names[0], x[0], y[0]]
+    df_metrics = pd.DataFrame({'cityname': list(names) + ['无符号流城市'],
+                               'entropy_out': rng.random(N_CITIES + 1), 'gravity_in': rng.random(N_CITIES + 1)})
+    df_metrics.loc[3, 'gravity_in'] = np.nan
+    source_dir = tmp_path_factory.mktemp('flowquery')
+    flows_path, metrics_path = str(source_dir / 'Symbolicflows.csv'), str(source_dir / 'city_od_metrics.csv')
+    df.to_csv(flows_path, index=False)
+    df_metrics.to_csv(metrics_path, index=False)
+    return flows_path, metrics_path, str(source_dir / 'index')
+
+
+@pytest.fixture(scope='module')
+def flows(sources):
+    return pd.read_csv(sources[0]).dropna(subset=['count'])
+
+
+@pytest.fixture(scope='module', params=['build', 'load'])
+def flow_query(request, sources):
+    FlowQuery.build(*sources)
+    return getattr(FlowQuery, request.param)(*sources)
+
+
+def _expected_top(flows, city_column, other_column, other_name, adcode, k):
+    rows = flows[flows[city_column] == adcode].sort_values(['count', other_column], ascending=[False, True]).head(k)
+    return [{'adcode': int(row[other_column]), 'name': row[other_name], 'count': int(row['count'])}
+            for _, row in rows.iterrows()]
+
+
+@pytest.mark.parametrize('k', [1, 3, 100])
+def test_top_cities(flow_query, flows, k):
+    for adcode in flows['Dcity'].unique():
+        expected = _expected_top(flows, 'Dcity', 'Ocity', 'Ocity_name', adcode, k)
+        assert flow_query.top_origins(int(adcode), k) == expected
+    for adcode in flows['Ocity'].unique():
+        expected = _expected_top(flows, 'Ocity', 'Dcity', 'Dcity_name', adcode, k)
+        assert flow_query.top_destinations(int(adcode), k) == expected
+        # By adcode string or by name alike
+        name = flows.loc[flows['Ocity'] == adcode, 'Ocity_name'].iloc[0]
+        assert flow_query.top_destinations(name, k) == flow_query.top_destinations(str(int(adcode)), k) == expected
+
+
+def test_outflow_by_distance(flow_query, flows):
+    bands = list(DEFAULT_BANDS)
+    for adcode, group in flows.groupby('Ocity'):
+        distances = [haversine_distance(*row) for row in group[['O_X', 'O_Y', 'D_X', 'D_Y']].to_numpy()]
+        band = pd.cut(distances, bins=bands + [np.inf], right=False, labels=False)
+        totals = pd.Series(group['count'].to_numpy()).groupby(band).sum()
+        expected = [int(totals.get(i, 0)) for i in range(len(bands))]
+        assert [row['count'] for row in flow_query.outflow_by_distance(int(adcode))] == expected
+
+
+def test_metrics(flow_query, sources):
+    df_metrics = pd.read_csv(sources[1])
+    result = flow_query.metrics(['城市3', 110100])
+    assert result[0] == {'adcode': 110400, 'name': '城市3', 'entropy_out': df_metrics.loc[3, 'entropy_out'],
+                         'gravity_in': None}
+    assert result[1]['entropy_out'] == df_metrics.loc[0, 'entropy_out']
+    with pytest.raises(KeyError):
+        flow_query.metrics(['无符号流城市'])
+
+
+@pytest.fixture(scope='module')
+def server(sources):
+    flow_query = FlowQuery.build(*sources)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(flow_query))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield flow_query, f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+def _get(url):
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return response.status, json.loads(response.read().decode('utf-8'))
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read().decode('utf-8'))
+
+
+def test_server_matches_python(server):
+    flow_query, base_url = server
+    assert _get(f'{base_url}/top_origins?city=110100&k=3') == (200, flow_query.top_origins(110100, 3))
+    assert _get(f'{base_url}/top_destinations?city=110200') == (200, flow_query.top_destinations(110200))
+    assert (_get(f'{base_url}/outflow_by_distance?city=110300&bands=0,500,1500')
+            == (200, flow_query.outflow_by_distance(110300, [0.0, 500.0, 1500.0])))
+    city = urllib.parse.quote('城市3')
+    assert _get(f'{base_url}/metrics?cities={city},110100') == (200, flow_query.metrics(['城市3', 110100]))
+
+
+def test_server_errors(server, monkeypatch):
+    flow_query, base_url = server
+    status, body = _get(f'{base_url}/top_origins?city=999999')
+    assert status == 404 and 'error' in body
+    assert _get(f'{base_url}/top_origins')[0] == 404
+    assert _get(f'{base_url}/nowhere')[0] == 404
+    assert _get(f'{base_url}/top_origins?city=110100&k=many')[0] == 400
+    assert _get(f'{base_url}/outflow_by_distance?city=110100&bands=0,x')[0] == 400
+
+    # Unexpected failures still get a JSON answer, and the server keeps serving
+    def broken(cities):
+        raise RuntimeError('index is gone')
+    monkeypatch.setattr(flow_query, 'metrics', broken)
+    assert _get(f'{base_url}/metrics?cities=110100') == (500, {'error': 'RuntimeError: index is gone'})
+    assert _get(f'{base_url}/top_origins?city=110100&k=1') == (200, flow_query.top_origins(110100, 1))
@@ -0,0 +1,168 @@
+"""
+Function:
+                用本地 http.server 模拟高德 /v3/geocode/geo 接口测试 GeocodeClient：
+                5xx、超时与限流 infocode 的退避重试，QPS 与并发请求数限制，缓存命中时不发送请求
+"""
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+
+from Geocode_city import GeocodeClient
+
+
+class StandIn:
+    """
+        Local stand-in of the AMap geocoding service. Names are answered by their prefix:
+        'flaky<n>' fails with HTTP 503 n times, 'slow' hangs past the client timeout once, 'busy' answers
+        with the QPS limit infocode once, 'down' always fails, 'nowhere' has no geocode, anything else is found.
+    """
+
+    def __init__(self, delay=0.0, slow_seconds=1.0):
+        self.delay = delay
+        self.slow_seconds = slow_seconds
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stand_in.handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def attempts(self, name):
+        return [start for address, start in self.requests if address == name]
+
+    def handle(self, handler):
+        url = urlparse(handler.path)
+        address = parse_qs(url.query)['address'][0]
+        with self._lock:
+            self.requests.append((address, time.monotonic()))
+            attempt = len(self.attempts(address))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.delay)
+            status, body = self.answer(url.path, address, attempt)
+            if address == 'slow' and attempt == 1:
+                time.sleep(self.slow_seconds)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+        try:
+            handler.send_response(status)
+            handler.send_header('Content-Type', 'application/json')
+            handler.end_headers()
+            handler.wfile.write(json.dumps(body).encode('utf-8'))
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up on a slow answer
+            pass
+
+    @staticmethod
+    def answer(path, address, attempt):
+        if path != '/v3/geocode/geo':
+            return 404, {}
+        if address == 'down' or (address.startswith('flaky') and attempt <= int(address[5:])):
+            return 503, {}
+        if address == 'busy' and attempt == 1:
+            return 200, {'status': '0', 'info': 'CUQPS_HAS_EXCEEDED_THE_LIMIT', 'infocode': '10019'}
+        if address == 'nowhere':
+            return 200, {'status': '1', 'info': 'OK', 'infocode': '10000', 'count': '0', 'geocodes': []}
+        location = f'{100 + len(address) / 100:.6f},{30 + attempt / 100:.6f}'
+        return 200, {'status': '1', 'info': 'OK', 'infocode': '10000', 'count': '1',
+                     'geocodes': [{'formatted_address': address, 'adcode': '110000', 'location': location}]}
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stand_in():
+    server = StandIn()
+    yield server
+    server.close()
+
+
+def _client(stand_in, **kwargs):
+    options = dict(base_url=stand_in.url, max_in_flight=4, qps=None, max_retries=3, backoff=0.05, timeout=2)
+    options.update(kwargs)
+    return GeocodeClient('test-key', **options)
+
+
+def test_retries_5xx_with_backoff(stand_in):
+    client = _client(stand_in)
+    assert client.geocode('flaky2') == (100.06, 30.03)
+    starts = stand_in.attempts('flaky2')
+    assert len(starts) == 3
+    # Backoff of 0.05s then 0.1s between the attempts
+    assert starts[1] - starts[0] >= 0.05
+    assert starts[2] - starts[1] >= 0.1
+
+
+def test_retries_qps_limit_infocode(stand_in):
+    assert _client(stand_in).geocode('busy') == (100.04, 30.02)
+    assert len(stand_in.attempts('busy')) == 2
+
+
+def test_retries_timeout(stand_in):
+    client = _client(stand_in, timeout=0.3)
+    assert client.geocode('slow') == (100.04, 30.02)
+    assert len(stand_in.attempts('slow')) == 2
+
+
+def test_gives_up_after_max_retries(stand_in):
+    client = _client(stand_in, max_retries=2)
+    assert client.geocode('down') is None
+    assert len(stand_in.attempts('down')) == 3
+    # Failures are not cached, the next run asks again
+    assert 'down' not in client.cache
+
+
+def test_qps_limit(stand_in):
+    qps = 20
+    client = _client(stand_in, max_in_flight=8, qps=qps)
+    names = [f'city{i}' for i in range(10)]
+    assert all(client.geocode_many(names))
+    starts = sorted(start for _, start in stand_in.requests)
+    assert len(starts) == len(names)
+    # Requests are spaced 1/qps apart, with a little slack for the timer
+    assert min(b - a for a, b in zip(starts, starts[1:])) >= 1 / qps - 0.01
+    assert starts[-1] - starts[0] >= (len(names) - 1) / qps - 0.01
+
+
+def test_in_flight_limit():
+    stand_in = StandIn(delay=0.1)
+    try:
+        client = _client(stand_in, max_in_flight=3)
+        results = client.geocode_many([f'city{i}' for i in range(12)])
+        assert all(results)
+        assert stand_in.max_in_flight == 3
+    finally:
+        stand_in.close()
+
+
+def test_cache_hits_make_no_request(stand_in, tmp_path):
+    cache_path = str(tmp_path / 'geocode_cache.json')
+    names = ['city1', 'city22', 'nowhere']
+    first = _client(stand_in, cache_path=cache_path).geocode_many(names)
+    assert first[2] is None
+    assert len(stand_in.requests) == 3
+
+    # Found and not found names are both cached, on disk and in memory
+    second_client = _client(stand_in, cache_path=cache_path)
+    assert second_client.geocode_many(names) == first
+    assert second_client.geocode_many(names + ['city333']) == first + [(100.07, 30.01)]
+    assert [address for address, _ in stand_in.requests[3:]] == ['city333']
@@ -0,0 +1,148 @@
+"""
+Function:
+                RunManifest 只在文件内容、处理参数和缓存结果都不变时跳过该文件；
+                parallel_process_csv 再次运行时不重新处理未变化的文件，结果与全部重新处理时相同，
+                文件变化后只重新处理该文件(按 _id 去重时还有它之后的文件)
+"""
+import os
+import glob
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import Manifest
+from Manifest import RunManifest
+from SymbolMatcher import SymbolMatcher
+from SyntheticPoi import generate_poi_files
+from ExtractPlaceSymbol import parallel_process_csv
+from FlowBuilder import PairCounts
+from PoiDedup import IdDedup
+from conftest import REPO_DIR
+
+COUNTS = pd.DataFrame({'placecode': [1, 2], 'adcode': [110000, 310000], 'count': [3, 4]})
+
+
+@pytest.fixture
+def recorded(tmp_path):
+    """
+        A manifest with one recorded input file and its shard.
+    """
+    input_path, shard_path = tmp_path / 'poi.csv', tmp_path / 'output_poi_00000_00000.csv'
+    input_path.write_bytes(b'name,_id,adcode\n1,a,110000\n')
+    shard_path.write_bytes(b'placesymbol\n')
+    manifest = RunManifest(str(tmp_path / 'manifest.json'), {'dictionary_version': 'v1'})
+    manifest.record(str(input_path), COUNTS, [str(shard_path)], ids=np.array([1, 2], dtype=np.uint64), duplicates=5)
+    return manifest, input_path, shard_path
+
+
+def test_record_and_reload(recorded):
+    manifest, input_path, _ = recorded
+    reloaded = RunManifest(manifest.path, {'dictionary_version': 'v1'})
+    assert reloaded.is_current(str(input_path))
+    pd.testing.assert_frame_equal(reloaded.counts(str(input_path)), COUNTS)
+    ids, duplicates = reloaded.ids(str(input_path))
+    assert ids.tolist() == [1, 2] and duplicates == 5
+
+
+def test_invalidation(recorded, tmp_path):
+    manifest, input_path, shard_path = recorded
+    path = str(input_path)
+    # Other settings
+    assert not RunManifest(manifest.path, {'dictionary_version': 'v2'}).is_current(path)
+    assert not RunManifest(manifest.path, {'dictionary_version': 'v1', 'dedup': True}).is_current(path)
+
+    # Touched with the same content: still current
+    os.utime(path, ns=(1, 1))
+    assert RunManifest(manifest.path, manifest.settings).is_current(path)
+    # Same size, other content
+    input_path.write_bytes(input_path.read_bytes().replace(b'110000', b'310000'))
+    assert not RunManifest(manifest.path, manifest.settings).is_current(path)
+    # Other size
+    input_path.write_bytes(b'name,_id,adcode\n')
+    assert not RunManifest(manifest.path, manifest.settings).is_current(path)
+
+
+@pytest.mark.parametrize('missing', ['shard', 'counts', 'ids'])
+def test_missing_output_invalidates(recorded, missing):
+    manifest, input_path, shard_path = recorded
+    entry = manifest.files[os.path.abspath(input_path)]
+    os.remove({'shard': str(shard_path), 'counts': entry['counts'], 'ids': entry['ids']}[missing])
+    assert not RunManifest(manifest.path, manifest.settings).is_current(str(input_path))
+
+
+def test_other_version_is_empty(recorded, monkeypatch):
+    manifest, input_path, _ = recorded
+    monkeypatch.setattr(Manifest, 'MANIFEST_VERSION', Manifest.MANIFEST_VERSION + 1)
+    assert RunManifest(manifest.path, manifest.settings).files == {}
+
+
+def test_discard_and_split(recorded, tmp_path):
+    manifest, input_path, _ = recorded
+    other_path = tmp_path / 'other.csv'
+    other_path.write_bytes(b'name,_id,adcode\n')
+    assert manifest.split([str(other_path), str(input_path)]) == ([str(input_path)], [str(other_path)])
+    # With prefix, the files after the first pending one are pending too
+    assert manifest.split([str(other_path), str(input_path)], prefix=True) == ([], [str(other_path), str(input_path)])
+    entry = manifest.discard(str(input_path))
+    assert not os.path.exists(entry['counts']) and not os.path.exists(entry['ids'])
+    assert not manifest.is_current(str(input_path))
+
+
+class RefusingMatcher(SymbolMatcher):
+    """
+        Fails every block, so that any file processed with it is dropped from the results.
+    """
+
+    def first_rank(self, text: str) -> int:
+        raise RuntimeError('file should have been skipped')
+
+
+@pytest.fixture
+def poi_files(tmp_path, placesymbol_code_path):
+    return generate_poi_files(str(tmp_path / 'poi'), 3, 3000, pd.read_csv(placesymbol_code_path),
+                              pd.read_csv(os.path.join(REPO_DIR, 'AMap_adcode.csv')), duplicate_rate=0.2, seed=2)
+
+
+def _run(file_paths, matcher, output_dir, with_dedup):
+    pair_counts = PairCounts()
+    dedup = IdDedup() if with_dedup else None
+    parallel_process_csv(file_paths, matcher, output_dir, 1000, max_workers=2, block_bytes=50000,
+                         pair_counts=pair_counts, manifest_path=os.path.join(output_dir, 'manifest.json'),
+                         dedup=dedup, progress=False)
+    counts = pair_counts.to_frame().sort_values(['placecode', 'adcode']).reset_index(drop=True)
+    shards = {path: os.stat(path).st_mtime_ns for path in glob.glob(os.path.join(output_dir, 'output_*.csv'))}
+    return counts, shards, dedup
+
+
+def _file_shards(shards, file_index):
+    return {path: mtime for path, mtime in shards.items()
+            if os.path.basename(path).startswith(f'output_poi_{file_index:05d}_')}
+
+
+@pytest.mark.parametrize('with_dedup', [False, True])
+def test_resume_skips_unchanged_files(poi_files, placesymbol_code_path, tmp_path, with_dedup):
+    matcher = SymbolMatcher.from_csv(placesymbol_code_path)
+    output_dir = str(tmp_path / 'output')
+    counts, shards, dedup = _run(poi_files, matcher, output_dir, with_dedup)
+    assert len(counts) and all(_file_shards(shards, i) for i in range(3))
+
+    # Nothing changed: every file is skipped, the matcher is never called
+    refusing = RefusingMatcher.from_csv(placesymbol_code_path)
+    resumed_counts, resumed_shards, resumed_dedup = _run(poi_files, refusing, output_dir, with_dedup)
+    pd.testing.assert_frame_equal(resumed_counts, counts)
+    assert resumed_shards == shards
+    if with_dedup:
+        assert resumed_dedup.removed == dedup.removed
+
+    # The second file changes: it is processed again, and with dedup the third file too
+    with open(poi_files[1], 'rb') as f:
+        lines = f.read().split(b'\n')
+    with open(poi_files[1], 'wb') as f:
+        f.write(b'\n'.join(lines[:len(lines) // 2]))
+    changed_counts, changed_shards, _ = _run(poi_files, matcher, output_dir, with_dedup)
+    expected_counts, _, _ = _run(poi_files, matcher, str(tmp_path / 'fresh'), with_dedup)
+    pd.testing.assert_frame_equal(changed_counts, expected_counts)
+    assert _file_shards(changed_shards, 0) == _file_shards(shards, 0)
+    assert _file_shards(changed_shards, 1) != _file_shards(shards, 1)
+    assert (_file_shards(changed_shards, 2) == _file_shards(shards, 2)) is not with_dedup
@@ -0,0 +1,120 @@
+"""
+Function:
+                分片提取、合并的符号流与逐个文件串行提取的结果相同；
+                reduce 检查字节范围重叠、缺少分片、其他计划的部分计数，map 检查文件在计划之后是否变化
+"""
+import os
+import glob
+
+import pandas as pd
+import pytest
+
+from MapReduce import plan_shards, map_shard, partial_path, reduce_partials, run_local, _list_partials, _write_json
+from SymbolMatcher import SymbolMatcher
+from SyntheticPoi import generate_poi_files
+from PoiReader import iter_line_blocks, read_poi_block
+from ExtractPlaceSymbol import extract_matches
+from FlowBuilder import CityIndex, ODMatrix, PairCounts, count_pairs
+from conftest import REPO_DIR
+
+MIN_SPLIT_BYTES = 20000
+
+
+@pytest.fixture(scope='module')
+def matcher(placesymbol_code_path):
+    return SymbolMatcher.from_csv(placesymbol_code_path)
+
+
+@pytest.fixture(scope='module')
+def provincial_adcodes():
+    return pd.read_csv(os.path.join(REPO_DIR, 'provincialcounties.csv'))['adcode']
+
+
+@pytest.fixture
+def poi_files(tmp_path, placesymbol_code_path):
+    return generate_poi_files(str(tmp_path / 'poi'), 3, 4000, pd.read_csv(placesymbol_code_path),
+                              pd.read_csv(os.path.join(REPO_DIR, 'AMap_adcode.csv')), seed=3)
+
+
+def _od_counts(od_matrix):
+    return od_matrix.to_od_counts(drop_local=False)
+
+
+def _serial(file_paths, matcher, provincial_adcodes):
+    pair_counts = PairCounts()
+    for file_path in file_paths:
+        for header, block, first_line_no in iter_line_blocks(file_path, os.path.getsize(file_path) + 1):
+            data, _ = read_poi_block(header, block, first_line_no)
+            pair_counts.add(count_pairs(extract_matches(data, matcher, keep_name=False)))
+    pairs = pair_counts.to_frame()
+    od_matrix = ODMatrix(CityIndex(provincial_adcodes))
+    od_matrix.add(pairs['placecode'], pairs['adcode'], weights=pairs['count'])
+    return _od_counts(od_matrix)
+
+
+def _map_all(plan, matcher, partial_dir):
+    paths = []
+    for shard in range(len(plan['shards'])):
+        paths.append(partial_path(partial_dir, plan, shard))
+        _write_json(map_shard(plan, shard, matcher, block_bytes=5000), paths[-1])
+    return paths
+
+
+def test_split_shards_match_serial(poi_files, matcher, provincial_adcodes, tmp_path):
+    plan = plan_shards(poi_files, 7, MIN_SPLIT_BYTES)
+    # Some files are cut into byte ranges
+    ranges = [byte_range for shard in plan['shards'] for byte_range in shard]
+    assert len(ranges) > len(poi_files)
+    paths = _map_all(plan, matcher, str(tmp_path / 'partials'))
+    expected = _serial(poi_files, matcher, provincial_adcodes)
+    pd.testing.assert_frame_equal(_od_counts(reduce_partials(paths, provincial_adcodes, plan)), expected)
+
+
+def test_local_matches_serial(poi_files, matcher, provincial_adcodes, tmp_path):
+    plan, paths = run_local(poi_files, matcher, str(tmp_path / 'partials'), n_shards=5, max_workers=2,
+                            min_split_bytes=MIN_SPLIT_BYTES)
+    assert len(paths) == len(plan['shards']) > len(poi_files)
+    expected = _serial(poi_files, matcher, provincial_adcodes)
+    pd.testing.assert_frame_equal(_od_counts(reduce_partials(paths, provincial_adcodes, plan)), expected)
+
+
+def test_overlap_detected(poi_files, matcher, provincial_adcodes, tmp_path):
+    partial_dir = str(tmp_path / 'partials')
+    paths = _map_all(plan_shards(poi_files, 2, MIN_SPLIT_BYTES), matcher, partial_dir)
+    other_paths = _map_all(plan_shards(poi_files, 3, MIN_SPLIT_BYTES), matcher, partial_dir)
+    with pytest.raises(ValueError, match='both cover bytes'):
+        reduce_partials(paths + other_paths, provincial_adcodes)
+
+
+def test_missing_shard_detected(poi_files, matcher, provincial_adcodes, tmp_path):
+    plan = plan_shards(poi_files, 4, MIN_SPLIT_BYTES)
+    paths = _map_all(plan, matcher, str(tmp_path / 'partials'))
+    with pytest.raises(ValueError, match=r'missing the partials of shards \[2\]'):
+        reduce_partials(paths[:2] + paths[3:], provincial_adcodes)
+    # With the plan, even no partials at all are caught
+    with pytest.raises(ValueError, match='missing'):
+        reduce_partials([], provincial_adcodes, plan)
+
+
+def test_changed_file_makes_new_plan(poi_files, matcher, provincial_adcodes, tmp_path):
+    partial_dir = str(tmp_path / 'partials')
+    old_plan, old_paths = run_local(poi_files, matcher, partial_dir, n_shards=3, max_workers=2)
+
+    # Same size, other content: map refuses the old plan
+    with open(poi_files[1], 'r+b') as f:
+        f.seek(-2, os.SEEK_END)
+        f.write(b'0\n')
+    os.utime(poi_files[1], ns=(os.stat(poi_files[1]).st_atime_ns, os.stat(poi_files[1]).st_mtime_ns + 10 ** 9))
+    with pytest.raises(ValueError, match='has changed'):
+        map_shard(old_plan, 1, matcher)
+
+    # The new plan gets its own partials, the stale ones of the old plan in the same directory are not reduced
+    plan, paths = run_local(poi_files, matcher, partial_dir, n_shards=3, max_workers=2)
+    assert plan['plan_id'] != old_plan['plan_id']
+    assert len(glob.glob(os.path.join(partial_dir, 'partial_*.json'))) == len(old_paths) + len(paths)
+    assert _list_partials([partial_dir], plan['plan_id']) == sorted(paths)
+    with pytest.raises(ValueError, match='belongs to plan'):
+        reduce_partials(old_paths + paths, provincial_adcodes, plan)
+    expected = _serial(poi_files, matcher, provincial_adcodes)
+    od_matrix = reduce_partials(_list_partials([partial_dir], plan['plan_id']), provincial_adcodes, plan)
+    pd.testing.assert_frame_equal(_od_counts(od_matrix), expected)
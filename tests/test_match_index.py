@@ -0,0 +1,93 @@
+"""
+Function:
+                从超集字典的匹配索引导出的较小字典变体的提取结果，与用该变体直接运行 extract_matches 的结果相同；
+                不同目录下的同名POI文件各自保存；变体中有超集之外的符号时报错
+"""
+import os
+
+import pandas as pd
+import pytest
+
+from MatchIndex import MatchIndex
+from SymbolMatcher import SymbolMatcher
+from SyntheticPoi import generate_poi_files
+from PoiReader import iter_line_blocks, read_poi_block
+from ExtractPlaceSymbol import extract_matches
+from conftest import REPO_DIR
+
+
+@pytest.fixture(scope='module')
+def superset(placesymbol_code_path):
+    return pd.read_csv(placesymbol_code_path)
+
+
+@pytest.fixture(scope='module')
+def poi_files(tmp_path_factory, superset):
+    """
+        Two POI files with the same name in different directories.
+    """
+    df_adcode = pd.read_csv(os.path.join(REPO_DIR, 'AMap_adcode.csv'))
+    poi_dir = tmp_path_factory.mktemp('poi')
+    file_paths = []
+    for seed, subdir in enumerate(['a', 'b']):
+        file_paths += generate_poi_files(str(poi_dir / subdir), 1, 3000, superset, df_adcode, seed=seed)
+    assert os.path.basename(file_paths[0]) == os.path.basename(file_paths[1])
+    return file_paths
+
+
+def _blocks(file_path):
+    for block_index, (header, block, first_line_no) in enumerate(iter_line_blocks(file_path, 50000)):
+        yield block_index, read_poi_block(header, block, first_line_no)[0]
+
+
+@pytest.fixture(scope='module')
+def match_index(tmp_path_factory, superset, poi_files):
+    match_index = MatchIndex.create(str(tmp_path_factory.mktemp('matchindex')), superset['placesymbol'])
+    for file_path in poi_files:
+        for block_index, data in _blocks(file_path):
+            match_index.write_part(file_path, block_index, data)
+    return match_index
+
+
+def _variant(superset):
+    """
+        A smaller dictionary: every other symbol, in reverse order so that the ranks differ from the superset,
+        and a few symbols without a numeric placecode.
+    """
+    variant = superset.iloc[::2].iloc[::-1]
+    placesymbol_dict = dict(zip(variant['placesymbol'], variant['placecode'].astype(object)))
+    for symbol in list(placesymbol_dict)[::50]:
+        placesymbol_dict[symbol] = 'unknown'
+    return placesymbol_dict
+
+
+def test_derive_matches_direct_extraction(match_index, superset, poi_files):
+    placesymbol_dict = _variant(superset)
+    matcher = SymbolMatcher(placesymbol_dict)
+    derived = {}
+    for file_path, results in match_index.derive(placesymbol_dict):
+        derived.setdefault(file_path, []).append(results)
+    assert sorted(derived) == sorted(os.path.abspath(file_path) for file_path in poi_files)
+    for file_path in poi_files:
+        result = pd.concat(derived[os.path.abspath(file_path)], ignore_index=True)
+        expected = pd.concat([extract_matches(data, matcher) for _, data in _blocks(file_path)], ignore_index=True)
+        assert len(expected)
+        expected['_id'] = expected['_id'].astype(str)
+        pd.testing.assert_frame_equal(result, expected)
+
+
+def test_clear_keeps_same_named_file(match_index, superset, poi_files):
+    placesymbol_dict = dict(zip(superset['placesymbol'], superset['placecode']))
+    before = {file_path for file_path, _ in match_index.derive(placesymbol_dict)}
+    match_index.clear(poi_files[0])
+    after = {file_path for file_path, _ in match_index.derive(placesymbol_dict)}
+    assert before - after == {os.path.abspath(poi_files[0])}
+    for block_index, data in _blocks(poi_files[0]):
+        match_index.write_part(poi_files[0], block_index, data)
+
+
+def test_missing_symbols_raise(match_index, superset):
+    placesymbol_dict = dict(zip(superset['placesymbol'], superset['placecode']))
+    placesymbol_dict['不在超集中的符号'] = 1
+    with pytest.raises(ValueError, match='1 placesymbols are not in the index'):
+        next(match_index.derive(placesymbol_dict))
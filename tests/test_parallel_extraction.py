@@ -0,0 +1,79 @@
+"""
+Function:
+                parallel_process_csv 中某个文件的块失败时，该文件的分片被删除、计数不计入结果、不记录到 manifest，
+                按 _id 去重时后面的文件也不受它已保留的 _id 影响：结果与不处理该文件时相同
+"""
+import os
+import glob
+
+import pandas as pd
+import pytest
+
+from SymbolMatcher import SymbolMatcher
+from SyntheticPoi import generate_poi_files
+from ExtractPlaceSymbol import parallel_process_csv
+from FlowBuilder import PairCounts
+from Manifest import RunManifest
+from PoiDedup import IdDedup
+from conftest import REPO_DIR
+
+FAILING_NAME = '故障测试'
+
+
+class FailingMatcher(SymbolMatcher):
+    """
+        Raises on the name FAILING_NAME, so that the block holding it fails in the worker.
+    """
+
+    def first_rank(self, text: str) -> int:
+        if text == FAILING_NAME:
+            raise RuntimeError('failing block')
+        return super().first_rank(text)
+
+
+@pytest.fixture(scope='module')
+def poi_files(tmp_path_factory, placesymbol_code_path):
+    poi_dir = tmp_path_factory.mktemp('poi')
+    file_paths = generate_poi_files(str(poi_dir), 3, 20000, pd.read_csv(placesymbol_code_path),
+                                    pd.read_csv(os.path.join(REPO_DIR, 'AMap_adcode.csv')),
+                                    duplicate_rate=0.2, seed=1)
+    # A failing line in the middle of the second file, whose earlier blocks are written first
+    with open(file_paths[1], 'rb') as f:
+        lines = f.read().split(b'\n')
+    middle = len(lines) // 2
+    lines[middle] = ','.join([FAILING_NAME] + lines[middle].decode('gbk').split(',')[1:]).encode('gbk')
+    with open(file_paths[1], 'wb') as f:
+        f.write(b'\n'.join(lines))
+    return file_paths
+
+
+def _run(file_paths, matcher, output_dir, dedup):
+    pair_counts = PairCounts()
+    manifest_path = os.path.join(output_dir, 'manifest.json')
+    parallel_process_csv(file_paths, matcher, output_dir, 5000, max_workers=2, block_bytes=100000,
+                         pair_counts=pair_counts, manifest_path=manifest_path, dedup=dedup, progress=False)
+    counts = pair_counts.to_frame().sort_values(['placecode', 'adcode']).reset_index(drop=True)
+    shards = {os.path.basename(path): pd.read_csv(path) for path in glob.glob(os.path.join(output_dir, 'output_*.csv'))}
+    return counts, shards, RunManifest(manifest_path)
+
+
+@pytest.mark.parametrize('with_dedup', [False, True])
+def test_failed_file_counts_for_nothing(poi_files, placesymbol_code_path, tmp_path, with_dedup):
+    matcher = FailingMatcher.from_csv(placesymbol_code_path)
+    dedup = IdDedup() if with_dedup else None
+    counts, shards, manifest = _run(poi_files, matcher, str(tmp_path / 'with_failure'), dedup)
+    other_dedup = IdDedup() if with_dedup else None
+    expected_counts, expected_shards, _ = _run([poi_files[0], poi_files[2]], matcher, str(tmp_path / 'without'),
+                                               other_dedup)
+
+    assert not any(name.startswith('output_poi_00001_') for name in shards)
+    assert sorted(shards) == sorted(expected_shards)
+    for name, shard in shards.items():
+        pd.testing.assert_frame_equal(shard, expected_shards[name])
+    pd.testing.assert_frame_equal(counts, expected_counts)
+    recorded = set(manifest.files)
+    assert os.path.abspath(poi_files[1]) not in recorded
+    assert os.path.abspath(poi_files[0]) in recorded and os.path.abspath(poi_files[2]) in recorded
+    if with_dedup:
+        assert dedup.removed == other_dedup.removed
+        assert dedup.removed[poi_files[2]] > 0
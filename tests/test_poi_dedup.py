@@ -0,0 +1,131 @@
+"""
+Function:
+                按 _id 去重的并行提取与串行提取后按文件顺序、行顺序保留每个 _id 首次出现的结果相同，
+                包括跨文件和同一文件不同块中的重复 _id，以及很小的 max_pending；
+                去重提取后在同一文件夹上构建符号流，报告等其他表格不被当作提取结果读取
+"""
+import os
+import glob
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from SymbolMatcher import SymbolMatcher
+from SyntheticPoi import generate_poi_files
+from ExtractPlaceSymbol import parallel_process_csv, extract_matches
+from PoiReader import iter_line_blocks, read_poi_block
+from FlowBuilder import CityIndex, ODMatrix, PairCounts
+from SymbolicFlow import build_od_matrix
+from TableIO import list_tables
+from PoiDedup import IdDedup, SeenIds
+from conftest import REPO_DIR
+
+
+@pytest.fixture(scope='module')
+def matcher(placesymbol_code_path):
+    return SymbolMatcher.from_csv(placesymbol_code_path)
+
+
+@pytest.fixture(scope='module')
+def provincial_adcodes():
+    return pd.read_csv(os.path.join(REPO_DIR, 'provincialcounties.csv'))['adcode']
+
+
+@pytest.fixture(scope='module')
+def poi_files(tmp_path_factory, placesymbol_code_path, matcher):
+    """
+        Three files reusing _ids of the earlier files, each ending with copies of matched lines
+        from the start of the same file, so that _ids also repeat across the blocks of one file.
+    """
+    file_paths = generate_poi_files(str(tmp_path_factory.mktemp('poi')), 3, 6000, pd.read_csv(placesymbol_code_path),
+                                    pd.read_csv(os.path.join(REPO_DIR, 'AMap_adcode.csv')),
+                                    duplicate_rate=0.3, seed=4)
+    for file_path in file_paths:
+        with open(file_path, 'rb') as f:
+            lines = f.read().rstrip(b'\n').split(b'\n')
+        header, block = lines[0] + b'\n', b'\n'.join(lines[1:200]) + b'\n'
+        matched = extract_matches(read_poi_block(header, block)[0], matcher)
+        assert len(matched) >= 10
+        copies = [lines[1 + row] for row in matched.index[:10]]
+        with open(file_path, 'wb') as f:
+            f.write(b'\n'.join(lines + copies) + b'\n')
+    return file_paths
+
+
+def _serial(file_paths, matcher):
+    """
+        Results of each file extracted one by one, keeping the first occurrence of each _id in file and line order.
+    """
+    results = []
+    for file_path in file_paths:
+        for header, block, first_line_no in iter_line_blocks(file_path, os.path.getsize(file_path) + 1):
+            results.append(extract_matches(read_poi_block(header, block, first_line_no)[0], matcher).assign(file=file_path))
+    results = pd.concat(results, ignore_index=True)
+    duplicated = results['_id'].astype(str).duplicated()
+    removed = duplicated.groupby(results['file']).sum().astype(int).to_dict()
+    return results[~duplicated], removed
+
+
+def _shards(output_dir, file_path):
+    stem = os.path.basename(file_path).split('.')[0]
+    paths = glob.glob(os.path.join(output_dir, f'output_{stem}_*.csv'))
+    paths.sort(key=lambda path: int(path.rsplit('_', 1)[1].split('.')[0]))
+    return pd.concat([pd.read_csv(path, dtype={'_id': str}) for path in paths], ignore_index=True)
+
+
+@pytest.mark.parametrize('max_workers, max_pending', [(2, 1), (2, 3), (3, None)])
+def test_first_occurrence_wins(poi_files, matcher, tmp_path, max_workers, max_pending):
+    expected, expected_removed = _serial(poi_files, matcher)
+    assert all(expected_removed[file_path] > 0 for file_path in poi_files)
+
+    output_dir = str(tmp_path / 'extractresult')
+    os.makedirs(output_dir)
+    dedup, pair_counts = IdDedup(), PairCounts()
+    parallel_process_csv(poi_files, matcher, output_dir, 1000, max_workers=max_workers, max_pending=max_pending,
+                         block_bytes=20000, pair_counts=pair_counts, dedup=dedup, progress=False)
+    assert dedup.removed == expected_removed
+    for file_path in poi_files:
+        result = _shards(output_dir, file_path)
+        rows = expected[expected['file'] == file_path]
+        assert result['_id'].tolist() == rows['_id'].astype(str).tolist()
+        assert result['placesymbol'].tolist() == rows['placesymbol'].tolist()
+    counts = pair_counts.to_frame()
+    assert counts['count'].sum() == len(expected)
+
+
+def test_flows_after_dedup_extraction(poi_files, matcher, provincial_adcodes, tmp_path):
+    output_dir = str(tmp_path / 'extractresult')
+    os.makedirs(output_dir)
+    dedup, pair_counts = IdDedup(), PairCounts()
+    parallel_process_csv(poi_files, matcher, output_dir, 1000, max_workers=2, block_bytes=20000,
+                         pair_counts=pair_counts, manifest_path=os.path.join(output_dir, 'manifest.json'),
+                         dedup=dedup, progress=False)
+    # A report left among the shards, as older runs wrote it
+    dedup.report().to_csv(os.path.join(output_dir, 'duplicates.csv'), index=False)
+
+    shards = list_tables(output_dir)
+    assert shards and all(os.path.basename(path).startswith('output_') for path in shards)
+    od_matrix = build_od_matrix(shards, provincial_adcodes, manifest_path=str(tmp_path / 'flow_manifest.json'))
+    pairs = pair_counts.to_frame()
+    expected = ODMatrix(CityIndex(provincial_adcodes))
+    expected.add(pairs['placecode'], pairs['adcode'], weights=pairs['count'])
+    pd.testing.assert_frame_equal(od_matrix.to_od_counts(drop_local=False), expected.to_od_counts(drop_local=False))
+
+
+def test_seen_ids_match_set():
+    rng = np.random.default_rng(1)
+    seen, reference = SeenIds(), set()
+    for _ in range(200):
+        hashes = rng.integers(0, 20000, rng.integers(0, 1000)).astype(np.uint64)
+        expected = np.zeros(len(hashes), dtype=bool)
+        for i, value in enumerate(hashes.tolist()):
+            if value not in reference:
+                reference.add(value)
+                expected[i] = True
+        assert (seen.add_new(hashes) == expected).all()
+    assert len(seen) == len(reference)
+    removed = np.array(sorted(reference)[::3], dtype=np.uint64)
+    seen.remove(removed)
+    assert not seen.contains(removed).any()
+    assert len(seen) == len(reference) - len(removed)
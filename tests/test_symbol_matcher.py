@@ -0,0 +1,91 @@
+"""
+Function:
+                SymbolMatcher / match_and_extract 与逐符号查找的 check_and_extract 结果一致
+                字典由仓库中的 AMap_adcode.csv 等数据生成(见 conftest.py)
+"""
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from SymbolMatcher import SymbolMatcher
+from SyntheticPoi import FILLER_WORDS, generate_names
+from ExtractPlaceSymbol import check_and_extract, match_and_extract, extract_matches
+
+
+@pytest.fixture(scope='module')
+def matcher(placesymbol_code_path):
+    return SymbolMatcher.from_csv(placesymbol_code_path)
+
+
+def _names(matcher):
+    symbols = matcher.symbols
+    rng = np.random.default_rng(0)
+    names, _ = generate_names(rng, 1500, symbols, FILLER_WORDS, match_rate=0.6, suffix_rate=0.4)
+    # Symbols that are prefixes of other symbols start at the same offset, the rank decides between them
+    prefixes = [(a, b) for a in symbols if len(a) == 1 for b in symbols if b != a and b.startswith(a)]
+    names += [b + '路' for _, b in prefixes] + ['老' + b + a for a, b in prefixes]
+    names += [
+        '星巴克咖啡', '', '()', '((北京))', '(北京)', '超市(上海店)', '(天津)超市', '南京(西湖(店)', '杭州)店(',
+        '上海南京路', '南京上海路', '中国银行北京分行', '吉林大学', '吉大', '延边朝鲜族自治州', '北京(朝阳)上海',
+    ]
+    return names
+
+
+def _same(left, right):
+    # placecodes may be NaN for aliases without a city
+    assert (left is None) == (right is None)
+    if left is not None:
+        assert left[:4] == right[:4]
+        assert left[4] == right[4] or (pd.isna(left[4]) and pd.isna(right[4]))
+
+
+def test_match_and_extract_equals_check_and_extract(matcher):
+    placesymbol_dict = matcher.placesymbol_dict
+    names = _names(matcher)
+    n_matched = 0
+    for i, name in enumerate(names):
+        row = pd.Series({'name': name, '_id': f'B0{i:08X}', 'adcode': 110101})
+        expected = check_and_extract(row, placesymbol_dict)
+        _same(match_and_extract(row, matcher), expected)
+        n_matched += expected is not None
+    # The names cover both outcomes
+    assert 0 < n_matched < len(names)
+
+
+def test_find_first_equals_brute_force(matcher):
+    for name in _names(matcher):
+        expected = check_and_extract(pd.Series({'name': name, '_id': 'x', 'adcode': 0}), matcher.placesymbol_dict)
+        name_modified = re.sub(r'\([^)]*\)', '', name)
+        found = matcher.find_first(name_modified)
+        if expected is None:
+            assert found is None
+            assert matcher.first_rank(name_modified) == -1
+        else:
+            symbol = expected[3]
+            assert found == (name_modified.find(symbol), symbol)
+            assert matcher.symbols[matcher.first_rank(name_modified)] == symbol
+
+
+@pytest.mark.parametrize('placesymbol_dict, symbol', [
+    ({'吉林': 220000, '吉': 220001}, '吉林'),
+    ({'吉': 220001, '吉林': 220000}, '吉'),
+    ({'林': 1, '吉林': 220000, '吉': 220001}, '吉林'),
+])
+def test_same_offset_rank_tie_break(placesymbol_dict, symbol):
+    row = pd.Series({'name': '吉林市(长春店)', '_id': 'x', 'adcode': 220102})
+    assert check_and_extract(row, placesymbol_dict)[3] == symbol
+    assert match_and_extract(row, SymbolMatcher(placesymbol_dict))[3] == symbol
+    assert SymbolMatcher(placesymbol_dict).find_first('吉林市') == (0, symbol)
+
+
+def test_extract_matches_equals_row_wise(matcher):
+    names = _names(matcher)
+    data = pd.DataFrame({'name': names, '_id': [f'B0{i:08X}' for i in range(len(names))], 'adcode': 110101})
+    rows = [match_and_extract(row, matcher) for _, row in data.iterrows()]
+    expected = [row for row in rows if row is not None and not pd.isna(row[4])]
+    results = extract_matches(data, matcher)
+    assert list(results['name']) == [row[0] for row in expected]
+    assert list(results['placesymbol'].astype(str)) == [row[3] for row in expected]
+    assert list(results['placecode']) == [int(row[4]) for row in expected]
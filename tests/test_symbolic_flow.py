@@ -0,0 +1,115 @@
+"""
+Function:
+                SymbolicFlow.build_od_matrix 在同一次扫描中累计 FlowCube：FlowCube 汇总后与城市×城市矩阵相同，
+                使用 manifest 时缓存的 (placecode, adcode, placesymbol) 部分计数给出相同的 FlowCube，且不再读取文件；
+                累计与不累计 FlowCube 的运行使用不同的 manifest 交替运行时互不使对方的缓存失效
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import SymbolicFlow
+from SymbolicFlow import build_od_matrix
+from FlowBuilder import CityIndex, FlowCube
+from conftest import REPO_DIR
+
+
+@pytest.fixture(scope='module')
+def provincial_adcodes():
+    return pd.read_csv(os.path.join(REPO_DIR, 'provincialcounties.csv'))['adcode']
+
+
+@pytest.fixture(scope='module')
+def df_symbols(placesymbol_code_path):
+    return pd.read_csv(placesymbol_code_path)
+
+
+@pytest.fixture(scope='module')
+def shards(tmp_path_factory, df_symbols, provincial_adcodes):
+    """
+        Extraction shards of random POIs, a quarter of them local and a few in provincial counties.
+    """
+    rng = np.random.default_rng(0)
+    adcodes = pd.read_csv(os.path.join(REPO_DIR, 'AMap_adcode.csv'))['adcode'].to_numpy()
+    adcodes = np.concatenate([adcodes[adcodes % 100 != 0], provincial_adcodes.to_numpy()])
+    shard_dir = tmp_path_factory.mktemp('extractresult')
+    paths = []
+    for shard in range(3):
+        picks = rng.integers(0, len(df_symbols), 20000)
+        adcode = adcodes[rng.integers(0, len(adcodes), len(picks))]
+        placecode = df_symbols['placecode'].to_numpy()[picks]
+        local = rng.random(len(picks)) < 0.25
+        adcode[local] = placecode[local] + 1
+        df = pd.DataFrame({'name': 'x', '_id': np.arange(len(picks)), 'adcode': adcode,
+                           'placesymbol': df_symbols['placesymbol'].to_numpy()[picks], 'placecode': placecode})
+        path = str(shard_dir / f'output_poi_{shard}_1.csv')
+        df.to_csv(path, index=False)
+        paths.append(path)
+    return paths
+
+
+def _counts(od_matrix):
+    return [od_matrix.to_od_counts(**options) for options in
+            [dict(), dict(drop_local=False), dict(local_only=True)]]
+
+
+def test_cube_from_the_same_scan(shards, df_symbols, provincial_adcodes):
+    expected = _counts(build_od_matrix(shards, provincial_adcodes))
+    cube = FlowCube(CityIndex(provincial_adcodes), df_symbols)
+    od_matrix = build_od_matrix(shards, provincial_adcodes, cube=cube)
+    assert od_matrix.city_index is cube.city_index
+    for counts, cube_counts, expected_counts in zip(_counts(od_matrix), _counts(cube.to_od_matrix()), expected):
+        pd.testing.assert_frame_equal(counts, expected_counts)
+        pd.testing.assert_frame_equal(cube_counts, expected_counts)
+    assert cube.to_frame()['count'].sum() == expected[0]['count'].sum()
+
+
+def test_cube_from_cached_counts(shards, df_symbols, provincial_adcodes, tmp_path, monkeypatch):
+    manifest_path = str(tmp_path / 'flow_manifest.json')
+    first = FlowCube(CityIndex(provincial_adcodes), df_symbols)
+    build_od_matrix(shards, provincial_adcodes, manifest_path=manifest_path, cube=first)
+
+    reads = []
+    read_table = SymbolicFlow.read_table
+    monkeypatch.setattr(SymbolicFlow, 'read_table', lambda *args, **kwargs: reads.append(args) or read_table(*args, **kwargs))
+    second = FlowCube(CityIndex(provincial_adcodes), df_symbols)
+    od_matrix = build_od_matrix(shards, provincial_adcodes, manifest_path=manifest_path, cube=second)
+    assert reads == []
+    pd.testing.assert_frame_equal(second.to_frame(drop_local=False), first.to_frame(drop_local=False))
+    for counts, cube_counts in zip(_counts(od_matrix), _counts(second.to_od_matrix())):
+        pd.testing.assert_frame_equal(counts, cube_counts)
+
+    # The cached counts of a run without cube have no placesymbol, so the files are read again
+    build_od_matrix(shards, provincial_adcodes, manifest_path=manifest_path)
+    assert len(reads) == len(shards)
+
+
+def test_alternating_runs_keep_their_caches(shards, df_symbols, provincial_adcodes, tmp_path, monkeypatch):
+    reads = []
+    read_table = SymbolicFlow.read_table
+    monkeypatch.setattr(SymbolicFlow, 'read_table', lambda *args, **kwargs: reads.append(args) or read_table(*args, **kwargs))
+    manifest_path, cube_manifest_path = str(tmp_path / 'flow_manifest.json'), str(tmp_path / 'flow_manifest_by_symbol.json')
+    expected = _counts(build_od_matrix(shards, provincial_adcodes, manifest_path=manifest_path))
+    build_od_matrix(shards, provincial_adcodes, manifest_path=cube_manifest_path,
+                    cube=FlowCube(CityIndex(provincial_adcodes), df_symbols))
+    assert len(reads) == 2 * len(shards)
+
+    # Both caches survive the other kind of run
+    cube = FlowCube(CityIndex(provincial_adcodes), df_symbols)
+    for counts in [_counts(build_od_matrix(shards, provincial_adcodes, manifest_path=manifest_path)),
+                   _counts(build_od_matrix(shards, provincial_adcodes, manifest_path=cube_manifest_path, cube=cube)),
+                   _counts(cube.to_od_matrix())]:
+        for result, expected_counts in zip(counts, expected):
+            pd.testing.assert_frame_equal(result, expected_counts)
+    assert len(reads) == 2 * len(shards)
+
+    # Rebuilding one cache from scratch leaves the cached counts of the other alone
+    os.remove(manifest_path)
+    build_od_matrix(shards, provincial_adcodes, manifest_path=manifest_path)
+    cube = FlowCube(CityIndex(provincial_adcodes), df_symbols)
+    build_od_matrix(shards, provincial_adcodes, manifest_path=cube_manifest_path, cube=cube)
+    assert len(reads) == 3 * len(shards)
+    for result, expected_counts in zip(_counts(cube.to_od_matrix()), expected):
+        pd.testing.assert_frame_equal(result, expected_counts)